@@ -0,0 +1,228 @@
+import io
+import json
+
+from flask import Blueprint, Response, request
+
+from wps.encoding import BINARY_MIMETYPE, POINT_FORMATS, PROFILE_FORMATS
+from wps.geodesy import DEFAULT_PRECISION, PRECISIONS
+from wps.metrics import get_logger, stage, timed
+from wps.points import CSV_MIMETYPES, compute_points, parse_points, read_csv_points
+from wps.profile_process import DEFAULT_NUM_POINTS, EMPTY_STATS, compute_profile
+from wps.sampling import METHODS
+from wps.solar_exposure import (
+    DEFAULT_BINS, DEFAULT_BUFFER_M, DEFAULT_IRRADIANCE_POINTS, SolarExposure, solar_params
+)
+from wps.tracks import DEFAULT_SIMPLIFY_METHOD, GPX_MIMETYPES, SIMPLIFY_METHODS, STREAM_MIN_BYTES, read_track
+
+# Routes REST : GeoJSON en entrée, sans enveloppe XML ni validation PyWPS
+api = Blueprint('api', __name__, url_prefix='/api')
+
+JSON_MIMETYPE = 'application/json'
+# Précision des tableaux du format binaire (?dtype=)
+DTYPES = {'float64': '<f8', 'float32': '<f4'}
+
+_solar = None
+
+log = get_logger("api")
+
+
+class ApiError(Exception):
+    """Requête invalide (400)"""
+
+
+def _json(document, status=200):
+    return Response(json.dumps(document), status=status, mimetype=JSON_MIMETYPE)
+
+
+def _geometry():
+    """LineString GeoJSON du corps de la requête (géométrie ou Feature)
+
+    Une trace GPX, ou un GeoJSON volumineux, est lue en flux sans charger le document entier ;
+    les mêmes vérifications s'appliquent quelle que soit la taille du corps.
+    """
+    if request.mimetype in GPX_MIMETYPES:
+        try:
+            geom_json = read_track(request.stream, request.mimetype)
+        except Exception as e:
+            raise ApiError(f"Trace invalide : {e}")
+    else:
+        if (request.content_length or 0) > STREAM_MIN_BYTES:
+            try:
+                geom_json = read_track(request.stream)
+            except Exception as e:
+                raise ApiError(f"Corps de requête GeoJSON invalide : {e}")
+        else:
+            try:
+                geom_json = json.loads(request.get_data())
+            except Exception:
+                raise ApiError("Corps de requête GeoJSON invalide")
+    if not isinstance(geom_json, dict):
+        raise ApiError("Géométrie GeoJSON attendue")
+    if geom_json.get("type") == "Feature":
+        geom_json = geom_json.get("geometry") or {}
+    if "coordinates" not in geom_json:
+        raise ApiError("Géométrie GeoJSON attendue")
+    if geom_json.get("type") != "LineString":
+        raise ApiError(f"LineString attendue, {geom_json.get('type')} reçue")
+    return geom_json
+
+
+def _arg(name, default, cast):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        raise ApiError(f"Paramètre invalide : {name}={value}")
+
+
+def _boolean(value):
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if value.lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(value)
+
+
+def _binary_requested():
+    """Négociation Accept : JSON par défaut, binaire compact si préféré par le client"""
+    best = request.accept_mimetypes.best_match([JSON_MIMETYPE, BINARY_MIMETYPE], default=JSON_MIMETYPE)
+    return best == BINARY_MIMETYPE
+
+
+@api.errorhandler(ApiError)
+def bad_request(e):
+    return _json({"error": str(e)}, 400)
+
+
+@api.route('/profile', methods=['POST'])
+def profile():
+    """Profil topographique d'une LineString (paramètres num_points, method, lod, format, dtype, precision, clip,
+    simplify_m, simplify_method dans l'URL)"""
+    with timed('profil_topo') as timer:
+        return _profile(timer)
+
+
+def _profile(timer):
+    with stage("parse"):
+        geom_json = _geometry()
+    num_points = _arg('num_points', DEFAULT_NUM_POINTS, int)
+    method = _arg('method', 'nearest', str)
+    lod = _arg('lod', True, _boolean)
+    output_format = _arg('format', 'rows', str)
+    dtype = _arg('dtype', 'float64', str)
+    precision = _arg('precision', DEFAULT_PRECISION, str)
+    clip = _arg('clip', False, _boolean)
+    simplify_m = _arg('simplify_m', 0.0, float)
+    simplify_method = _arg('simplify_method', DEFAULT_SIMPLIFY_METHOD, str)
+    if method not in METHODS:
+        raise ApiError(f"Méthode inconnue : {method} (attendu : {', '.join(METHODS)})")
+    if output_format not in PROFILE_FORMATS:
+        raise ApiError(f"Format inconnu : {output_format} (attendu : {', '.join(PROFILE_FORMATS)})")
+    if dtype not in DTYPES:
+        raise ApiError(f"dtype inconnu : {dtype} (attendu : {', '.join(DTYPES)})")
+    if precision not in PRECISIONS:
+        raise ApiError(f"Précision inconnue : {precision} (attendu : {', '.join(PRECISIONS)})")
+    if simplify_method not in SIMPLIFY_METHODS:
+        raise ApiError(f"Méthode de simplification inconnue : {simplify_method} "
+                       f"(attendu : {', '.join(SIMPLIFY_METHODS)})")
+
+    # Le binaire est encodé directement à partir des colonnes calculées (pas de passage par JSON)
+    binary = _binary_requested()
+    try:
+        data = compute_profile(geom_json, num_points, method, lod, output_format, precision, clip,
+                               simplify_m, simplify_method, DTYPES[dtype] if binary else None)
+    except Exception as e:
+        timer.outcome = "error"
+        log.debug("échec du profil REST : %s", e)
+        return _json({"error": str(e), "profile": [], "stats": dict(EMPTY_STATS)}, 422)
+    return Response(data, mimetype=BINARY_MIMETYPE if binary else JSON_MIMETYPE)
+
+
+@api.route('/solar', methods=['POST'])
+def solar():
+    """Exposition solaire d'une LineString (mêmes paramètres que le processus solar_exposure)"""
+    with timed('solar_exposure') as timer:
+        return _solar_exposure(timer)
+
+
+def _solar_exposure(timer):
+    global _solar
+    with stage("parse"):
+        geom_json = _geometry()
+    try:
+        params = solar_params(
+            _arg('bins', DEFAULT_BINS, int),
+            _arg('buffer_m', DEFAULT_BUFFER_M, float),
+            _arg('mode', 'orientation', str),
+            _arg('start_date', None, str),
+            _arg('end_date', None, str),
+            _arg('time_step_hours', 1.0, float),
+            _arg('day_step', 1, int),
+            _arg('num_points', DEFAULT_IRRADIANCE_POINTS, int),
+            _arg('simplify_m', 0.0, float),
+            _arg('simplify_method', DEFAULT_SIMPLIFY_METHOD, str)
+        )
+    except ApiError:
+        raise
+    except Exception as e:
+        raise ApiError(str(e))
+
+    if _solar is None:
+        _solar = SolarExposure()
+    binary = _binary_requested()
+    try:
+        data = _solar.compute(geom_json, params, binary)
+    except Exception as e:
+        timer.outcome = "error"
+        log.debug("échec de l'exposition REST : %s", e)
+        return _json({"error": str(e), "dominant_orientation": "Erreur", "sun_exposed_pct": 0,
+                      "score": 0, "histogram": [{"orientation": "Erreur", "pct": 0}]}, 422)
+    # `data` est déjà sérialisé (éventuellement issu du cache) : renvoyé tel quel
+    return Response(data, mimetype=BINARY_MIMETYPE if binary else JSON_MIMETYPE)
+
+
+@api.route('/elevation', methods=['POST'])
+def elevation():
+    """Altitudes de points (MultiPoint, Feature(Collection) GeoJSON ou CSV ; paramètres method, format, dtype)"""
+    with timed('point_elevation') as timer:
+        return _elevation(timer)
+
+
+def _elevation(timer):
+    with stage("parse"):
+        if request.mimetype in CSV_MIMETYPES:
+            try:
+                ids, xs, ys = read_csv_points(io.TextIOWrapper(request.stream, encoding="utf-8-sig"))
+            except UnicodeDecodeError:
+                raise ApiError("CSV invalide : encodage UTF-8 attendu")
+            except Exception as e:
+                raise ApiError(str(e))
+        else:
+            try:
+                geom_json = json.loads(request.get_data())
+            except ValueError:
+                raise ApiError("Corps de requête GeoJSON invalide")
+            try:
+                ids, xs, ys = parse_points(geom_json)
+            except Exception as e:
+                raise ApiError(str(e))
+    method = _arg('method', 'nearest', str)
+    output_format = _arg('format', 'rows', str)
+    dtype = _arg('dtype', 'float64', str)
+    if method not in METHODS:
+        raise ApiError(f"Méthode inconnue : {method} (attendu : {', '.join(METHODS)})")
+    if output_format not in POINT_FORMATS:
+        raise ApiError(f"Format inconnu : {output_format} (attendu : {', '.join(POINT_FORMATS)})")
+    if dtype not in DTYPES:
+        raise ApiError(f"dtype inconnu : {dtype} (attendu : {', '.join(DTYPES)})")
+
+    binary = _binary_requested()
+    try:
+        data = compute_points(ids, xs, ys, method, output_format, DTYPES[dtype] if binary else None)
+    except Exception as e:
+        timer.outcome = "error"
+        log.debug("échec des altitudes REST : %s", e)
+        return _json({"error": str(e), "points": [], "stats": {}}, 422)
+    return Response(data, mimetype=BINARY_MIMETYPE if binary else JSON_MIMETYPE)
@@ -1,70 +1,74 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from pywps import Service
 import os
 import sys
-from osgeo import gdal
 
 sys.path.insert(0, os.path.dirname(__file__))
 
-LOCAL_FILE_PATH = "finale_optimized.tif"
+from wps.metadata import validate, validation_status
+from wps.metrics import configure_logging, get_logger
+
+LOCAL_FILE_PATH = os.environ.get("DEM_PATH", "finale_optimized.tif")
+
+# Journaux structurés (LOG_LEVEL, LOG_FORMAT) dès le démarrage : détail par requête au niveau DEBUG
+configure_logging()
+log = get_logger("app")
 
 def verify_tiff():
-    """Vérifie que le TIFF est valide au démarrage"""
+    """Vérifie que le TIFF est valide au démarrage (métadonnées en cache si inchangé)"""
     if not os.path.exists(LOCAL_FILE_PATH):
-        print(f"❌ ERREUR FATALE : {LOCAL_FILE_PATH} introuvable")
+        log.critical("MNT introuvable", extra={"fields": {"path": LOCAL_FILE_PATH}})
         sys.exit(1)
     
     file_size = os.path.getsize(LOCAL_FILE_PATH)
-    print(f"📁 Fichier trouvé : {LOCAL_FILE_PATH} ({file_size / (1024*1024):.2f} MB)")
+    log.info("vérification du MNT", extra={"fields": {
+        "path": LOCAL_FILE_PATH, "size_mb": round(file_size / (1024 * 1024), 2)}})
     
     try:
-        print("🔍 Vérification GDAL...")
-        ds = gdal.Open(LOCAL_FILE_PATH, gdal.GA_ReadOnly)
-        
-        if ds is None:
-            raise Exception("GDAL ne peut pas ouvrir le fichier")
-        
-        band = ds.GetRasterBand(1)
-        stats = band.ComputeStatistics(False)
-        
-        print(f"✅ TIFF valide :")
-        print(f"   - Dimensions : {ds.RasterXSize} x {ds.RasterYSize}")
-        print(f"   - Altitude min/max : {stats[0]:.1f} / {stats[1]:.1f} m")
-        
-        ds = None
+        # En mode lazy, la validation continue en arrière-plan ("warming" dans /health)
+        validate(LOCAL_FILE_PATH)
         return True
         
     except Exception as e:
-        print(f"❌ ERREUR FATALE : {e}")
-        import traceback
-        traceback.print_exc()
+        log.critical("MNT invalide : %s", e, exc_info=True, extra={"fields": {"path": LOCAL_FILE_PATH}})
         sys.exit(1)
 
 # Créer les dossiers PyWPS
 os.makedirs('/tmp/pywps', exist_ok=True)
 os.makedirs('/tmp/outputs', exist_ok=True)
-print("✓ Dossiers PyWPS créés")
+log.info("dossiers PyWPS créés", extra={"fields": {"workdir": "/tmp/pywps", "outputdir": "/tmp/outputs"}})
 
 # Vérifier le TIFF au démarrage
-print("\n" + "="*60)
-print("  VÉRIFICATION DU FICHIER TIFF")
-print("="*60)
 verify_tiff()
-print("="*60 + "\n")
 
 from wps.profile_process import ProfilTopo
 from wps.solar_exposure import SolarExposure
+from wps.batch_profile import ProfilTopoBatch
+from wps.zonal_stats import ZonalStats
+from wps.points import PointElevation
+from wps.dem import get_dem_manager
+from wps.cache import get_result_cache
+from wps.irradiance import sun_table
+from wps.jobs import get_job_pool
+from wps.tiles import get_tile_cache
+from wps.encoding import compress_response
+from wps.metrics import get_metrics
+from routes import routes
+from api import api
 
 app = Flask(__name__, static_folder='Web', static_url_path='')
+app.register_blueprint(routes)
+app.register_blueprint(api)
 
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
-    return response
+    response.headers.add('Access-Control-Allow-Methods', 'GET,POST,DELETE,OPTIONS')
+    # gzip/deflate si le client l'accepte (profils haute résolution : JSON très répétitif)
+    return compress_response(response, request.accept_encodings)
 
-processes = [ProfilTopo(), SolarExposure()]
+processes = [ProfilTopo(), SolarExposure(), ProfilTopoBatch(), ZonalStats(), PointElevation()]
 service = Service(processes, ['pywps.cfg'])
 
 @app.route('/')
@@ -81,24 +85,31 @@ def wps():
 def health():
     file_exists = os.path.exists(LOCAL_FILE_PATH)
     file_size = os.path.getsize(LOCAL_FILE_PATH) if file_exists else 0
+    validation = validation_status()
     return jsonify({
-        "status": "ok",
+        "status": validation["status"],
+        "validation_error": validation["error"],
         "tiff_file_exists": file_exists,
-        "tiff_file_size_mb": round(file_size / (1024*1024), 2)
+        "tiff_file_size_mb": round(file_size / (1024*1024), 2),
+        "dem_pool": get_dem_manager().stats(),
+        "result_cache": get_result_cache().stats(),
+        "sun_tables": sun_table.cache_info()._asdict(),
+        "tile_cache": get_tile_cache().stats(),
+        "jobs": get_job_pool().stats()
+    }), 503 if validation["status"] == "error" else 200
+
+@app.route('/metrics')
+def metrics():
+    """Métriques Prometheus du worker : latences par processus et par étape, lectures raster, caches"""
+    text = get_metrics().render({
+        "dem_pool": get_dem_manager().stats(),
+        "result_cache": get_result_cache().stats(),
+        "sun_tables": sun_table.cache_info()._asdict(),
+        "tile_cache": get_tile_cache().stats(),
+        "jobs": get_job_pool().stats()
     })
+    return Response(text, mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
-```
-
-### **3️⃣ Vérifier requirements.txt**
-
-Vérifiez que `requirements.txt` contient bien :
-```
-Flask==3.0.0
-gunicorn==21.2.0
-pywps==4.5.2
-rasterio==1.3.9
-shapely==2.0.2
-numpy==1.26.2
\ No newline at end of file
@@ -0,0 +1,179 @@
+import json
+import math
+import os
+import time
+
+import numpy as np
+from shapely.geometry import LineString, Point
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+# Dégradation tolérée par rapport à la référence avant échec (0.30 = +30 %)
+DEFAULT_TOLERANCE = float(os.environ.get("BENCH_TOLERANCE", "0.30"))
+# Nombre minimal de mesures d'une série pour qu'elle soit comparée à la référence
+MIN_REPEAT = int(os.environ.get("BENCH_MIN_REPEAT", "5"))
+# Écart absolu de médiane (ms) en deçà duquel une dégradation est attribuée au bruit de mesure
+MIN_DELTA_MS = float(os.environ.get("BENCH_MIN_DELTA_MS", "0.5"))
+# Nouvelles mesures d'une série suspecte avant de conclure à une régression
+CONFIRM_RUNS = int(os.environ.get("BENCH_CONFIRM", "2"))
+# Nom du résultat de l'étalon mesuré pendant l'exécution
+CALIBRATION = "calibration"
+KM_PER_DEGREE = 111.32
+
+
+def percentile(values, pct):
+    """Percentile au rang le plus proche (même définition que les statistiques des tâches)"""
+    ordered = sorted(values)
+    return ordered[max(0, -(-pct * len(ordered) // 100) - 1)]
+
+
+def summarize(latencies, elapsed):
+    """Débit et latences (ms) d'une série de mesures (secondes)"""
+    return {
+        "n": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def measure(fn, repeat, warmup=5, rounds=3):
+    """Exécute `fn` `repeat` fois par série (après `warmup` appels à blanc) et résume les durées
+
+    Seule la série de médiane la plus basse est retenue : les interférences de la machine
+    (autres processus, fréquence CPU) ne font qu'allonger les mesures.
+    """
+    for _ in range(warmup):
+        fn()
+    best = None
+    for _ in range(rounds):
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            t = time.perf_counter()
+            fn()
+            latencies.append(time.perf_counter() - t)
+        summary = summarize(latencies, time.perf_counter() - start)
+        if best is None or summary["p50_ms"] < best["p50_ms"]:
+            best = summary
+    return best
+
+
+def calibrate(repeat=30):
+    """Étalon de la machine : charge fixe numpy + Python, mesurée juste avant et après chaque groupe
+
+    Les résultats sont comparés à la référence en multiples de cet étalon, pour que la fréquence
+    CPU ou la charge de la machine au moment de la mesure ne passent pas pour des régressions.
+    """
+    data = np.random.default_rng(0).random(200_000)
+
+    def run():
+        np.sort(data)
+        np.cumsum(np.hypot(data, data[::-1]))
+        sum(i * i for i in range(20_000))
+
+    return measure(run, repeat)
+
+
+def _significant(value, digits=4):
+    return float(f"{value:.{digits}g}")
+
+
+def normalize(results, calibration):
+    """Ajoute à chaque résultat ses latences et son débit relatifs à l'étalon (et la valeur de celui-ci)"""
+    unit = calibration["p50_ms"]
+    for r in results.values():
+        r["unit_ms"] = unit
+        r["p50_rel"] = _significant(r["p50_ms"] / unit)
+        r["p95_rel"] = _significant(r["p95_ms"] / unit)
+        if r.get("throughput_rps"):
+            r["throughput_rel"] = _significant(r["throughput_rps"] * unit / 1000)
+    return results
+
+
+def best_of(current, other):
+    """Meilleure des deux mesures d'une même série, métrique par métrique (le bruit ne fait que ralentir)"""
+    merged = dict(current)
+    if "p50_rel" in current and "p50_rel" in other and other["p50_rel"] < current["p50_rel"]:
+        merged["unit_ms"] = other["unit_ms"]
+    for key in ("p50_ms", "p95_ms", "p99_ms", "p50_rel", "p95_rel"):
+        if key in current and key in other:
+            merged[key] = min(current[key], other[key])
+    for key in ("throughput_rps", "throughput_rel"):
+        if current.get(key) and other.get(key):
+            merged[key] = max(current[key], other[key])
+    if "errors" in current or "errors" in other:
+        merged["errors"] = max(current.get("errors", 0), other.get("errors", 0))
+    return merged
+
+
+def random_lines(region, count, length_km, vertices, seed=0):
+    """Lignes brisées aléatoires de longueur et de nombre de sommets donnés, contenues dans la région"""
+    rng = np.random.default_rng(seed)
+    minx, miny, maxx, maxy = region.bounds
+    step = length_km / KM_PER_DEGREE / max(1, vertices - 1)
+    lines = []
+    while len(lines) < count:
+        start = Point(rng.uniform(minx, maxx), rng.uniform(miny, maxy))
+        if not region.contains(start):
+            continue
+        # Marche aléatoire à cap lentement variable
+        heading = rng.uniform(0, 2 * math.pi) + np.cumsum(rng.normal(0, 0.3, vertices - 1))
+        xs = start.x + np.concatenate(([0.0], np.cumsum(step * np.cos(heading) / math.cos(math.radians(start.y)))))
+        ys = start.y + np.concatenate(([0.0], np.cumsum(step * np.sin(heading))))
+        line = LineString(np.column_stack([xs, ys]))
+        if region.contains(line):
+            lines.append(line)
+    return lines
+
+
+def load_baselines(path=BASELINES_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baselines(results, path=BASELINES_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baselines, tolerance=DEFAULT_TOLERANCE, min_repeat=MIN_REPEAT, min_delta_ms=MIN_DELTA_MS):
+    """Régressions (nom, message), en multiples de l'étalon : p50 au-delà de la référence (+ tolérance),
+    p95 au-delà du double de la tolérance (queue plus bruitée), débit des tests de charge en deçà
+
+    Ne sont pas comparées : les séries de moins de `min_repeat` mesures, les références sans valeurs
+    relatives (ancien format, à régénérer) et les dégradations de moins de `min_delta_ms`.
+    """
+    regressions = []
+    for name, current in results.items():
+        reference = baselines.get(name)
+        if not reference or name == CALIBRATION or "p50_rel" not in reference:
+            continue
+        if min(current["n"], reference["n"]) < min_repeat:
+            continue
+        for metric, factor in (("p50", 1 + tolerance), ("p95", 1 + 2 * tolerance)):
+            rel, ref = current[f"{metric}_rel"], reference[f"{metric}_rel"]
+            if rel > ref * factor and (rel - ref) * current["unit_ms"] > min_delta_ms:
+                regressions.append((name, f"{name} : {metric} {rel} étalons (référence {ref}), "
+                                          f"{current[f'{metric}_ms']} ms"))
+        if (name.startswith("load/") and current.get("throughput_rel") and reference.get("throughput_rel")
+                and current["throughput_rel"] < reference["throughput_rel"] / (1 + tolerance)):
+            regressions.append((name, f"{name} : débit {current['throughput_rel']} par étalon "
+                                      f"(référence {reference['throughput_rel']}), {current['throughput_rps']} req/s"))
+    return regressions
+
+
+def report(results, baselines=None):
+    """Tableau des résultats, avec l'écart de p50 à la référence (en multiples de l'étalon)"""
+    baselines = baselines or {}
+    width = max(len(name) for name in results)
+    print(f"{'benchmark':<{width}}  {'n':>5}  {'req/s':>9}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'Δp50':>7}")
+    for name, r in results.items():
+        reference = baselines.get(name)
+        delta = f"{(r['p50_rel'] / reference['p50_rel'] - 1) * 100:+.0f}%" \
+            if reference and "p50_rel" in reference and name != CALIBRATION else "-"
+        print(f"{name:<{width}}  {r['n']:>5}  {r['throughput_rps'] or 0:>9.1f}  {r['p50_ms']:>9.2f}  "
+              f"{r['p95_ms']:>9.2f}  {r['p99_ms']:>9.2f}  {delta:>7}")
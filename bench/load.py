@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+
+from shapely.geometry import mapping
+
+from bench.common import random_lines, summarize
+
+EXECUTE_TEMPLATE = """<wps:Execute service="WPS" version="1.0.0" xmlns:wps="http://www.opengis.net/wps/1.0.0" xmlns:ows="http://www.opengis.net/ows/1.1">
+<ows:Identifier>{identifier}</ows:Identifier>
+<wps:DataInputs>
+<wps:Input><ows:Identifier>line</ows:Identifier><wps:Data><wps:ComplexData mimeType="application/vnd.geo+json"><![CDATA[{line}]]></wps:ComplexData></wps:Data></wps:Input>
+{literals}
+</wps:DataInputs>
+<wps:ResponseForm><wps:RawDataOutput mimeType="application/json"><ows:Identifier>{output}</ows:Identifier></wps:RawDataOutput></wps:ResponseForm>
+</wps:Execute>"""
+
+LITERAL_TEMPLATE = ("<wps:Input><ows:Identifier>{name}</ows:Identifier>"
+                    "<wps:Data><wps:LiteralData>{value}</wps:LiteralData></wps:Data></wps:Input>")
+
+# Processus sollicités par le test de charge : (identifiant, sortie, entrées littérales)
+SCENARIOS = {
+    "profil_topo": ("profile", {"num_points": 200, "method": "bilinear"}),
+    "solar_exposure": ("result", {}),
+}
+
+
+def execute_document(identifier, line, literals=None):
+    output, defaults = SCENARIOS[identifier]
+    literals = dict(defaults, **(literals or {}))
+    return EXECUTE_TEMPLATE.format(
+        identifier=identifier,
+        line=json.dumps(mapping(line)),
+        literals="".join(LITERAL_TEMPLATE.format(name=k, value=v) for k, v in literals.items()),
+        output=output,
+    )
+
+
+def run_load(app, region, identifier="profil_topo", concurrency=8, requests=200, length_km=30, vertices=5,
+             seed=0):
+    """Envoie `requests` Execute sur /wps depuis `concurrency` threads (application Flask en processus)
+
+    Chaque requête porte une ligne différente : le cache de résultats n'intervient pas.
+    """
+    documents = [execute_document(identifier, line)
+                 for line in random_lines(region, requests, length_km, vertices, seed)]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    cursor = iter(range(requests))
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                i = next(cursor, None)
+            if i is None:
+                return
+            t = time.perf_counter()
+            response = client.post("/wps", data=documents[i], content_type="text/xml")
+            elapsed = time.perf_counter() - t
+            body = response.get_data()
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code != 200 or b'"error"' in body or b"ExceptionReport" in body:
+                    errors.append(body[:200])
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, time.perf_counter() - start)
+    result["errors"] = len(errors)
+    if errors:
+        print(f"⚠️ {len(errors)} requête(s) en erreur, par exemple : {errors[0]!r}")
+    return result
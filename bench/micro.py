@@ -0,0 +1,96 @@
+import json
+from types import SimpleNamespace
+
+from shapely.geometry import mapping
+
+from bench.common import measure, random_lines
+
+# (longueur en km, nombre de sommets) des lignes mesurées
+PROFILE_CASES = [(2, 2), (20, 10), (100, 50), (100, 1000)]
+PROFILE_POINTS = [100, 0]
+ORIENTATION_VERTICES = [10, 100, 1000, 10000, 200000]
+# Traces GPS denses simplifiées (nombre de sommets, tolérance en m)
+SIMPLIFY_CASES = [(200000, 10)]
+# Nombre de points dispersés dans la région (altitudes ponctuelles)
+POINT_COUNTS = [1000, 100000]
+
+
+def _literal(value):
+    return [SimpleNamespace(data=value, data_format=None)]
+
+
+def _request(**inputs):
+    """Requête minimale pour appeler un handler hors PyWPS (entrées déjà décodées)"""
+    return SimpleNamespace(inputs={k: _literal(v) for k, v in inputs.items()})
+
+
+def bench_profile(region, repeat=30, seed=0):
+    """ProfilTopo._handler par longueur de ligne, nombre de sommets et densité d'échantillonnage"""
+    from wps.profile_process import ProfilTopo
+
+    process = ProfilTopo()
+    results = {}
+    for length_km, vertices in PROFILE_CASES:
+        lines = [json.dumps(mapping(line)) for line in random_lines(region, repeat, length_km, vertices, seed)]
+        for num_points in PROFILE_POINTS:
+            state = {"i": 0}
+
+            def run():
+                # Une ligne différente à chaque appel : pas de résultat en cache, fenêtres variées
+                line = lines[state["i"] % len(lines)]
+                state["i"] += 1
+                response = SimpleNamespace(outputs={"profile": SimpleNamespace(data=None)})
+                process._handler(_request(line=line, num_points=num_points), response)
+                if "error" in json.loads(response.outputs["profile"].data):
+                    raise Exception(json.loads(response.outputs["profile"].data)["error"])
+
+            label = "natif" if num_points == 0 else num_points
+            results[f"profile/{length_km}km/{vertices}v/{label}pts"] = measure(run, repeat)
+    return results
+
+
+def bench_orientation(region, repeat=50, seed=0):
+    """SolarExposure.calculate_orientation par nombre de sommets"""
+    from wps.solar_exposure import SolarExposure
+
+    process = SolarExposure()
+    results = {}
+    for vertices in ORIENTATION_VERTICES:
+        coords = list(random_lines(region, 1, 50, vertices, seed)[0].coords)
+        results[f"orientation/{vertices}v"] = measure(lambda: process.calculate_orientation(coords), repeat)
+    return results
+
+
+def bench_simplify(region, repeat=5, seed=0):
+    """Simplification d'une trace dense, par méthode (peu de répétitions : traces de 200 000 sommets)"""
+    from wps.tracks import SIMPLIFY_METHODS, simplify_line
+
+    results = {}
+    for vertices, tolerance_m in SIMPLIFY_CASES:
+        line = random_lines(region, 1, 50, vertices, seed)[0]
+        for method in SIMPLIFY_METHODS:
+            results[f"simplify/{method}/{vertices}v"] = measure(
+                lambda: simplify_line(line, tolerance_m, method), min(repeat, 5), warmup=1)
+    return results
+
+
+def bench_points(region, repeat=10, seed=0):
+    """Altitudes de points dispersés (sample_blocks : une lecture par bloc touché), par méthode"""
+    import numpy as np
+
+    from wps.dem import get_dem_manager
+    from wps.sampling import sample_blocks
+
+    rng = np.random.default_rng(seed)
+    left, bottom, right, top = region.bounds
+    results = {}
+    for count in POINT_COUNTS:
+        xs = rng.uniform(left, right, count)
+        ys = rng.uniform(bottom, top, count)
+        for method in ("nearest", "bilinear"):
+            def run():
+                with get_dem_manager().dataset() as src:
+                    sample_blocks(src, xs, ys, method)
+
+            results[f"points/{count}/{method}"] = measure(run, repeat)
+    return results
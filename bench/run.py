@@ -0,0 +1,166 @@
+"""Suite de performance : microbenchmarks et test de charge sur un MNT synthétique
+
+    python -m bench.run                      # MNT synthétique généré dans un dossier temporaire
+    python -m bench.run --dem finale_optimized.tif --suite load
+    python -m bench.run --update-baselines   # enregistre les résultats comme référence
+
+Code de sortie 1 si un résultat régresse au-delà de la référence (bench/baselines.json), les deux
+étant rapportés à un étalon mesuré pendant l'exécution ; une série suspecte est remesurée
+(BENCH_CONFIRM fois) avant d'être déclarée en régression.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare_dem(args):
+    """MNT servi pendant la suite : fourni (--dem) ou synthétique, avec ses rasters de pente/exposition"""
+    if args.dem:
+        return os.path.abspath(args.dem)
+
+    from bench.synthetic_dem import generate
+    from wps.terrain import build_terrain_rasters, terrain_available
+
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "topoanalyse-bench")
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, f"synthetic_{args.width}x{args.height}_t{args.tile}_{args.compress}.tif")
+    if not os.path.exists(path):
+        print(f"⏳ Génération du MNT synthétique : {path}")
+        generate(path, args.width, args.height, tile=args.tile, compress=args.compress)
+    if not terrain_available(path):
+        build_terrain_rasters(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks et test de charge de topoanalyse")
+    parser.add_argument("--suite", choices=["micro", "load", "all"], default="all")
+    parser.add_argument("--dem", help="MNT existant (sinon MNT synthétique)")
+    parser.add_argument("--workdir", help="dossier des MNT synthétiques (réutilisés d'une exécution à l'autre)")
+    parser.add_argument("--width", type=int, default=2600)
+    parser.add_argument("--height", type=int, default=2100)
+    parser.add_argument("--tile", type=int, default=256)
+    parser.add_argument("--compress", default="deflate")
+    parser.add_argument("--repeat", type=int, default=30, help="mesures par série de microbenchmark")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--tolerance", type=float, default=None, help="dégradation tolérée (0.30 = +30 %%)")
+    parser.add_argument("--min-repeat", type=int, default=None,
+                        help="mesures minimales d'une série pour la comparer (défaut : BENCH_MIN_REPEAT)")
+    parser.add_argument("--confirm", type=int, default=None,
+                        help="nouvelles mesures d'une série suspecte (défaut : BENCH_CONFIRM)")
+    parser.add_argument("--baselines", default=None, help="fichier de référence (défaut : bench/baselines.json)")
+    parser.add_argument("--update-baselines", action="store_true")
+    parser.add_argument("--json", help="écrit aussi les résultats dans ce fichier")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    # Avant tout import de l'application : MNT servi, cache de résultats désactivé
+    os.environ["DEM_PATH"] = prepare_dem(args)
+    os.environ["RESULT_CACHE_MB"] = "0"
+    os.environ["RESULT_CACHE_DISK"] = "0"
+    # Journal PyWPS sur fichier : la base SQLite en mémoire par défaut partage une seule connexion
+    # entre threads et échoue sous requêtes concurrentes
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "topoanalyse-bench")
+    os.makedirs(workdir, exist_ok=True)
+    cfg = os.path.join(workdir, "pywps-bench.cfg")
+    with open(cfg, "w", encoding="utf-8") as f:
+        f.write(f"[logging]\ndatabase=sqlite:///{os.path.join(workdir, 'pywps-logs.sqlite')}\n")
+    os.environ["PYWPS_CFG"] = cfg
+
+    from bench.common import (
+        BASELINES_PATH, CALIBRATION, CONFIRM_RUNS, DEFAULT_TOLERANCE, MIN_REPEAT, best_of, calibrate, compare,
+        load_baselines, normalize, report, save_baselines
+    )
+    from wps.coverage import REGION_PATH, load_region
+    from wps.dem import get_dem_manager
+
+    region = load_region(REGION_PATH)
+    if region is None:
+        with get_dem_manager().dataset() as src:
+            from shapely.geometry import box
+            region = box(*src.bounds).buffer(-0.1)
+
+    # Groupes de séries, remesurables séparément
+    groups = []
+    if args.suite in ("micro", "all"):
+        from bench.micro import bench_orientation, bench_points, bench_profile, bench_simplify
+        for bench in (bench_profile, bench_orientation, bench_simplify, bench_points):
+            groups.append(lambda bench=bench: bench(region, args.repeat))
+    if args.suite in ("load", "all"):
+        import app
+        from bench.load import SCENARIOS, run_load
+        for identifier in SCENARIOS:
+            groups.append(lambda identifier=identifier: {f"load/{identifier}/c{args.concurrency}": run_load(
+                app.app, region, identifier, args.concurrency, args.requests)})
+
+    calibrations = []
+
+    def run_group(index):
+        """Séries d'un groupe, rapportées à l'étalon mesuré avant et après (la meilleure des deux mesures)"""
+        before = calibrate(args.repeat)
+        measured = groups[index]()
+        calibration = min(before, calibrate(args.repeat), key=lambda r: r["p50_ms"])
+        calibrations.append(calibration)
+        return normalize(measured, calibration)
+
+    results, owners = {}, {}
+    for index in range(len(groups)):
+        measured = run_group(index)
+        results.update(measured)
+        owners.update(dict.fromkeys(measured, index))
+
+    baselines_path = args.baselines or BASELINES_PATH
+    baselines = load_baselines(baselines_path)
+    tolerance = DEFAULT_TOLERANCE if args.tolerance is None else args.tolerance
+    min_repeat = MIN_REPEAT if args.min_repeat is None else args.min_repeat
+    confirm = CONFIRM_RUNS if args.confirm is None else args.confirm
+
+    # Séries suspectes remesurées : seule la meilleure mesure compte, une régression doit persister.
+    # Les références sont estimées de la même façon : meilleure mesure de 1 + `confirm` passes complètes.
+    for attempt in range(confirm):
+        if args.update_baselines:
+            suspects = set(owners)
+        else:
+            suspects = {name for name, _ in compare(results, baselines, tolerance, min_repeat)}
+        if not suspects:
+            break
+        print(f"🔁 Nouvelle mesure ({attempt + 1}/{confirm})"
+              + ("" if args.update_baselines else f" : {', '.join(sorted(suspects))}"))
+        for index in sorted({owners[name] for name in suspects}):
+            for name, measured in run_group(index).items():
+                results[name] = best_of(results[name], measured)
+    # Étalon rapporté : sa meilleure mesure de l'exécution
+    results[CALIBRATION] = min(calibrations, key=lambda r: r["p50_ms"])
+
+    print()
+    report(results, baselines)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baselines:
+        save_baselines(dict(baselines, **results), baselines_path)
+        print(f"✅ Références enregistrées : {baselines_path}")
+        return 0
+
+    failures = [f"{name} : {r['errors']} erreur(s)" for name, r in results.items() if r.get("errors")]
+    failures += [message for _, message in compare(results, baselines, tolerance, min_repeat)]
+    if failures:
+        print("\n❌ Régressions :")
+        for failure in failures:
+            print(f"   - {failure}")
+        return 1
+    print("\n✅ Aucune régression" if baselines else "\n⚠️ Pas de référence : lancer avec --update-baselines")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
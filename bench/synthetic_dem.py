@@ -0,0 +1,79 @@
+import argparse
+import os
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+from rasterio.windows import Window
+
+# Emprise par défaut : région Drâa-Tafilalet avec une marge (degrés, WGS84)
+DRAA_BOUNDS = (-8.0, 29.2, -2.8, 33.4)
+NODATA = -9999.0
+# Bandes générées par lecture : mémoire bornée quelle que soit la taille du raster
+STRIP_ROWS = 1024
+
+
+def _terrain(lon, lat, seed):
+    """Relief synthétique : chaîne montagneuse orientée SO-NE (Haut Atlas), vallées et bruit"""
+    rng = np.random.default_rng(seed)
+    phases = rng.uniform(0, 2 * np.pi, 6)
+    ridge = 2600.0 * np.exp(-((lat - 0.55 * lon - 35.2) / 0.45) ** 2)
+    hills = (260.0 * np.sin(lon * 7.1 + phases[0]) * np.cos(lat * 6.3 + phases[1])
+             + 120.0 * np.sin(lon * 23.0 + phases[2]) * np.sin(lat * 19.0 + phases[3])
+             + 40.0 * np.sin(lon * 97.0 + phases[4]) * np.cos(lat * 83.0 + phases[5]))
+    plateau = 700.0 + 90.0 * (lat - 29.0)
+    return plateau + ridge + hills
+
+
+def generate(path, width=2600, height=2100, bounds=DRAA_BOUNDS, tile=256, compress="deflate", seed=0,
+             nodata_corner=True, overviews=True):
+    """Écrit un MNT GeoTIFF float32 synthétique (EPSG:4326) couvrant `bounds`
+
+    `tile` = 0 produit un GeoTIFF en bandes ; `compress` = "none" le laisse non compressé.
+    Un coin sans données (NoData) permet d'exercer l'index de couverture.
+    """
+    transform = from_bounds(*bounds, width, height)
+    profile = {
+        "driver": "GTiff", "width": width, "height": height, "count": 1, "dtype": "float32",
+        "crs": "EPSG:4326", "transform": transform, "nodata": NODATA,
+    }
+    if tile:
+        profile.update(tiled=True, blockxsize=tile, blockysize=tile)
+    if compress and compress != "none":
+        profile.update(compress=compress, predictor=3 if compress in ("deflate", "lzw", "zstd") else 1)
+
+    cols = np.arange(width)
+    with rasterio.open(path, "w", **profile) as dst:
+        for row_off in range(0, height, STRIP_ROWS):
+            rows = np.arange(row_off, min(height, row_off + STRIP_ROWS))
+            lon, lat = transform * np.meshgrid(cols + 0.5, rows + 0.5)
+            strip = _terrain(lon, lat, seed).astype("float32")
+            if nodata_corner:
+                strip[(lon > bounds[2] - 0.4) & (lat > bounds[3] - 0.4)] = NODATA
+            dst.write(strip, 1, window=Window(0, row_off, width, len(rows)))
+
+    if overviews:
+        from wps.overviews import build_overviews
+        build_overviews(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère un MNT synthétique sur la région Drâa-Tafilalet")
+    parser.add_argument("path")
+    parser.add_argument("--width", type=int, default=2600)
+    parser.add_argument("--height", type=int, default=2100)
+    parser.add_argument("--tile", type=int, default=256, help="taille des tuiles (0 = bandes)")
+    parser.add_argument("--compress", default="deflate", help="deflate, lzw, zstd ou none")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-overviews", action="store_true")
+    args = parser.parse_args()
+
+    generate(args.path, args.width, args.height, tile=args.tile, compress=args.compress, seed=args.seed,
+             overviews=not args.no_overviews)
+    size = os.path.getsize(args.path) / (1024 * 1024)
+    print(f"✅ MNT synthétique : {args.path} ({args.width}x{args.height}, {size:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
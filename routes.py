@@ -0,0 +1,67 @@
+import os
+
+from flask import Blueprint, Response, jsonify, request, send_from_directory, abort
+from pywps import configuration
+
+from wps.jobs import cancel_marker, get_job_pool
+from wps.metrics import timed
+from wps.tiles import LAYERS, MAX_AGE, MAX_ZOOM, MIN_ZOOM, etag, get_tile_cache, render_tile
+
+routes = Blueprint('routes', __name__)
+
+
+def _outputpath():
+    return configuration.get_config_value('server', 'outputpath') or '/tmp/outputs'
+
+
+@routes.route('/outputs/<path:filename>')
+def outputs(filename):
+    """Documents de statut et sorties des Execute asynchrones"""
+    return send_from_directory(_outputpath(), filename)
+
+
+@routes.route('/jobs')
+def jobs():
+    """File d'attente, tâches en cours et durées des Execute asynchrones de ce worker"""
+    pool = get_job_pool()
+    return jsonify({"stats": pool.stats(), **pool.jobs()})
+
+
+@routes.route('/jobs/<uuid>', methods=['DELETE'])
+def cancel_job(uuid):
+    """Annule une tâche ; si elle appartient à un autre worker, un marqueur est déposé"""
+    if not uuid.replace('-', '').isalnum():
+        abort(400)
+    if get_job_pool().cancel(uuid):
+        return jsonify({"uuid": uuid, "status": "cancelled"})
+    if not os.path.exists(os.path.join(_outputpath(), f"{uuid}.xml")):
+        abort(404)
+    open(cancel_marker(uuid), 'w').close()
+    return jsonify({"uuid": uuid, "status": "cancelling"}), 202
+
+
+@routes.route('/tiles/<layer>/<int:z>/<int:x>/<int:y>.png')
+def tile(layer, z, x, y):
+    """Tuile XYZ (hillshade, slope, elevation) rendue depuis le MNT, servie depuis le cache disque si possible"""
+    if layer not in LAYERS or not MIN_ZOOM <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        abort(404)
+    with timed('tiles') as timer:
+        cache = get_tile_cache()
+        fingerprint = cache.fingerprint()
+        tag = etag(fingerprint, layer, z, x, y)
+        if request.if_none_match.contains(tag):
+            timer.outcome = 'cached'
+            response = Response(status=304)
+        else:
+            path = cache.path(fingerprint, layer, z, x, y)
+            data = cache.get(path)
+            if data is None:
+                data = render_tile(layer, z, x, y)
+                cache.put(path, data)
+            else:
+                timer.outcome = 'cached'
+            response = Response(data, mimetype='image/png')
+    response.set_etag(tag)
+    response.cache_control.public = True
+    response.cache_control.max_age = MAX_AGE
+    return response
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NODATA = -9999.0
+
+
+def write_dem(path, width=600, height=500, res=0.001, tiled=True, block=128):
+    """MNT synthétique EPSG:4326 : relief lisse, bande de NoData en haut à droite"""
+    rows, cols = np.mgrid[0:height, 0:width]
+    data = (500 + 300 * np.sin(cols / 37.0) * np.cos(rows / 23.0) + 0.5 * cols).astype("float32")
+    data[:40, width - 60:] = NODATA
+    profile = {
+        "driver": "GTiff", "width": width, "height": height, "count": 1, "dtype": "float32",
+        "crs": "EPSG:4326", "transform": from_origin(6.0, 45.0, res, res), "nodata": NODATA,
+    }
+    if tiled:
+        profile.update(tiled=True, blockxsize=block, blockysize=block)
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+    return path
+
+
+@pytest.fixture(params=["tiled", "striped"])
+def dem(request, tmp_path):
+    """GeoTIFF tuilé (blocs 128×128) ou en bandes (lignes regroupées par read_blocks)"""
+    path = write_dem(str(tmp_path / "dem.tif"), tiled=request.param == "tiled")
+    with rasterio.open(path) as src:
+        yield src
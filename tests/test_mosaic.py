@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.windows import Window
+
+from tests.conftest import write_dem
+from wps.metadata import file_signature
+from wps.mosaic import MosaicDEM, get_tile_index
+from wps.sampling import METHODS, sample_many, sample_points
+
+
+def split_dem(path, dest, tiles=(2, 3)):
+    """Découpe un GeoTIFF en tuiles jointives ; la dernière colonne de tuiles va dans un sous-dossier"""
+    os.makedirs(os.path.join(dest, "sub"))
+    with rasterio.open(path) as src:
+        heights = np.linspace(0, src.height, tiles[0] + 1).astype(int)
+        widths = np.linspace(0, src.width, tiles[1] + 1).astype(int)
+        for i in range(tiles[0]):
+            for j in range(tiles[1]):
+                window = Window(widths[j], heights[i], widths[j + 1] - widths[j], heights[i + 1] - heights[i])
+                profile = dict(src.profile, width=window.width, height=window.height,
+                               transform=src.window_transform(window))
+                folder = os.path.join(dest, "sub") if j == tiles[1] - 1 else dest
+                with rasterio.open(os.path.join(folder, f"t_{i}_{j}.tif"), "w", **profile) as dst:
+                    dst.write(src.read(1, window=window), 1)
+    return dest
+
+
+@pytest.fixture
+def mosaic(tmp_path):
+    path = write_dem(str(tmp_path / "dem.tif"))
+    return path, split_dem(path, str(tmp_path / "tiles"))
+
+
+@pytest.mark.parametrize("method", list(METHODS))
+def test_mosaic_sampling_matches_geotiff(mosaic, method):
+    path, folder = mosaic
+    src = MosaicDEM(folder)
+    left, bottom, right, top = src.bounds
+    # Diagonale traversant plusieurs tuiles, plus un point hors de la mosaïque
+    xs = np.append(np.linspace(left, right, 700), left - 1.0)
+    ys = np.append(np.linspace(bottom, top, 700), top + 1.0)
+    with rasterio.open(path) as ref:
+        expected = sample_points(ref, xs, ys, method)
+
+    np.testing.assert_allclose(sample_points(src, xs, ys, method), expected, rtol=1e-6, equal_nan=True)
+    values, _ = sample_many(src, [(xs[:300], ys[:300]), (xs[300:], ys[300:])], method)
+    np.testing.assert_allclose(np.concatenate(values), expected, rtol=1e-6, equal_nan=True)
+    src.close()
+
+
+def test_mosaic_signature_follows_tiles(mosaic):
+    _, folder = mosaic
+    before = file_signature(folder)
+    index = get_tile_index(folder, before)
+
+    # Tuile réécrite sur place dans un sous-dossier : la date du dossier ne change pas
+    tile = os.path.join(folder, "sub", "t_0_2.tif")
+    with rasterio.open(tile, "r+") as dst:
+        dst.write(dst.read(1) + 1000, 1)
+    st = os.stat(tile)
+    os.utime(tile, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    after = file_signature(folder)
+    assert after["tiles"] != before["tiles"]
+    assert get_tile_index(folder, after) is not index
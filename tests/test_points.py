@@ -0,0 +1,86 @@
+import io
+
+import numpy as np
+import pytest
+
+from wps.points import read_csv_points
+from wps.sampling import METHODS, read_blocks, sample_blocks, sample_points
+
+
+def _edge_points(src):
+    """Points sur et autour des limites de blocs, des bords du raster, et hors du raster"""
+    bh, bw = read_blocks(src)
+    res = src.res[0]
+    left, top = src.bounds.left, src.bounds.top
+    cols = [0, 0.5, 1.5, bw - 0.5, bw, bw + 0.5, 2 * bw - 1e-9, src.width - 0.5, src.width]
+    rows = [0, 0.5, bh - 0.5, bh, bh + 0.5, src.height - 1.5, src.height]
+    grid = [(left + c * res, top - r * res) for c in cols for r in rows]
+    outside = [(left - 0.5 * res, top - 10 * res), (left + 10 * res, top + 0.5 * res),
+               (src.bounds.right + res, src.bounds.bottom - res), (0.0, 0.0)]
+    xs, ys = np.array(grid + outside).T
+    return xs, ys
+
+
+@pytest.mark.parametrize("method", list(METHODS))
+def test_sample_blocks_matches_sample_points(dem, method):
+    rng = np.random.default_rng(0)
+    xs = rng.uniform(dem.bounds.left, dem.bounds.right, 500)
+    ys = rng.uniform(dem.bounds.bottom, dem.bounds.top, 500)
+    edge_xs, edge_ys = _edge_points(dem)
+    xs, ys = np.concatenate([xs, edge_xs]), np.concatenate([ys, edge_ys])
+
+    values, reads = sample_blocks(dem, xs, ys, method)
+    expected = sample_points(dem, xs, ys, method)
+
+    np.testing.assert_allclose(values, expected, rtol=1e-6, equal_nan=True)
+    assert np.isnan(values[-4:]).all()
+    assert 0 < reads <= len(xs)
+
+
+def test_sample_blocks_outside_raster(dem):
+    values, reads = sample_blocks(dem, [0.0, 100.0], [0.0, -50.0])
+    assert np.isnan(values).all()
+    assert reads == 0
+
+
+def test_sample_blocks_reads_each_block_once(dem):
+    bh, bw = read_blocks(dem)
+    res = dem.res[0]
+    # Deux points dans le premier bloc, un dans le bloc suivant (en colonnes)
+    cols = np.array([1.5, bw - 1.5, bw + 1.5])
+    xs = dem.bounds.left + cols * res
+    ys = np.full(3, dem.bounds.bottom + 5.5 * res)
+    _, reads = sample_blocks(dem, xs, ys)
+    assert reads == (2 if bw < dem.width else 1)
+
+
+def test_read_csv_points_header():
+    text = "id,lat,lon,alt\nA,45.1,6.2,0\n\nB,44.9,6.4,0\n"
+    ids, xs, ys = read_csv_points(io.StringIO(text))
+    assert ids == ["A", "B"]
+    np.testing.assert_array_equal(xs, [6.2, 6.4])
+    np.testing.assert_array_equal(ys, [45.1, 44.9])
+
+
+def test_read_csv_points_headerless():
+    ids, xs, ys = read_csv_points(io.StringIO("6.2,45.1\n6.4,44.9\n"))
+    assert ids is None
+    np.testing.assert_array_equal(xs, [6.2, 6.4])
+    np.testing.assert_array_equal(ys, [45.1, 44.9])
+
+
+def test_read_csv_points_semicolon_decimal_comma():
+    text = "Longitude;Latitude;Nom\n6,2;45,1;sommet\n6,4;44,9;col\n"
+    ids, xs, ys = read_csv_points(io.StringIO(text))
+    assert ids == ["sommet", "col"]
+    np.testing.assert_array_equal(xs, [6.2, 6.4])
+    np.testing.assert_array_equal(ys, [45.1, 44.9])
+
+    ids, xs, ys = read_csv_points(io.StringIO("6,2;45,1\n6,4;44,9\n"))
+    assert ids is None
+    np.testing.assert_array_equal(xs, [6.2, 6.4])
+
+
+def test_read_csv_points_invalid_line():
+    with pytest.raises(Exception, match="Ligne 3"):
+        read_csv_points(io.StringIO("x,y\n6.2,45.1\n6.4,abc\n"))
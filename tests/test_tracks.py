@@ -0,0 +1,55 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from wps.tracks import read_geojson, read_track
+
+LINE = [[6.1, 45.1, 1000.0], [6.2, 45.2, 1100.0], [6.3, 45.15, 1050.0]]
+
+
+def _stream(document):
+    return io.BytesIO(json.dumps(document).encode("utf-8"))
+
+
+@pytest.mark.parametrize("chunk_bytes", [7, 64, 1024 * 1024])
+def test_read_geojson_feature(chunk_bytes):
+    feature = {"type": "Feature", "properties": {"name": "coordinates", "note": 'x "coordinates": [1]'},
+               "geometry": {"type": "LineString", "coordinates": LINE}}
+    document, coords = read_geojson(_stream(feature), chunk_bytes)
+    assert document["properties"] == feature["properties"]
+    assert document["geometry"] == {"type": "LineString", "coordinates": []}
+    np.testing.assert_array_equal(coords, np.array(LINE)[:, :2])
+
+
+def test_read_track_geometry():
+    geometry = read_track(_stream({"type": "LineString", "coordinates": LINE}))
+    assert geometry["type"] == "LineString"
+    np.testing.assert_array_equal(geometry["coordinates"], np.array(LINE)[:, :2])
+
+
+@pytest.mark.parametrize("document", [
+    # Clé « coordinates » dans les propriétés, avant la géométrie
+    {"type": "Feature", "properties": {"coordinates": [[0, 0], [1, 1]]},
+     "geometry": {"type": "LineString", "coordinates": LINE}},
+    # Plusieurs features
+    {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": LINE}},
+        {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": LINE}}]},
+], ids=["properties", "collection"])
+def test_read_geojson_rejects_several_arrays(document):
+    with pytest.raises(Exception, match="Un seul tableau"):
+        read_geojson(_stream(document), 16)
+
+
+@pytest.mark.parametrize("document", [
+    {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": LINE}}]},
+    {"type": "Point", "coordinates": LINE[0]},
+    {"type": "Feature", "properties": {"coordinates": LINE}, "geometry": None},
+    {"type": "LineString", "coordinates": None},
+], ids=["collection", "point", "properties-only", "null"])
+def test_read_geojson_rejects_other_documents(document):
+    with pytest.raises(Exception, match="LineString"):
+        read_geojson(_stream(document))
@@ -0,0 +1,136 @@
+from pywps import ComplexInput, ComplexOutput, LiteralInput, Format
+import json
+import logging
+from shapely.geometry import shape
+import numpy as np
+
+from wps.coverage import get_coverage_index
+from wps.dem import get_dem_manager
+from wps.geodesy import DEFAULT_PRECISION, PRECISIONS
+from wps.jobs import PooledProcess
+from wps.metrics import get_logger, stage, timed
+from wps.overviews import select_overview
+from wps.sampling import METHODS, sample_positions, sample_spacing, sample_many
+from wps.profile_process import (
+    DEFAULT_NUM_POINTS, EMPTY_STATS, literal_value, resolve_num_points, build_profile
+)
+
+log = get_logger("batch_profile")
+
+
+def parse_features(geom_json):
+    """Extrait les géométries d'une FeatureCollection, Feature ou géométrie (multi-parties éclatées)
+
+    Retourne une liste de (identifiant, géométrie shapely). Les résultats étant indexés par identifiant,
+    deux features de même identifiant (explicite ou rang par défaut) sont refusées.
+    """
+    if geom_json.get("type") == "FeatureCollection":
+        features = []
+        seen = set()
+        for i, feature in enumerate(geom_json.get("features", [])):
+            props = feature.get("properties") or {}
+            fid = str(feature.get("id", props.get("id", i)))
+            if fid in seen:
+                raise Exception(f"Identifiant de feature en double : {fid}")
+            seen.add(fid)
+            features.append((fid, shape(feature["geometry"])))
+        return features
+    if geom_json.get("type") == "Feature":
+        props = geom_json.get("properties") or {}
+        return [(str(geom_json.get("id", props.get("id", 0))), shape(geom_json["geometry"]))]
+    geom = shape(geom_json)
+    if geom.geom_type == "MultiLineString":
+        return [(str(i), part) for i, part in enumerate(geom.geoms)]
+    return [("0", geom)]
+
+
+def parse_lines(geom_json):
+    """Extrait les lignes d'une FeatureCollection, MultiLineString ou LineString
+
+    Retourne une liste de (identifiant, LineString).
+    """
+    lines = parse_features(geom_json)
+    for fid, line in lines:
+        if line.geom_type != "LineString":
+            raise Exception(f"Géométrie {fid} : LineString attendue, {line.geom_type} reçue")
+    return lines
+
+
+class ProfilTopoBatch(PooledProcess):
+    def __init__(self):
+        inputs = [
+            ComplexInput('lines', 'Lignes (FeatureCollection ou MultiLineString)',
+                         supported_formats=[Format('application/vnd.geo+json')]),
+            LiteralInput('num_points', 'Nombre de points par ligne (0 = un par pixel du MNT)',
+                         data_type='integer', default=DEFAULT_NUM_POINTS, min_occurs=0),
+            LiteralInput('method', "Méthode d'interpolation", data_type='string',
+                         allowed_values=list(METHODS), default='nearest', min_occurs=0),
+            LiteralInput('lod', "Lire depuis l'overview adaptée à l'espacement des points", data_type='boolean',
+                         default=True, min_occurs=0),
+            LiteralInput('precision', 'Calcul des distances : geodesic (ellipsoïde WGS84) ou haversine (sphère)',
+                         data_type='string', allowed_values=PRECISIONS, default=DEFAULT_PRECISION, min_occurs=0)
+        ]
+        outputs = [ComplexOutput('profiles', 'Profils', supported_formats=[Format('application/json')])]
+
+        super(ProfilTopoBatch, self).__init__(
+            self._handler,
+            identifier='profil_topo_batch',
+            title='Profil Topo (lot)',
+            version='1.0',
+            inputs=inputs,
+            outputs=outputs
+        )
+
+    def _handler(self, request, response):
+        with timed(self.identifier) as timer:
+            return self._execute(request, response, timer)
+
+    def _execute(self, request, response, timer):
+        try:
+            with stage("parse"):
+                geom_json = json.loads(request.inputs['lines'][0].data)
+                lines = parse_lines(geom_json)
+            num_points = literal_value(request, 'num_points', DEFAULT_NUM_POINTS)
+            method = literal_value(request, 'method', 'nearest')
+            lod = literal_value(request, 'lod', True)
+            precision = literal_value(request, 'precision', DEFAULT_PRECISION)
+
+            # Lignes hors couverture écartées avant toute lecture raster
+            coverage = get_coverage_index()
+            covered = [coverage.fraction(line) for _, line in lines]
+            sampled = [(fid, line) for (fid, line), c in zip(lines, covered) if c > 0]
+
+            with get_dem_manager().dataset() as src, stage("sample"):
+                point_sets = [sample_positions(line, resolve_num_points(src, line, num_points))
+                              for _, line in sampled]
+                factors = [select_overview(src, sample_spacing(xs, ys)) if lod else 1
+                           for xs, ys in point_sets]
+                # Fenêtres fusionnées : une lecture raster pour plusieurs lignes voisines
+                elevations, reads = sample_many(src, point_sets, method, factors=factors)
+                crs = src.crs
+
+            features = {fid: {"error": "La ligne est en dehors de la zone couverte par le MNT",
+                              "profile": [], "stats": dict(EMPTY_STATS)}
+                        for (fid, _), c in zip(lines, covered) if c == 0}
+            coverage_pct = {fid: round(c * 100, 1) for (fid, _), c in zip(lines, covered)}
+            with stage("stats"):
+                for (fid, _), (xs, ys), values in zip(sampled, point_sets, elevations):
+                    try:
+                        profile, stats = build_profile(xs, ys, values, crs, precision)
+                        stats["couverture_pct"] = coverage_pct[fid]
+                        features[fid] = {"profile": profile, "stats": stats}
+                    except Exception as e:
+                        features[fid] = {"error": str(e), "profile": [], "stats": dict(EMPTY_STATS)}
+
+            log.debug("profils calculés", extra={"fields": {"lines": len(lines), "method": method, "reads": reads}})
+
+            with stage("serialize"):
+                response.outputs['profiles'].data = json.dumps({"features": features, "reads": reads})
+            return response
+
+        except Exception as e:
+            timer.outcome = "error"
+            log.warning("échec du calcul des profils : %s", e, exc_info=log.isEnabledFor(logging.DEBUG))
+
+            response.outputs['profiles'].data = json.dumps({"error": str(e), "features": {}})
+            return response
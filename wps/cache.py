@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from wps.dem import get_dem_manager
+from wps.metadata import cached_checksum, signature_key
+from wps.metrics import get_logger
+
+# ===== CONFIGURATION DU CACHE DE RÉSULTATS =====
+# Taille maximale du niveau mémoire (en MB, 0 = désactivé)
+CACHE_MB = float(os.environ.get("RESULT_CACHE_MB", "64"))
+# Nombre de décimales conservées sur les coordonnées pour la clé
+PRECISION = int(os.environ.get("RESULT_CACHE_PRECISION", "6"))
+# Niveau disque optionnel sous le workdir PyWPS
+DISK_ENABLED = os.environ.get("RESULT_CACHE_DISK", "0") == "1"
+# Empreinte du MNT : "mtime" (mtime + taille) ou "checksum" (SHA-256 du fichier) ;
+# une mosaïque est toujours identifiée par le SHA-256 de la liste de ses tuiles
+FINGERPRINT_MODE = os.environ.get("RESULT_CACHE_FINGERPRINT", "mtime")
+# Version du contenu des résultats, à incrémenter quand leur calcul change (entrées existantes ignorées)
+RESULT_VERSION = 2
+
+log = get_logger("cache")
+
+
+def _round_coords(coords, precision):
+    if isinstance(coords, np.ndarray):
+        # Trace lue en flux (tableau N×2) : arrondi vectorisé
+        return np.round(coords.astype("float64"), precision).tolist()
+    if isinstance(coords, (list, tuple)):
+        return [_round_coords(c, precision) for c in coords]
+    return round(float(coords), precision)
+
+
+def canonical_geometry(geom_json, precision=PRECISION):
+    """Représentation JSON canonique d'une géométrie GeoJSON (coordonnées arrondies)"""
+    if geom_json.get("type") == "Feature":
+        geom_json = geom_json["geometry"]
+    if geom_json.get("type") == "GeometryCollection":
+        canonical = {"type": "GeometryCollection",
+                     "geometries": [json.loads(canonical_geometry(g, precision))
+                                    for g in geom_json["geometries"]]}
+    else:
+        canonical = {"type": geom_json["type"],
+                     "coordinates": _round_coords(geom_json["coordinates"], precision)}
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+
+
+def file_checksum(path, chunk_size=4 * 1024 * 1024):
+    """SHA-256 d'un fichier, lu par blocs"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Cache LRU des résultats de processus, indexé par géométrie canonique et paramètres"""
+
+    def __init__(self, max_bytes=int(CACHE_MB * 1024 * 1024), precision=PRECISION,
+                 disk=DISK_ENABLED, fingerprint_mode=FINGERPRINT_MODE):
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self.disk = disk
+        self.fingerprint_mode = fingerprint_mode
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._signature = None
+        self._fingerprint = None
+        self._disk_dir = None
+
+        self.counters = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidations": 0,
+        }
+
+    def _dem_fingerprint(self):
+        """Empreinte du MNT servi ; vide le cache mémoire si elle a changé"""
+        manager = get_dem_manager()
+        signature = manager.signature()
+        with self._lock:
+            if signature == self._signature:
+                return self._fingerprint
+
+        if "tiles" in signature:
+            # Mosaïque : SHA-256 de la liste des tuiles (un dossier ne se hache pas comme un fichier)
+            fingerprint = signature["tiles"][:16]
+        elif self.fingerprint_mode == "checksum":
+            checksum = cached_checksum(manager.path) or file_checksum(manager.path)
+            fingerprint = checksum[:16]
+        else:
+            fingerprint = signature_key(signature)
+        fingerprint = f"{fingerprint}-r{RESULT_VERSION}"
+
+        with self._lock:
+            if self._fingerprint is not None and fingerprint != self._fingerprint:
+                log.info("MNT modifié : cache de résultats invalidé")
+                self._entries.clear()
+                self._bytes = 0
+                self.counters["invalidations"] += 1
+                self._purge_disk(fingerprint)
+            self._signature = signature
+            self._fingerprint = fingerprint
+        return fingerprint
+
+    def _disk_root(self):
+        if self._disk_dir is None:
+            try:
+                from pywps import configuration
+                workdir = configuration.get_config_value("server", "workdir")
+            except Exception:
+                workdir = None
+            self._disk_dir = os.path.join(workdir or "/tmp/pywps", "result_cache")
+        return self._disk_dir
+
+    def _disk_path(self, key, binary=False):
+        fingerprint, digest = key.split(":", 1)
+        return os.path.join(self._disk_root(), fingerprint, digest[:2], digest + (".bin" if binary else ".json"))
+
+    def _purge_disk(self, current):
+        """Supprime les entrées disque calculées sur un autre MNT"""
+        if not self.disk:
+            return
+        root = self._disk_root()
+        if not os.path.isdir(root):
+            return
+        for name in os.listdir(root):
+            if name != current:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    def key(self, identifier, geom_json, params=None):
+        """Clé de cache : empreinte du MNT + hash(processus, paramètres, géométrie)"""
+        payload = "|".join([
+            identifier,
+            json.dumps(params or {}, sort_keys=True, separators=(",", ":")),
+            canonical_geometry(geom_json, self.precision),
+        ])
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"{self._dem_fingerprint()}:{digest}"
+
+    def points_key(self, identifier, xs, ys, ids=None, params=None):
+        """Clé de cache d'un nuage de points : coordonnées arrondies hachées en binaire, sans passer par JSON"""
+        digest = hashlib.sha256()
+        digest.update(identifier.encode("utf-8"))
+        digest.update(json.dumps(params or {}, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+        # + 0.0 : -0.0 et 0.0 ont la même représentation
+        coords = np.round(np.column_stack([xs, ys]).astype("float64"), self.precision) + 0.0
+        digest.update(np.ascontiguousarray(coords, dtype="<f8").tobytes())
+        if ids is not None:
+            digest.update("\0".join(ids).encode("utf-8"))
+        return f"{self._dem_fingerprint()}:{digest.hexdigest()}"
+
+    def get(self, key, binary=False):
+        """Résultat sérialisé (str, ou bytes si `binary`) ou None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return data
+
+        if self.disk:
+            path = self._disk_path(key, binary)
+            try:
+                if binary:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                else:
+                    with open(path, "r", encoding="utf-8") as f:
+                        data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.counters["disk_hits"] += 1
+                self._store(key, data)
+                return data
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, key, data):
+        """Enregistre un résultat sérialisé (str JSON ou bytes binaires) dans les niveaux actifs"""
+        self._store(key, data)
+        if self.disk:
+            binary = isinstance(data, bytes)
+            path = self._disk_path(key, binary)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data if binary else data.encode("utf-8"))
+            os.replace(tmp, path)
+
+    def _store(self, key, data):
+        # json.dumps produit de l'ASCII : nombre de caractères = nombre d'octets (comme pour bytes)
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            hit_ratio = (self.counters["hits"] + self.counters["disk_hits"]) / lookups if lookups else 0.0
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk": self.disk,
+                "fingerprint": self._fingerprint,
+                "hit_ratio": round(hit_ratio, 3),
+                **self.counters,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    global _cache_lock
+    _cache_lock = threading.Lock()
+    if _cache is not None:
+        _cache._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_result_cache():
+    """Retourne le cache de résultats partagé par le processus"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+    return _cache
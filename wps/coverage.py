@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+
+import numpy as np
+import rasterio
+import shapely
+from affine import Affine
+from rasterio.features import shapes
+from rasterio.windows import Window
+from shapely import prepare
+from shapely.geometry import shape
+from shapely.ops import substring, unary_union
+
+from wps.dem import get_dem_manager
+from wps.metadata import file_signature
+from wps.metrics import configure_logging, get_logger
+from wps.mosaic import get_tile_index, is_mosaic
+
+# Taille (pixels du MNT) d'une cellule de l'index de couverture
+CELL_PX = int(os.environ.get("COVERAGE_CELL_PX", "16"))
+# Limite de la région servie, intersectée avec les données valides ("" = pas de limite)
+REGION_PATH = os.environ.get(
+    "COVERAGE_REGION",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "DraaTafilalet.geojson")
+)
+# Une mosaïque de tuiles délimite elle-même sa couverture : pas de région par défaut
+MOSAIC_REGION_PATH = os.environ.get("COVERAGE_REGION", "")
+# Hauteur (en lignes) des bandes lues pendant la construction
+STRIP_ROWS = 512
+
+log = get_logger("coverage")
+
+
+def index_path(path):
+    return f"{path}.coverage.npz"
+
+
+def build_bitmap(path, cell_px=CELL_PX):
+    """Carte grossière des cellules contenant au moins un pixel valide, lue bande par bande"""
+    with rasterio.open(path) as src:
+        rows = -(-src.height // cell_px)
+        cols = -(-src.width // cell_px)
+        bitmap = np.zeros((rows, cols), dtype=bool)
+        strip = max(cell_px, STRIP_ROWS // cell_px * cell_px)
+
+        for row_off in range(0, src.height, strip):
+            height = min(strip, src.height - row_off)
+            valid = src.read_masks(1, window=Window(0, row_off, src.width, height)) > 0
+            # Complète la bande à un multiple de la cellule, puis réduit par cellule
+            valid = np.pad(valid, ((0, -height % cell_px), (0, -src.width % cell_px)))
+            cells = valid.reshape(valid.shape[0] // cell_px, cell_px, cols, cell_px).any(axis=(1, 3))
+            r0 = row_off // cell_px
+            bitmap[r0:r0 + cells.shape[0]] = cells
+
+        transform = src.transform * Affine.scale(cell_px)
+    return bitmap, transform
+
+
+def load_or_build_bitmap(path, cell_px=CELL_PX):
+    """Réutilise l'index enregistré à côté du MNT s'il est à jour, sinon le reconstruit"""
+    signature = file_signature(path)
+    try:
+        with np.load(index_path(path)) as saved:
+            if (int(saved["cell_px"]) == cell_px and int(saved["size"]) == signature["size"]
+                    and int(saved["mtime_ns"]) == signature["mtime_ns"]):
+                return saved["bitmap"], Affine(*saved["transform"])
+    except (OSError, KeyError, ValueError):
+        pass
+
+    log.info("construction de l'index de couverture", extra={"fields": {"path": path}})
+    bitmap, transform = build_bitmap(path, cell_px)
+    tmp = f"{index_path(path)}.{os.getpid()}.tmp.npz"
+    try:
+        np.savez_compressed(tmp, bitmap=bitmap, transform=np.array(list(transform)[:6]), cell_px=cell_px,
+                            size=signature["size"], mtime_ns=signature["mtime_ns"])
+        os.replace(tmp, index_path(path))
+    except OSError as e:
+        log.warning("impossible d'écrire l'index de couverture : %s", e)
+    return bitmap, transform
+
+
+def load_region(region_path):
+    """Union des géométries d'un fichier GeoJSON (limite de la région), ou None"""
+    if not region_path or not os.path.exists(region_path):
+        return None
+    with open(region_path, "r", encoding="utf-8") as f:
+        geom_json = json.load(f)
+    features = geom_json.get("features", [geom_json])
+    return unary_union([shape(f.get("geometry", f)) for f in features])
+
+
+class CoverageIndex:
+    """Zone couverte par le MNT (données valides ∩ région) : rejet ou découpage sans lecture raster
+
+    Pour une mosaïque, la zone couverte est l'union des emprises des tuiles (sans lecture des tuiles).
+    """
+
+    def __init__(self, path, cell_px=CELL_PX, region_path=None, signature=None):
+        self.path = path
+        self.signature = signature or file_signature(path)
+        if is_mosaic(path):
+            self.bitmap, self.transform = np.zeros((0, 0), dtype=bool), None
+            geometry = get_tile_index(path, self.signature).footprint()
+            region_path = MOSAIC_REGION_PATH if region_path is None else region_path
+        else:
+            self.bitmap, self.transform = load_or_build_bitmap(path, cell_px)
+            cells = [shape(geom) for geom, _ in shapes(self.bitmap.astype("uint8"), mask=self.bitmap,
+                                                       transform=self.transform)]
+            geometry = unary_union(cells)
+            region_path = REGION_PATH if region_path is None else region_path
+        region = load_region(region_path)
+        if region is not None:
+            geometry = geometry.intersection(region)
+        self.geometry = geometry
+        prepare(self.geometry)
+
+    def fraction(self, geom):
+        """Part couverte d'une géométrie : longueur (lignes), surface (polygones) ou nombre (points)"""
+        if self.geometry.contains(geom):
+            return 1.0
+        if not self.geometry.intersects(geom):
+            return 0.0
+        if geom.geom_type in ("Point", "MultiPoint"):
+            return float(self.contains_xy(*shapely.get_coordinates(geom).T).mean())
+        inside = self.geometry.intersection(geom)
+        if geom.geom_type in ("Polygon", "MultiPolygon"):
+            return inside.area / geom.area if geom.area else 0.0
+        return inside.length / geom.length if geom.length else 0.0
+
+    def clip_line(self, line):
+        """Tronçon de la ligne compris entre le premier et le dernier point couverts (ou None)"""
+        inside = self.geometry.intersection(line)
+        if inside.is_empty:
+            return None
+        positions = shapely.line_locate_point(line, shapely.points(shapely.get_coordinates(inside)))
+        return substring(line, positions.min(), positions.max())
+
+    def contains_xy(self, xs, ys):
+        """Masque des points couverts (vectorisé)"""
+        return shapely.contains_xy(self.geometry, xs, ys)
+
+    def stats(self):
+        return {
+            "cells": int(self.bitmap.size),
+            "valid_cells": int(self.bitmap.sum()),
+            "bounds": list(self.geometry.bounds) if not self.geometry.is_empty else None,
+        }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    global _indexes_lock
+    _indexes_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_coverage_index(path=None):
+    """Index de couverture du MNT servi, reconstruit si le fichier (ou une tuile de la mosaïque) a changé
+
+    La signature est celle du DEMManager, partagée avec le pool, l'index des tuiles et les caches.
+    """
+    manager = get_dem_manager(path)
+    path = manager.path
+    signature = manager.signature()
+    index = _indexes.get(path)
+    if index is None or index.signature != signature:
+        with _indexes_lock:
+            index = _indexes.get(path)
+            if index is None or index.signature != signature:
+                index = _indexes[path] = CoverageIndex(path, signature=signature)
+    return index
+
+
+if __name__ == "__main__":
+    import sys
+    configure_logging()
+    index = CoverageIndex(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("DEM_PATH", "finale_optimized.tif"))
+    log.info("index de couverture", extra={"fields": {"path": index.path, **index.stats()}})
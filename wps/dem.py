@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from rasterio.env import set_gdal_config
+
+from wps.metadata import file_signature
+from wps.metrics import get_logger, stage
+from wps.mosaic import get_tile_index, is_mosaic, open_mosaic
+from wps.rawdem import SERVING_MODE, open_dataset
+
+log = get_logger("dem")
+
+# ===== CONFIGURATION DU MNT =====
+DEM_PATH = os.environ.get("DEM_PATH", "finale_optimized.tif")
+# Nombre maximal de handles ouverts simultanément par processus
+POOL_SIZE = int(os.environ.get("DEM_POOL_SIZE", "8"))
+# Taille du cache de blocs GDAL partagé par le processus (en MB)
+GDAL_CACHE_MB = int(os.environ.get("DEM_GDAL_CACHE_MB", "256"))
+# Intervalle minimal (secondes) entre deux vérifications du fichier sur disque
+CHECK_INTERVAL = float(os.environ.get("DEM_CHECK_INTERVAL", "5"))
+
+
+class DEMManager:
+    """Pool borné de handles rasterio sur le MNT, partagé par tous les threads
+
+    En mode DEM_SERVING=memmap, les handles sont des vues sur le tableau brut projeté en mémoire.
+    Si DEM_PATH est un dossier de tuiles ou un VRT, ce sont des vues sur la mosaïque (wps.mosaic).
+    """
+
+    def __init__(self, path=DEM_PATH, pool_size=POOL_SIZE, cache_mb=GDAL_CACHE_MB,
+                 check_interval=CHECK_INTERVAL):
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self.cache_mb = cache_mb
+        self.check_interval = check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._in_use = 0
+        self._pid = None
+        self._signature = None
+        self._generation = 0
+        self._last_check = 0.0
+
+        self.counters = {
+            "opens": 0,
+            "reopens": 0,
+            "hits": 0,
+            "misses": 0,
+            "waits": 0,
+        }
+
+    def _reset_after_fork(self):
+        """Les handles hérités d'un fork (worker gunicorn, tâche asynchrone) ne sont pas réutilisables"""
+        self._idle = []
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._last_check = 0.0
+        # Un entier est pris en octets par GDALSetCacheMax64 (256 = 256 octets, pas 256 MB)
+        set_gdal_config("GDAL_CACHEMAX", self.cache_mb * 1024 * 1024)
+
+    def _check_file(self):
+        """Invalide le pool si le fichier a changé sur disque (appelé sous verrou)"""
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+        now = time.monotonic()
+        if self._signature is not None and now - self._last_check < self.check_interval:
+            return
+
+        if not os.path.exists(self.path):
+            raise Exception(f"Fichier TIFF introuvable : {self.path}")
+        # Mosaïque : signature de la liste des tuiles (la date du dossier ne suit pas les tuiles)
+        signature = file_signature(self.path)
+
+        if self._signature is not None and signature != self._signature:
+            log.info("MNT modifié sur disque, réouverture", extra={"fields": {"path": self.path}})
+            self._generation += 1
+            self.counters["reopens"] += 1
+            self._close_idle()
+
+        self._signature = signature
+        self._last_check = now
+
+    def _close_idle(self):
+        for _, handle in self._idle:
+            handle.close()
+        self._idle = []
+
+    def _acquire(self):
+        with self._cond:
+            self._check_file()
+            while not self._idle and self._in_use >= self.pool_size:
+                self.counters["waits"] += 1
+                self._cond.wait()
+
+            self._in_use += 1
+            if self._idle:
+                self.counters["hits"] += 1
+                return self._idle.pop()
+            self.counters["misses"] += 1
+            generation = self._generation
+            signature = self._signature
+
+        try:
+            # Seule l'absence de copie brute du MNT servi est signalée (pas celle des rasters dérivés)
+            handle = open_mosaic(self.path, signature) if is_mosaic(self.path) \
+                else open_dataset(self.path, warn=self.path == DEM_PATH)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self.counters["opens"] += 1
+        return generation, handle
+
+    def _release(self, generation, handle):
+        with self._cond:
+            self._in_use -= 1
+            if generation == self._generation and self._pid == os.getpid() and not handle.closed:
+                # LIFO : le handle le plus récent a le cache le plus chaud
+                self._idle.append((generation, handle))
+            else:
+                handle.close()
+            self._cond.notify()
+
+    @contextmanager
+    def dataset(self):
+        """Prête un dataset rasterio ouvert (ne pas le fermer soi-même)"""
+        with stage("open"):
+            generation, handle = self._acquire()
+        try:
+            yield handle
+        finally:
+            self._release(generation, handle)
+
+    def signature(self):
+        """Signature du MNT actuellement servi (wps.metadata.file_signature), vérifiée à intervalle régulier"""
+        with self._cond:
+            self._check_file()
+            return self._signature
+
+    def stats(self):
+        mosaic = get_tile_index(self.path, self.signature()).stats() if is_mosaic(self.path) else {}
+        with self._cond:
+            return {
+                "path": self.path,
+                "generation": self._generation,
+                "pool_size": self.pool_size,
+                "idle_handles": len(self._idle),
+                "handles_in_use": self._in_use,
+                "gdal_cache_mb": self.cache_mb,
+                "serving": "mosaic" if mosaic else SERVING_MODE,
+                **self.counters,
+                **mosaic,
+            }
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    """Un verrou tenu par un autre thread au moment du fork resterait bloqué dans l'enfant"""
+    global _managers_lock
+    _managers_lock = threading.Lock()
+    for manager in _managers.values():
+        manager._cond = threading.Condition()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_dem_manager(path=None):
+    """Retourne le gestionnaire partagé par le processus pour un raster (MNT par défaut)"""
+    path = path or DEM_PATH
+    manager = _managers.get(path)
+    if manager is None:
+        with _managers_lock:
+            manager = _managers.get(path)
+            if manager is None:
+                manager = _managers[path] = DEMManager(path)
+    return manager
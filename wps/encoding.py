@@ -0,0 +1,169 @@
+import base64
+import gzip
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+# Type MIME du format binaire compact (négocié via l'en-tête Accept)
+BINARY_MIMETYPE = "application/octet-stream"
+MAGIC = b"TOPO"
+VERSION = 1
+# Magic, version, longueur de l'en-tête JSON (little-endian)
+_PREFIX = struct.Struct("<4sHI")
+# Alignement des tableaux (lecture directe en Float64Array côté navigateur)
+ALIGNMENT = 8
+
+# slope : pente signée (degrés) du segment arrivant au point
+PROFILE_COLUMNS = ["distance", "x", "y", "elevation", "slope"]
+# Formats du profil : lignes {distance, x, y, elevation, slope} (défaut), colonnes JSON, colonnes float32 en base64
+PROFILE_FORMATS = ["rows", "columns", "float32"]
+# Altitudes ponctuelles : lignes {id, x, y, elevation} (défaut) ou colonnes JSON
+POINT_COLUMNS = ["id", "x", "y", "elevation"]
+POINT_FORMATS = ["rows", "columns"]
+
+# ===== COMPRESSION HTTP =====
+# Taille minimale (octets) d'une réponse compressée et niveau de compression (1-9)
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", "6"))
+COMPRESSIBLE_MIMETYPES = ("application/json", BINARY_MIMETYPE, "text/xml", "application/xml")
+
+
+def pack(meta, arrays, dtype="<f8"):
+    """Encode un document : préfixe, en-tête JSON (métadonnées + description des tableaux), tableaux bruts
+
+    Les tableaux sont écrits en little-endian (`dtype` : "<f8" ou "<f4"), chacun aligné sur 8 octets ;
+    NaN = valeur manquante.
+    """
+    layout = []
+    chunks = []
+    offset = 0
+    for name, values in arrays.items():
+        arr = np.ascontiguousarray(values, dtype=dtype)
+        layout.append({"name": name, "dtype": arr.dtype.str, "length": int(arr.size), "offset": offset})
+        chunks.append(arr.tobytes())
+        padding = -arr.nbytes % ALIGNMENT
+        if padding:
+            chunks.append(b"\0" * padding)
+        offset += arr.nbytes + padding
+
+    header = json.dumps({"meta": meta, "arrays": layout}, separators=(",", ":")).encode("utf-8")
+    header += b" " * (-(_PREFIX.size + len(header)) % ALIGNMENT)
+    return b"".join([_PREFIX.pack(MAGIC, VERSION, len(header)), header] + chunks)
+
+
+def unpack(buf):
+    """Décode un document produit par pack() : (métadonnées, {nom: tableau})"""
+    magic, version, header_len = _PREFIX.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise Exception("Format binaire non reconnu")
+    start = _PREFIX.size + header_len
+    header = json.loads(bytes(buf[_PREFIX.size:start]))
+    arrays = {
+        a["name"]: np.frombuffer(buf, dtype=a["dtype"], count=a["length"], offset=start + a["offset"])
+        for a in header["arrays"]
+    }
+    return header["meta"], arrays
+
+
+def _column(values):
+    return np.array([np.nan if v is None else v for v in values], dtype="float64")
+
+
+def profile_rows(columns):
+    """Colonnes du profil -> liste de points {distance, x, y, elevation, slope}"""
+    return [
+        dict(zip(PROFILE_COLUMNS, values))
+        for values in zip(*(np.asarray(columns[c]).tolist() for c in PROFILE_COLUMNS))
+    ]
+
+
+def encode_profile(columns, stats, output_format="rows"):
+    """Sérialise un profil en JSON : `rows`, `columns` ou `float32` (colonnes little-endian en base64)"""
+    length = len(columns["distance"])
+    if output_format == "rows":
+        return json.dumps({"profile": profile_rows(columns), "stats": stats})
+    if output_format == "columns":
+        encoded = {c: np.asarray(columns[c]).tolist() for c in PROFILE_COLUMNS}
+    elif output_format == "float32":
+        encoded = {c: base64.b64encode(np.ascontiguousarray(columns[c], dtype="<f4").tobytes()).decode("ascii")
+                   for c in PROFILE_COLUMNS}
+    else:
+        raise Exception(f"Format de profil inconnu : {output_format} (attendu : {', '.join(PROFILE_FORMATS)})")
+    return json.dumps({"format": output_format, "length": length, "columns": encoded, "stats": stats})
+
+
+def decode_profile(result):
+    """Colonnes NumPy d'un profil JSON, quel que soit son format"""
+    if "columns" not in result:
+        return {c: _column([p.get(c) for p in result["profile"]]) for c in PROFILE_COLUMNS}
+    if result.get("format") == "float32":
+        return {c: np.frombuffer(base64.b64decode(v), dtype="<f4") for c, v in result["columns"].items()}
+    return {c: _column(v) for c, v in result["columns"].items()}
+
+
+def pack_profile(columns, stats, dtype="<f8"):
+    """Colonnes du profil encodées en tableaux binaires (float64 ou float32) ; stats dans l'en-tête"""
+    meta = {"length": len(columns["distance"]), "stats": stats}
+    return pack(meta, {c: columns[c] for c in PROFILE_COLUMNS}, dtype)
+
+
+def _nullable(values):
+    """Tableau -> liste JSON, NaN remplacés par null"""
+    values = np.asarray(values, dtype="float64")
+    listed = values.astype(object)
+    listed[np.isnan(values)] = None
+    return listed.tolist()
+
+
+def encode_points(ids, xs, ys, elevations, stats, output_format="rows"):
+    """Sérialise des altitudes ponctuelles en JSON, dans l'ordre des points (null = sans valeur)"""
+    columns = {"id": list(ids), "x": np.asarray(xs).tolist(), "y": np.asarray(ys).tolist(),
+               "elevation": _nullable(elevations)}
+    if output_format == "rows":
+        rows = [dict(zip(POINT_COLUMNS, values)) for values in zip(*(columns[c] for c in POINT_COLUMNS))]
+        return json.dumps({"points": rows, "stats": stats})
+    if output_format == "columns":
+        return json.dumps({"format": output_format, "length": len(columns["id"]), "columns": columns, "stats": stats})
+    raise Exception(f"Format inconnu : {output_format} (attendu : {', '.join(POINT_FORMATS)})")
+
+
+def pack_points(ids, xs, ys, elevations, stats, dtype="<f8"):
+    """Altitudes ponctuelles encodées : x, y, elevation en tableaux binaires ; identifiants dans l'en-tête"""
+    meta = {"stats": stats, "ids": list(ids)}
+    return pack(meta, {"x": xs, "y": ys, "elevation": elevations}, dtype)
+
+
+def pack_solar(result):
+    """Résultat d'exposition encodé ; la série d'irradiation par point devient un tableau binaire"""
+    meta = dict(result)
+    arrays = {}
+    if "irradiance" in meta:
+        meta["irradiance"] = dict(meta["irradiance"])
+        arrays["kwh_m2"] = _column(meta["irradiance"].pop("kwh_m2"))
+    return pack(meta, arrays)
+
+
+def compress_response(response, accept_encodings):
+    """Compresse une réponse Flask (gzip ou deflate) selon l'en-tête Accept-Encoding du client"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    encoding = accept_encodings.best_match(["gzip", "deflate"])
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    if encoding == "gzip":
+        data = gzip.compress(data, COMPRESS_LEVEL, mtime=0)
+    else:
+        data = zlib.compress(data, COMPRESS_LEVEL)
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
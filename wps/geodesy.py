@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+try:
+    from pyproj import Geod
+except ImportError:  # pyproj absent : repli sur la formule de haversine
+    Geod = None
+
+# Rayon moyen de la Terre (m) pour la formule de haversine
+EARTH_RADIUS_M = 6371008.8
+# Précision des distances : "geodesic" (ellipsoïde WGS84, algorithme de Karney via pyproj) ou "haversine"
+PRECISIONS = ["geodesic", "haversine"]
+DEFAULT_PRECISION = os.environ.get("DISTANCE_PRECISION", "geodesic")
+
+_geod = Geod(ellps="WGS84") if Geod is not None else None
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """Distances (m) sur la sphère entre deux séries de points en degrés"""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype="float64")) for v in (lon1, lat1, lon2, lat2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def segment_lengths(xs, ys, crs=None, precision=DEFAULT_PRECISION):
+    """Longueur (m) de chaque segment entre échantillons consécutifs, en une opération vectorisée
+
+    Coordonnées en degrés (CRS géographique ou inconnu) : géodésique WGS84 si pyproj est disponible,
+    sinon haversine. CRS projeté : distance euclidienne dans les unités du CRS.
+    """
+    xs = np.asarray(xs, dtype="float64")
+    ys = np.asarray(ys, dtype="float64")
+    if len(xs) < 2:
+        return np.zeros(0)
+    if crs is not None and not crs.is_geographic:
+        return np.hypot(np.diff(xs), np.diff(ys))
+    if precision == "geodesic" and _geod is not None:
+        _, _, dist = _geod.inv(xs[:-1], ys[:-1], xs[1:], ys[1:])
+        return np.asarray(dist, dtype="float64")
+    return haversine(xs[:-1], ys[:-1], xs[1:], ys[1:])
+
+
+def cumulative_distances(xs, ys, crs=None, precision=DEFAULT_PRECISION):
+    """Distance cumulée (m) depuis le premier échantillon"""
+    return np.concatenate(([0.0], np.cumsum(segment_lengths(xs, ys, crs, precision))))
+
+
+def slope_series(distances, elevations):
+    """Pente signée (degrés) de chaque segment entre échantillons consécutifs, 0 au premier point
+
+    Retourne (pentes par point, dénivelé positif cumulé, dénivelé négatif cumulé, pente max en degrés).
+    """
+    ds = np.diff(distances)
+    dz = np.diff(elevations)
+    grade = np.divide(dz, ds, out=np.zeros_like(dz), where=ds > 0)
+    slopes = np.degrees(np.arctan(np.concatenate(([0.0], grade))))
+    ascent = float(dz[dz > 0].sum())
+    descent = float(-dz[dz < 0].sum())
+    max_slope = float(np.abs(slopes).max()) if len(slopes) else 0.0
+    return slopes, ascent, descent, max_slope
@@ -0,0 +1,166 @@
+import datetime
+import math
+from functools import lru_cache
+
+import numpy as np
+from rasterio.warp import transform as transform_coords
+
+from wps.sampling import bounds_window, interpolate, read_window
+from wps.terrain import METERS_PER_DEGREE, pixel_size_m, slope_aspect
+
+# Constante solaire (W/m²)
+SOLAR_CONSTANT = 1361.0
+# Largeur des bandes de latitude partageant une même table de positions du soleil (degrés)
+LAT_BAND_DEG = 0.5
+# Horizon : nombre de secteurs d'azimut, distance maximale (m) et nombre de pas par secteur
+HORIZON_SECTORS = 16
+HORIZON_DISTANCE_M = 5000.0
+HORIZON_STEPS = 24
+# Nombre maximal de pixels lus pour l'ombrage (au-delà, lecture sous-échantillonnée)
+MAX_WINDOW_PIXELS = 4 * 1024 * 1024
+# Part diffuse du rayonnement direct (modèle de ciel clair simplifié)
+DIFFUSE_FRACTION = 0.1
+
+
+def parse_period(start, end):
+    """Période analysée ; par défaut l'année civile en cours"""
+    year = datetime.date.today().year
+    start = datetime.date.fromisoformat(start) if start else datetime.date(year, 1, 1)
+    end = datetime.date.fromisoformat(end) if end else datetime.date(start.year, 12, 31)
+    if end < start:
+        raise Exception(f"Période invalide : {start} > {end}")
+    return start, end
+
+
+@lru_cache(maxsize=128)
+def sun_table(band, start, end, step_hours, day_step):
+    """Positions du soleil (heure solaire vraie) pour une bande de latitude et une grille de temps
+
+    Retourne (élévation, azimut depuis le nord, poids en heures, facteur de distance Terre-Soleil),
+    restreints aux pas où le soleil est levé. Les tableaux sont en lecture seule (partagés).
+    """
+    days = np.arange(0, (end - start).days + 1, day_step)
+    doy = np.array([(start + datetime.timedelta(days=int(d))).timetuple().tm_yday for d in days], dtype="float64")
+    hours = np.arange(step_hours / 2.0, 24.0, step_hours)
+
+    gamma = (2 * np.pi / 365.0 * (doy - 1))[:, None]
+    decl = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+            - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+            - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    distance = (1.000110 + 0.034221 * np.cos(gamma) + 0.001280 * np.sin(gamma)
+                + 0.000719 * np.cos(2 * gamma) + 0.000077 * np.sin(2 * gamma))
+    hour_angle = np.radians((hours[None, :] - 12.0) * 15.0)
+
+    phi = np.radians(band)
+    sin_elev = np.sin(phi) * np.sin(decl) + np.cos(phi) * np.cos(decl) * np.cos(hour_angle)
+    elevation = np.arcsin(np.clip(sin_elev, -1.0, 1.0))
+    azimuth = (np.arctan2(np.sin(hour_angle),
+                          np.cos(hour_angle) * np.sin(phi) - np.tan(decl) * np.cos(phi)) + np.pi) % (2 * np.pi)
+    distance = np.broadcast_to(distance, elevation.shape)
+
+    day = elevation > 0
+    weights = np.full(day.sum(), step_hours * day_step, dtype="float64")
+    table = (elevation[day], azimuth[day], weights, distance[day])
+    for arr in table:
+        arr.setflags(write=False)
+    return table
+
+
+def clear_sky_dni(elevation, distance):
+    """Rayonnement direct normal par ciel clair (masse d'air de Kasten-Young)"""
+    elev_deg = np.degrees(elevation)
+    air_mass = 1.0 / (np.sin(elevation) + 0.50572 * np.power(elev_deg + 6.07995, -1.6364))
+    return SOLAR_CONSTANT * distance * np.power(0.7, np.power(air_mass, 0.678))
+
+
+def _offsets(xs, ys, crs, dx_m, dy_m):
+    """Convertit des déplacements en mètres en déplacements dans le CRS du MNT"""
+    if crs is not None and crs.is_geographic:
+        cos_lat = np.cos(np.radians(ys))
+        return dx_m / (METERS_PER_DEGREE * cos_lat), dy_m / METERS_PER_DEGREE
+    return dx_m, dy_m
+
+
+def horizon_angles(arr, transform, crs, xs, ys, z0):
+    """Angle d'horizon (radians) de chaque point dans chaque secteur d'azimut, tableau (points, secteurs)"""
+    pixel_m = abs(transform.e) * (METERS_PER_DEGREE if crs is not None and crs.is_geographic else 1.0)
+    distances = np.geomspace(max(pixel_m, 1.0), HORIZON_DISTANCE_M, HORIZON_STEPS)
+    azimuths = np.arange(HORIZON_SECTORS) * (2 * np.pi / HORIZON_SECTORS)
+
+    # Positions (points, secteurs, pas) calculées en une seule diffusion NumPy
+    dx_m = np.sin(azimuths)[None, :, None] * distances[None, None, :]
+    dy_m = np.cos(azimuths)[None, :, None] * distances[None, None, :]
+    ox, oy = _offsets(xs[:, None, None], ys[:, None, None], crs, dx_m, dy_m)
+    px = xs[:, None, None] + ox
+    py = ys[:, None, None] + oy
+
+    z = interpolate(arr, transform, px.ravel(), py.ravel(), "nearest").reshape(px.shape)
+    angles = np.arctan2(z - z0[:, None, None], distances[None, None, :])
+    angles = np.where(np.isfinite(angles), angles, -np.pi / 2)
+    return angles.max(axis=2)
+
+
+def irradiance_along(src, xs, ys, start=None, end=None, step_hours=1.0, day_step=1):
+    """Irradiation cumulée (kWh/m²) par ciel clair en chaque point, avec ombrage du relief"""
+    start, end = parse_period(start, end)
+    xs = np.asarray(xs, dtype="float64")
+    ys = np.asarray(ys, dtype="float64")
+
+    # Fenêtre couvrant les points et la distance d'horizon, lue une seule fois
+    mx, my = _offsets(xs, ys, src.crs, HORIZON_DISTANCE_M, HORIZON_DISTANCE_M)
+    bounds = ((xs - mx).min(), (ys - my).min(), (xs + mx).max(), (ys + my).max())
+    window = bounds_window(src, bounds, pad=1)
+    if window is None:
+        raise Exception("La ligne est en dehors de la zone couverte par le MNT")
+    factor = max(1, int(math.ceil(math.sqrt(window.width * window.height / MAX_WINDOW_PIXELS))))
+    arr, transform = read_window(src, window, factor)
+
+    # Pente et exposition locales (Horn) sur la fenêtre, puis aux points
+    rows = np.arange(arr.shape[0])
+    dx, dy = pixel_size_m(transform, src.crs, rows)
+    slope, aspect = slope_aspect(np.pad(arr, 1, mode="edge"), dx, dy)
+    z0 = interpolate(arr, transform, xs, ys, "bilinear")
+    slope = np.radians(interpolate(slope, transform, xs, ys, "nearest"))
+    aspect = np.radians(np.clip(interpolate(aspect, transform, xs, ys, "nearest"), 0, None))
+    horizon = horizon_angles(arr, transform, src.crs, xs, ys, z0)
+
+    energy = np.full(xs.shape, np.nan)
+    shaded_hours = np.zeros(xs.shape)
+    daylight_hours = np.zeros(xs.shape)
+    lats = ys
+    if src.crs is not None and not src.crs.is_geographic:
+        lats = np.asarray(transform_coords(src.crs, "EPSG:4326", xs, ys)[1])
+    bands = np.round(np.round(lats / LAT_BAND_DEG) * LAT_BAND_DEG, 6)
+
+    for band in np.unique(bands):
+        idx = np.nonzero(bands == band)[0]
+        elevation, azimuth, weights, distance = sun_table(float(band), start, end, float(step_hours), int(day_step))
+
+        # Incidence (points, pas de temps) en une seule opération diffusée
+        s, a = slope[idx, None], aspect[idx, None]
+        cos_inc = (np.sin(elevation)[None, :] * np.cos(s)
+                   + np.cos(elevation)[None, :] * np.sin(s) * np.cos(azimuth[None, :] - a))
+        sector = np.round(azimuth / (2 * np.pi / HORIZON_SECTORS)).astype("int64") % HORIZON_SECTORS
+        visible = elevation[None, :] > horizon[idx][:, sector]
+
+        dni = clear_sky_dni(elevation, distance)[None, :]
+        direct = dni * np.clip(cos_inc, 0, None) * visible
+        diffuse = DIFFUSE_FRACTION * dni * (1 + np.cos(s)) / 2
+        energy[idx] = ((direct + diffuse) * weights[None, :]).sum(axis=1) / 1000.0
+        shaded_hours[idx] = ((~visible) * weights[None, :]).sum(axis=1)
+        daylight_hours[idx] = weights.sum()
+
+    valid = np.isfinite(energy) & np.isfinite(z0)
+    if not valid.any():
+        raise Exception("Aucun point valide pour le calcul d'irradiation")
+
+    return {
+        "period": {"start": start.isoformat(), "end": end.isoformat(),
+                   "time_step_hours": step_hours, "day_step": day_step},
+        "kwh_m2": [round(v, 2) if np.isfinite(v) else None for v in energy.tolist()],
+        "mean_kwh_m2": round(float(energy[valid].mean()), 2),
+        "min_kwh_m2": round(float(energy[valid].min()), 2),
+        "max_kwh_m2": round(float(energy[valid].max()), 2),
+        "shaded_pct": round(float(shaded_hours[valid].sum() / max(daylight_hours[valid].sum(), 1e-9) * 100), 1),
+        "overview_factor": factor,
+    }
@@ -0,0 +1,224 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from pywps import Process
+from pywps import configuration
+from pywps.exceptions import ServerBusy
+from pywps.response.status import WPS_STATUS
+
+from wps.metrics import get_logger
+
+# ===== CONFIGURATION DES TÂCHES ASYNCHRONES =====
+# Nombre de tâches exécutées simultanément par worker gunicorn
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# Nombre maximal de tâches en attente (au-delà : ServerBusy)
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "30"))
+# Durée maximale d'une tâche (secondes)
+JOB_TIMEOUT = float(os.environ.get("JOB_TIMEOUT", "3600"))
+# Nombre de durées conservées pour les statistiques
+DURATION_HISTORY = 200
+
+log = get_logger("jobs")
+
+
+def _outputpath():
+    try:
+        return configuration.get_config_value("server", "outputpath") or "/tmp/outputs"
+    except Exception:
+        return "/tmp/outputs"
+
+
+def cancel_marker(uuid):
+    """Fichier marqueur d'annulation, visible par tous les workers gunicorn"""
+    return os.path.join(_outputpath(), f"{uuid}.cancel")
+
+
+class JobPool:
+    """Pool borné de processus pour les Execute asynchrones (status=true), avec file d'attente
+
+    Chaque tâche tourne dans un processus forké ; au plus `workers` tâches en parallèle,
+    les suivantes attendent dans la file. Les documents de statut et les sorties sont
+    écrits par PyWPS dans `outputpath`.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, queue_max=JOB_QUEUE_MAX, timeout=JOB_TIMEOUT):
+        self.workers = max(1, workers)
+        self.queue_max = queue_max
+        self.timeout = timeout
+
+        self._ctx = multiprocessing.get_context("fork")
+        self._cond = threading.Condition()
+        self._queue = OrderedDict()
+        self._running = {}
+        self._durations = deque(maxlen=DURATION_HISTORY)
+        self._thread = None
+        self._pid = None
+
+        self.counters = {
+            "submitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "timeouts": 0,
+        }
+
+    def _ensure_dispatcher(self):
+        """Démarre le thread de répartition (une fois par processus, y compris après un fork)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._queue.clear()
+        self._running.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._dispatch, name="wps-job-pool", daemon=True)
+        self._thread.start()
+
+    def submit(self, process, wps_request, wps_response):
+        with self._cond:
+            self._ensure_dispatcher()
+            if self.queue_max != -1 and len(self._queue) >= self.queue_max:
+                raise ServerBusy("File d'attente pleine, réessayez plus tard.")
+            self._queue[str(process.uuid)] = (process, wps_request, wps_response, time.monotonic())
+            self.counters["submitted"] += 1
+            self._cond.notify()
+
+    def cancel(self, uuid):
+        """Annule une tâche en attente ou en cours (True si elle appartient à ce worker)"""
+        uuid = str(uuid)
+        with self._cond:
+            job = self._queue.pop(uuid, None)
+            if job is not None:
+                self._fail(job[2], "Tâche annulée")
+                self.counters["cancelled"] += 1
+                return True
+            running = self._running.pop(uuid, None)
+        if running is None:
+            return False
+
+        child, wps_response, _ = running
+        child.terminate()
+        child.join(5)
+        self._fail(wps_response, "Tâche annulée")
+        with self._cond:
+            self.counters["cancelled"] += 1
+        return True
+
+    def _fail(self, wps_response, message):
+        try:
+            wps_response._update_status(WPS_STATUS.FAILED, message, 100)
+        except Exception as e:
+            log.warning("statut de la tâche non mis à jour : %s", e)
+
+    def _reap(self):
+        """Retire les tâches terminées, expirées ou annulées via marqueur (appelé sous verrou)
+
+        Les processus à arrêter reçoivent SIGTERM ici ; leur attente (join) et la mise à jour
+        du statut se font dans `_finish`, verrou relâché.
+        """
+        now = time.monotonic()
+        ended = []
+        for uuid, (child, wps_response, started) in list(self._running.items()):
+            if os.path.exists(cancel_marker(uuid)):
+                os.remove(cancel_marker(uuid))
+                child.terminate()
+                ended.append((child, wps_response, "Tâche annulée"))
+                self.counters["cancelled"] += 1
+            elif child.is_alive() and now - started > self.timeout:
+                child.terminate()
+                ended.append((child, wps_response, f"Durée maximale dépassée ({self.timeout:.0f} s)"))
+                self.counters["timeouts"] += 1
+            elif not child.is_alive():
+                ended.append((child, wps_response, None))
+                self._durations.append(now - started)
+                self.counters["succeeded" if child.exitcode == 0 else "failed"] += 1
+            else:
+                continue
+            del self._running[uuid]
+
+        for uuid in [u for u in self._queue if os.path.exists(cancel_marker(u))]:
+            os.remove(cancel_marker(uuid))
+            ended.append((None, self._queue.pop(uuid)[2], "Tâche annulée"))
+            self.counters["cancelled"] += 1
+        return ended
+
+    def _finish(self, ended):
+        """Attend les processus retirés par `_reap` et met à jour leur statut (hors verrou)"""
+        for child, wps_response, message in ended:
+            if child is not None:
+                child.join(5 if message else None)
+                if child.is_alive():
+                    # SIGTERM ignoré : arrêt forcé
+                    child.kill()
+                    child.join()
+            if message:
+                self._fail(wps_response, message)
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                ended = self._reap()
+                while self._queue and len(self._running) < self.workers:
+                    uuid, (process, wps_request, wps_response, _) = self._queue.popitem(last=False)
+                    child = self._ctx.Process(target=process._run_process,
+                                              args=(wps_request, wps_response),
+                                              name=f"wps-job-{uuid}", daemon=False)
+                    child.start()
+                    self._running[uuid] = (child, wps_response, time.monotonic())
+                if not ended:
+                    self._cond.wait(0.5)
+            # Un processus lent à s'arrêter ne bloque ni submit, ni stats, ni jobs
+            self._finish(ended)
+
+    def stats(self):
+        with self._cond:
+            durations = sorted(self._durations)
+            return {
+                "workers": self.workers,
+                "queued": len(self._queue),
+                "running": len(self._running),
+                "queue_max": self.queue_max,
+                "mean_duration_s": round(sum(durations) / len(durations), 3) if durations else None,
+                "p95_duration_s": round(durations[max(0, -(-95 * len(durations) // 100) - 1)], 3) if durations else None,
+                **self.counters,
+            }
+
+    def jobs(self):
+        with self._cond:
+            now = time.monotonic()
+            return {
+                "queued": [{"uuid": u, "process": job[0].identifier, "waiting_s": round(now - job[3], 1)}
+                           for u, job in self._queue.items()],
+                "running": [{"uuid": u, "pid": child.pid, "running_s": round(now - started, 1)}
+                            for u, (child, _, started) in self._running.items()],
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_job_pool():
+    """Retourne le pool de tâches asynchrones du processus"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = JobPool()
+    return _pool
+
+
+class PooledProcess(Process):
+    """Process PyWPS acceptant storeExecuteResponse/status=true, exécuté dans le pool borné
+
+    Sans status=true, l'Execute reste synchrone dans le thread de la requête.
+    """
+
+    def __init__(self, handler, **kwargs):
+        kwargs.setdefault("store_supported", True)
+        kwargs.setdefault("status_supported", True)
+        super(PooledProcess, self).__init__(handler, **kwargs)
+
+    def _run_async(self, wps_request, wps_response):
+        get_job_pool().submit(self, wps_request, wps_response)
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import rasterio
+
+from wps.metrics import get_logger
+from wps.mosaic import is_mosaic, mosaic_metadata, mosaic_signature
+
+# Version du format du fichier annexe (à incrémenter si son contenu change)
+SIDECAR_VERSION = 1
+# Mode de validation au démarrage : "eager" (bloquant) ou "lazy" (en arrière-plan)
+STARTUP_VALIDATION = os.environ.get("STARTUP_VALIDATION", "eager")
+
+log = get_logger("metadata")
+
+_state = {"status": "idle", "metadata": None, "error": None}
+_state_lock = threading.Lock()
+
+
+def sidecar_path(path):
+    return f"{path}.meta.json"
+
+
+def file_signature(path):
+    """Taille et date du MNT ; pour une mosaïque, signature de la liste des tuiles (clé `tiles` en plus)"""
+    if is_mosaic(path):
+        return mosaic_signature(path)
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def signature_key(signature):
+    """Représentation compacte d'une signature (dossiers des caches)"""
+    key = "%x-%x" % (signature["mtime_ns"], signature["size"])
+    return f"{key}-{signature['tiles'][:12]}" if "tiles" in signature else key
+
+
+def compute_metadata(path, chunk_size=4 * 1024 * 1024):
+    """Lit le MNT une fois : statistiques par blocs, emprise, NoData, overviews, SHA-256"""
+    if is_mosaic(path):
+        return mosaic_metadata(path)
+
+    count = 0
+    total = 0.0
+    total_sq = 0.0
+    vmin = np.inf
+    vmax = -np.inf
+
+    with rasterio.open(path) as src:
+        for _, window in src.block_windows(1):
+            block = src.read(1, window=window, masked=True)
+            values = block.compressed().astype("float64")
+            if values.size == 0:
+                continue
+            count += values.size
+            total += values.sum()
+            total_sq += np.square(values).sum()
+            vmin = min(vmin, values.min())
+            vmax = max(vmax, values.max())
+
+        mean = total / count if count else 0.0
+        std = float(np.sqrt(max(total_sq / count - mean * mean, 0.0))) if count else 0.0
+        metadata = {
+            "width": src.width,
+            "height": src.height,
+            "crs": src.crs.to_string() if src.crs else None,
+            "transform": list(src.transform)[:6],
+            "bounds": list(src.bounds),
+            "res": list(src.res),
+            "nodata": src.nodata,
+            "dtype": src.dtypes[0],
+            "block_shape": list(src.block_shapes[0]),
+            "overviews": src.overviews(1),
+            "stats": {
+                "min": float(vmin) if count else None,
+                "max": float(vmax) if count else None,
+                "mean": float(mean),
+                "std": std,
+                "valid_pixels": int(count),
+            },
+        }
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    metadata["sha256"] = digest.hexdigest()
+    return metadata
+
+
+def load_metadata(path):
+    """Métadonnées du fichier annexe si elles correspondent encore au fichier, sinon None"""
+    try:
+        with open(sidecar_path(path), "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("version") != SIDECAR_VERSION or cached.get("signature") != file_signature(path):
+        return None
+    return cached["metadata"]
+
+
+def load_or_compute_metadata(path):
+    """Réutilise le fichier annexe si le MNT est inchangé, sinon recalcule et l'enregistre"""
+    metadata = load_metadata(path)
+    if metadata is not None:
+        return metadata, True
+
+    signature = file_signature(path)
+    metadata = compute_metadata(path)
+    payload = {"version": SIDECAR_VERSION, "signature": signature, "metadata": metadata}
+
+    tmp = f"{sidecar_path(path)}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+        os.replace(tmp, sidecar_path(path))
+    except OSError as e:
+        log.warning("fichier annexe non écrit : %s", e, extra={"fields": {"path": sidecar_path(path)}})
+    return metadata, False
+
+
+def _validate(path):
+    start = time.monotonic()
+    try:
+        metadata, cached = load_or_compute_metadata(path)
+    except Exception as e:
+        with _state_lock:
+            _state.update(status="error", error=str(e))
+        raise
+
+    with _state_lock:
+        _state.update(status="ok", metadata=metadata, error=None)
+
+    stats = metadata["stats"]
+    log.info("MNT valide", extra={"fields": {
+        "path": path, "origin": "fichier annexe" if cached else "calcul complet",
+        "duration_s": round(time.monotonic() - start, 2),
+        "width": metadata["width"], "height": metadata["height"],
+        "alt_min": round(stats["min"], 1) if stats["min"] is not None else None,
+        "alt_max": round(stats["max"], 1) if stats["max"] is not None else None}})
+    return metadata
+
+
+def validate(path, lazy=None):
+    """Valide le MNT au démarrage, de façon bloquante ou en arrière-plan"""
+    if lazy is None:
+        lazy = STARTUP_VALIDATION == "lazy"
+
+    with _state_lock:
+        _state.update(status="warming", metadata=None, error=None)
+
+    if not lazy:
+        return _validate(path)
+
+    def run():
+        try:
+            _validate(path)
+        except Exception as e:
+            log.error("échec de la validation du MNT : %s", e, extra={"fields": {"path": path}})
+
+    threading.Thread(target=run, name="dem-validation", daemon=True).start()
+    return None
+
+
+def validation_status():
+    """État de la validation : idle, warming, ok ou error"""
+    with _state_lock:
+        return dict(_state)
+
+
+def cached_checksum(path):
+    """SHA-256 du MNT depuis le fichier annexe (None s'il est absent ou périmé)"""
+    metadata = load_metadata(path)
+    return metadata["sha256"] if metadata else None
+
+
+if __name__ == "__main__":
+    # Pré-calcul du fichier annexe (ex. à la construction de l'image Docker)
+    import sys
+    from wps.metrics import configure_logging
+    configure_logging()
+    validate(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("DEM_PATH", "finale_optimized.tif"), lazy=False)
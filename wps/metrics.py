@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# ===== CONFIGURATION DES JOURNAUX ET MÉTRIQUES =====
+# Niveau des journaux : le détail par requête est au niveau DEBUG (rien n'est formaté au-dessus)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Format des journaux : "text" (clé=valeur) ou "json" (une ligne JSON par événement)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# Bornes (secondes) des histogrammes de latence
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Étapes chronométrées d'une requête
+STAGES = ("parse", "open", "sample", "stats", "serialize")
+
+LOGGER_NAME = "topoanalyse"
+
+
+class StructuredFormatter(logging.Formatter):
+    """Message suivi des champs passés dans `extra={"fields": {...}}`"""
+
+    def __init__(self, fmt="text"):
+        super().__init__()
+        self.fmt = fmt
+
+    def format(self, record):
+        fields = getattr(record, "fields", None) or {}
+        if self.fmt == "json":
+            document = {
+                "ts": round(record.created, 3),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                document["exc"] = self.formatException(record.exc_info)
+            return json.dumps(document, ensure_ascii=False, default=str)
+
+        line = f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Installe le handler des journaux de l'application (une seule fois par processus)"""
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(StructuredFormatter(fmt))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
+    return logger
+
+
+def get_logger(name):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class Histogram:
+    """Histogramme cumulatif au format Prometheus (bornes fixes)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Latences par processus et par étape, lectures raster ; agrégées par worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}
+        self.requests = {}
+        self.io = {}
+
+    def observe(self, process, stages, total, outcome):
+        with self._lock:
+            for stage, seconds in list(stages.items()) + [("total", total)]:
+                histogram = self.latency.get((process, stage))
+                if histogram is None:
+                    histogram = self.latency[(process, stage)] = Histogram()
+                histogram.observe(seconds)
+            self.requests[(process, outcome)] = self.requests.get((process, outcome), 0) + 1
+
+    def record_read(self, source, nbytes):
+        with self._lock:
+            reads, total = self.io.get(source, (0, 0))
+            self.io[source] = (reads + 1, total + nbytes)
+
+    def render(self, gauges=None):
+        """Exposition texte Prometheus ; `gauges` : {préfixe: dict de statistiques numériques}"""
+        lines = [
+            "# HELP topo_stage_seconds Durée des étapes de traitement par processus",
+            "# TYPE topo_stage_seconds histogram",
+        ]
+        with self._lock:
+            for (process, stage), h in sorted(self.latency.items()):
+                labels = f'process="{process}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'topo_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'topo_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f"topo_stage_seconds_sum{{{labels}}} {h.sum:.6f}")
+                lines.append(f"topo_stage_seconds_count{{{labels}}} {h.count}")
+
+            lines += ["# HELP topo_requests_total Requêtes traitées par processus et issue",
+                      "# TYPE topo_requests_total counter"]
+            for (process, outcome), count in sorted(self.requests.items()):
+                lines.append(f'topo_requests_total{{process="{process}",outcome="{outcome}"}} {count}')
+
+            lines += ["# HELP topo_raster_reads_total Lectures raster par source",
+                      "# TYPE topo_raster_reads_total counter",
+                      "# HELP topo_raster_read_bytes_total Octets lus dans les rasters par source",
+                      "# TYPE topo_raster_read_bytes_total counter"]
+            for source, (reads, nbytes) in sorted(self.io.items()):
+                lines.append(f'topo_raster_reads_total{{source="{source}"}} {reads}')
+                lines.append(f'topo_raster_read_bytes_total{{source="{source}"}} {nbytes}')
+
+        for prefix, stats in (gauges or {}).items():
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE topo_{prefix}_{key} gauge")
+                lines.append(f"topo_{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+_local = threading.local()
+
+
+def _after_fork_in_child():
+    # Tâche asynchrone forkée : ses mesures ne remontent pas au worker, on repart de zéro
+    global _metrics
+    _metrics = Metrics()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_metrics():
+    return _metrics
+
+
+def record_read(source, nbytes):
+    _metrics.record_read(source, nbytes)
+
+
+class RequestTimer:
+    """Chronomètre d'une requête : durée cumulée par étape, issue (ok, cached, error)"""
+
+    def __init__(self, process):
+        self.process = process
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.outcome = "ok"
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(process):
+    """Chronomètre la requête courante (thread) ; les étapes sont marquées par `stage()`"""
+    timer = RequestTimer(process)
+    previous = getattr(_local, "timer", None)
+    _local.timer = timer
+    try:
+        yield timer
+    except Exception:
+        timer.outcome = "error"
+        raise
+    finally:
+        _local.timer = previous
+        total = time.perf_counter() - timer.started
+        _metrics.observe(process, timer.stages, total, timer.outcome)
+        log = get_logger("timing")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("requête terminée", extra={"fields": {
+                "process": process, "outcome": timer.outcome, "total_ms": round(total * 1000, 2),
+                **{f"{k}_ms": round(v * 1000, 2) for k, v in timer.stages.items()}}})
+
+
+@contextmanager
+def stage(name):
+    """Ajoute la durée du bloc à l'étape `name` de la requête en cours (sans effet hors requête)"""
+    timer = getattr(_local, "timer", None)
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def current_timer():
+    return getattr(_local, "timer", None)
@@ -0,0 +1,466 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.coords import BoundingBox
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.errors import RasterioIOError
+from rasterio.windows import Window
+from shapely import STRtree
+from shapely.geometry import box
+from shapely.ops import unary_union
+
+from wps.metrics import get_logger
+
+# Nombre maximal de tuiles ouvertes par handle de mosaïque (les moins récemment lues sont fermées)
+MAX_OPEN_TILES = int(os.environ.get("DEM_MOSAIC_MAX_OPEN", "16"))
+# Extensions des tuiles reconnues dans un dossier
+TILE_EXTENSIONS = (".tif", ".tiff")
+# Rasters dérivés rangés à côté des tuiles, à ne pas prendre pour des tuiles
+DERIVED_SUFFIXES = ("_slope", "_aspect")
+# Côté maximal (pixels) des lectures réduites servant aux statistiques de la mosaïque
+STATS_SIZE = 256
+# Tolérance (en pixels) des arrondis de coordonnées
+EPSILON = 1e-6
+# Version du format de l'index enregistré (à incrémenter si son contenu change)
+INDEX_VERSION = 2
+
+log = get_logger("mosaic")
+
+
+def is_mosaic(path):
+    """MNT servi sous forme de mosaïque : dossier de tuiles ou VRT"""
+    return os.path.isdir(path) or path.lower().endswith(".vrt")
+
+
+def tileindex_path(path):
+    return f"{os.path.normpath(path)}.tiles.json"
+
+
+# ===== CONSTRUCTION DE L'INDEX =====
+
+def _tile_entry(path, rel):
+    """Emprise, résolution, CRS et overviews d'une tuile (lecture de l'en-tête seulement)"""
+    st = os.stat(path)
+    with rasterio.open(path) as src:
+        return {
+            "path": rel,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "bounds": list(src.bounds),
+            "res": list(src.res),
+            "crs": src.crs.to_wkt() if src.crs else None,
+            "overviews": src.overviews(1),
+        }
+
+
+def _tile_files(path):
+    """Tuiles d'un dossier, parcouru récursivement dans un ordre stable : (chemin, chemin relatif, stat)"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in TILE_EXTENSIONS or stem.endswith(DERIVED_SUFFIXES):
+                continue
+            full = os.path.join(root, name)
+            yield full, os.path.relpath(full, path), os.stat(full)
+
+
+def _vrt_sources(path):
+    """Fichiers sources d'un VRT (toutes bandes), chemins résolus"""
+    base = os.path.dirname(os.path.abspath(path))
+    sources = []
+    for filename in ET.parse(path).getroot().iter("SourceFilename"):
+        name = filename.text
+        if filename.get("relativeToVRT") == "1":
+            name = os.path.join(base, name)
+        sources.append(name)
+    return sources
+
+
+def mosaic_signature(path):
+    """Signature d'une mosaïque construite sur la liste des tuiles (chemin, taille, date de chaque tuile)
+
+    La date d'un dossier ne change que si un enfant direct est ajouté ou retiré : une tuile réécrite
+    sur place ou ajoutée dans un sous-dossier n'y apparaît pas. Pour un VRT, le fichier lui-même est
+    listé avec ses sources. `tiles` est le SHA-256 de la liste.
+    """
+    if os.path.isdir(path):
+        listing = [[rel, st.st_size, st.st_mtime_ns] for _, rel, st in _tile_files(path)]
+    else:
+        st = os.stat(path)
+        listing = [[os.path.basename(path), st.st_size, st.st_mtime_ns]]
+        for source in _vrt_sources(path):
+            try:
+                st = os.stat(source)
+                listing.append([source, st.st_size, st.st_mtime_ns])
+            except OSError:
+                listing.append([source, None, None])
+    return {
+        "size": sum(t[1] or 0 for t in listing),
+        "mtime_ns": max((t[2] or 0 for t in listing), default=0),
+        "tiles": hashlib.sha256(json.dumps(listing).encode("utf-8")).hexdigest(),
+    }
+
+
+def _scan_directory(path):
+    """Tuiles d'un dossier (récursif) ; seules les tuiles nouvelles ou modifiées sont ouvertes
+
+    L'index est enregistré à côté du dossier pour les démarrages suivants.
+    """
+    try:
+        with open(tileindex_path(path), "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        previous = {t["path"]: t for t in saved["tiles"]} if saved.get("version") == INDEX_VERSION else {}
+    except (OSError, ValueError, KeyError):
+        previous = {}
+
+    tiles = []
+    opened = 0
+    for full, rel, st in _tile_files(path):
+        entry = previous.get(rel)
+        if entry is None or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+            try:
+                entry = _tile_entry(full, rel)
+            except RasterioIOError as e:
+                log.warning("tuile illisible ignorée : %s", e, extra={"fields": {"tile": rel}})
+                continue
+            opened += 1
+        tiles.append(entry)
+
+    if opened or len(tiles) != len(previous):
+        tmp = f"{tileindex_path(path)}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": INDEX_VERSION, "tiles": tiles}, f)
+            os.replace(tmp, tileindex_path(path))
+        except OSError as e:
+            log.warning("impossible d'écrire l'index des tuiles : %s", e)
+    log.info("index des tuiles", extra={"fields": {"path": path, "tiles": len(tiles), "opened": opened}})
+    return tiles
+
+
+def _directory_grid(tiles):
+    """Grille virtuelle d'un dossier : CRS majoritaire, résolution la plus fine, union des emprises
+
+    L'origine est calée sur la grille de la tuile la plus fine : des tuiles jointives de même
+    résolution se lisent sans rééchantillonnage.
+    """
+    if not tiles:
+        return [], Affine.identity(), 0, 0, None
+    crs_counts = {}
+    for t in tiles:
+        crs_counts[t["crs"]] = crs_counts.get(t["crs"], 0) + 1
+    crs_wkt = max(crs_counts, key=crs_counts.get)
+    kept = [t for t in tiles if t["crs"] == crs_wkt]
+    if len(kept) < len(tiles):
+        log.warning("%d tuile(s) dans un autre CRS ignorée(s)", len(tiles) - len(kept))
+
+    finest = min(kept, key=lambda t: t["res"][0] * t["res"][1])
+    rx, ry = finest["res"]
+    left = min(t["bounds"][0] for t in kept)
+    bottom = min(t["bounds"][1] for t in kept)
+    right = max(t["bounds"][2] for t in kept)
+    top = max(t["bounds"][3] for t in kept)
+    left = finest["bounds"][0] - math.ceil((finest["bounds"][0] - left) / rx - EPSILON) * rx
+    top = finest["bounds"][3] + math.ceil((top - finest["bounds"][3]) / ry - EPSILON) * ry
+
+    width = max(1, math.ceil((right - left) / rx - EPSILON))
+    height = max(1, math.ceil((top - bottom) / ry - EPSILON))
+    # Les plus grossières d'abord : les tuiles fines recouvrent les grossières là où elles ont des données
+    kept.sort(key=lambda t: (-t["res"][0] * t["res"][1], t["path"]))
+    crs = CRS.from_wkt(crs_wkt) if crs_wkt else None
+    return kept, Affine(rx, 0.0, left, 0.0, -ry, top), width, height, crs
+
+
+def _parse_vrt(path):
+    """Tuiles et grille d'un VRT GDAL (sources de la bande 1), sans ouvrir les tuiles
+
+    Les sources sont peintes dans l'ordre du VRT, comme le fait GDAL.
+    """
+    root = ET.parse(path).getroot()
+    width, height = int(root.get("rasterXSize")), int(root.get("rasterYSize"))
+    gt = [float(v) for v in root.findtext("GeoTransform").split(",")]
+    transform = Affine.from_gdal(*gt)
+    srs = root.findtext("SRS")
+    crs = CRS.from_user_input(srs) if srs else None
+
+    band = next(b for b in root.iter("VRTRasterBand") if b.get("band", "1") == "1")
+    base = os.path.dirname(os.path.abspath(path))
+    tiles = []
+    for source in band:
+        filename = source.find("SourceFilename")
+        dst = source.find("DstRect")
+        if filename is None or dst is None:
+            continue
+        name = filename.text
+        if filename.get("relativeToVRT") == "1":
+            name = os.path.join(base, name)
+        x, y = float(dst.get("xOff")), float(dst.get("yOff"))
+        w, h = float(dst.get("xSize")), float(dst.get("ySize"))
+        left, top = transform * (x, y)
+        right, bottom = transform * (x + w, y + h)
+        src = source.find("SrcRect")
+        scale = (w / float(src.get("xSize")), h / float(src.get("ySize"))) if src is not None else (1.0, 1.0)
+        tiles.append({
+            "path": name,
+            "bounds": [min(left, right), min(bottom, top), max(left, right), max(bottom, top)],
+            "res": [abs(transform.a) * scale[0], abs(transform.e) * scale[1]],
+        })
+    return tiles, transform, width, height, crs
+
+
+class TileIndex:
+    """Index R-tree des emprises des tuiles et grille virtuelle de la mosaïque (partagés par le processus)"""
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.isdir(path):
+            tiles, self.transform, self.width, self.height, self.crs = _directory_grid(_scan_directory(path))
+            self.base = path
+        else:
+            tiles, self.transform, self.width, self.height, self.crs = _parse_vrt(path)
+            self.base = os.path.dirname(os.path.abspath(path))
+        if not tiles:
+            raise Exception(f"Aucune tuile dans la mosaïque : {path}")
+
+        self.tiles = tiles
+        # Facteurs présents dans au moins une tuile : chaque tuile sert une lecture réduite depuis son overview,
+        # ou à défaut par décimation (inconnus pour un VRT, dont les tuiles ne sont pas ouvertes à l'indexation)
+        self.overviews = sorted(set().union(*(t.get("overviews", []) for t in tiles)))
+        self.tree = STRtree([box(*t["bounds"]) for t in tiles])
+        self.res = (abs(self.transform.a), abs(self.transform.e))
+        left, top = self.transform.c, self.transform.f
+        self.bounds = BoundingBox(left, top - self.height * self.res[1], left + self.width * self.res[0], top)
+
+        self._lock = threading.Lock()
+        self.counters = {"tile_opens": 0, "tile_evictions": 0, "tile_reads": 0}
+
+    def tile_path(self, i):
+        return os.path.join(self.base, self.tiles[i]["path"])
+
+    def query(self, bounds):
+        """Tuiles dont l'emprise intersecte `bounds`, dans l'ordre de peinture"""
+        return sorted(int(i) for i in self.tree.query(box(*bounds)))
+
+    def footprint(self):
+        """Union des emprises des tuiles"""
+        return unary_union(list(self.tree.geometries))
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def stats(self):
+        with self._lock:
+            return {"tiles": len(self.tiles), **self.counters}
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    global _indexes_lock
+    _indexes_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_tile_index(path, signature=None):
+    """Index de la mosaïque, reconstruit si une tuile ou le VRT a changé
+
+    `signature` : celle du DEMManager (vérifiée à intervalle régulier), sinon recalculée.
+    """
+    signature = signature or mosaic_signature(path)
+    entry = _indexes.get(path)
+    if entry is None or entry[0] != signature:
+        with _indexes_lock:
+            entry = _indexes.get(path)
+            if entry is None or entry[0] != signature:
+                entry = _indexes[path] = (signature, TileIndex(path))
+    return entry[1]
+
+
+# ===== LECTURE =====
+
+class MosaicDEM:
+    """Mosaïque de tuiles vue comme un seul raster (sous-ensemble de l'API rasterio utilisé par les calculs)
+
+    Une lecture n'ouvre que les tuiles que la fenêtre intersecte (requête R-tree) ; les handles
+    restent ouverts dans un LRU borné. Chaque instance est prêtée à un seul thread à la fois par
+    le pool du DEMManager. Les valeurs NoData sont des NaN : `nodata` vaut None.
+    """
+
+    def __init__(self, path, max_open=MAX_OPEN_TILES, signature=None):
+        self.index = get_tile_index(path, signature)
+        self.name = path
+        self.width = self.index.width
+        self.height = self.index.height
+        self.transform = self.index.transform
+        self.crs = self.index.crs
+        self.res = self.index.res
+        self.bounds = self.index.bounds
+        self.nodata = None
+        self.count = 1
+        self.dtypes = ["float32"]
+        self.block_shapes = [(256, 256)]
+        self.max_open = max(1, max_open)
+        self._handles = OrderedDict()
+        self.closed = False
+
+    def window_transform(self, window):
+        return self.transform * Affine.translation(window.col_off, window.row_off)
+
+    def overviews(self, band):
+        return self.index.overviews
+
+    def _tile(self, i):
+        handle = self._handles.pop(i, None)
+        if handle is None:
+            handle = rasterio.open(self.index.tile_path(i))
+            self.index.count("tile_opens")
+            while len(self._handles) >= self.max_open:
+                _, oldest = self._handles.popitem(last=False)
+                oldest.close()
+                self.index.count("tile_evictions")
+        self._handles[i] = handle
+        return handle
+
+    def _paint(self, out, i, left, top, px, py):
+        """Copie dans `out` les pixels de la tuile i dont le centre tombe dans son emprise (plus proche voisin)"""
+        tl, tb, tr, tt = self.index.tiles[i]["bounds"]
+        h, w = out.shape
+        c0 = max(0, math.ceil((tl - left) / px - 0.5))
+        c1 = min(w, math.floor((tr - left) / px - 0.5) + 1)
+        r0 = max(0, math.ceil((top - tt) / py - 0.5))
+        r1 = min(h, math.floor((top - tb) / py - 0.5) + 1)
+        if c1 <= c0 or r1 <= r0:
+            return
+
+        src = self._tile(i)
+        t = src.transform
+        xs = left + (np.arange(c0, c1) + 0.5) * px
+        ys = top - (np.arange(r0, r1) + 0.5) * py
+        # Centre tombant sur un bord de pixel : pixel suivant, comme la décimation GDAL
+        cols = np.clip(np.floor((xs - t.c) / t.a + EPSILON).astype("int64"), 0, src.width - 1)
+        rows = np.clip(np.floor((ys - t.f) / t.e + EPSILON).astype("int64"), 0, src.height - 1)
+        col0, row0 = int(cols.min()), int(rows.min())
+        window = Window(col0, row0, int(cols.max()) - col0 + 1, int(rows.max()) - row0 + 1)
+
+        # Pixel de sortie couvrant plusieurs pixels de la tuile : lecture réduite (overviews de la tuile)
+        step = int(min(px / abs(t.a), py / abs(t.e)) + EPSILON)
+        if step >= 2:
+            out_h, out_w = -(-window.height // step), -(-window.width // step)
+            data = src.read(1, window=window, out_shape=(out_h, out_w), resampling=Resampling.nearest)
+            cols = (cols - col0) * out_w // window.width
+            rows = (rows - row0) * out_h // window.height
+        else:
+            data = src.read(1, window=window)
+            cols = cols - col0
+            rows = rows - row0
+        self.index.count("tile_reads")
+
+        values = data[np.ix_(rows, cols)].astype("float32")
+        if src.nodata is not None:
+            values[values == src.nodata] = np.nan
+        np.copyto(out[r0:r1, c0:c1], values, where=~np.isnan(values))
+
+    def read(self, indexes=1, window=None, out_shape=None, resampling=None, masked=False):
+        """Lecture fenêtrée sur la grille virtuelle ; avec `out_shape`, sous-échantillonnage au plus proche voisin"""
+        if window is None:
+            window = Window(0, 0, self.width, self.height)
+        h, w = out_shape[-2:] if out_shape is not None else (int(window.height), int(window.width))
+        left, top = self.transform * (window.col_off, window.row_off)
+        px = window.width * self.res[0] / w
+        py = window.height * self.res[1] / h
+
+        out = np.full((h, w), np.nan, dtype="float32")
+        for i in self.index.query((left, top - h * py, left + w * px, top)):
+            self._paint(out, i, left, top, px, py)
+        return np.ma.masked_invalid(out) if masked else out
+
+    def read_masks(self, indexes=1, window=None):
+        return np.where(np.isfinite(self.read(indexes, window)), 255, 0).astype("uint8")
+
+    def close(self):
+        for handle in self._handles.values():
+            handle.close()
+        self._handles.clear()
+        self.closed = True
+
+
+def open_mosaic(path, signature=None):
+    return MosaicDEM(path, signature=signature)
+
+
+# ===== MÉTADONNÉES =====
+
+def mosaic_metadata(path):
+    """Métadonnées de la mosaïque ; statistiques approchées sur une lecture réduite de chaque tuile
+
+    Le SHA-256 porte sur la liste des tuiles (chemin, taille, date) : il change avec n'importe quelle tuile.
+    """
+    signature = mosaic_signature(path)
+    index = get_tile_index(path, signature)
+    count = 0
+    total = 0.0
+    total_sq = 0.0
+    vmin = np.inf
+    vmax = -np.inf
+    for i, tile in enumerate(index.tiles):
+        with rasterio.open(index.tile_path(i)) as src:
+            scale = max(1, -(-max(src.width, src.height) // STATS_SIZE))
+            block = src.read(1, out_shape=(max(1, src.height // scale), max(1, src.width // scale)),
+                             resampling=Resampling.nearest, masked=True)
+        values = block.compressed().astype("float64")
+        if values.size == 0:
+            continue
+        # Chaque pixel lu représente scale² pixels de la tuile
+        count += values.size * scale * scale
+        total += values.sum() * scale * scale
+        total_sq += np.square(values).sum() * scale * scale
+        vmin = min(vmin, values.min())
+        vmax = max(vmax, values.max())
+
+    mean = total / count if count else 0.0
+    std = float(np.sqrt(max(total_sq / count - mean * mean, 0.0))) if count else 0.0
+    return {
+        "width": index.width,
+        "height": index.height,
+        "crs": index.crs.to_string() if index.crs else None,
+        "transform": list(index.transform)[:6],
+        "bounds": list(index.bounds),
+        "res": list(index.res),
+        "nodata": None,
+        "dtype": "float32",
+        "block_shape": [256, 256],
+        "overviews": index.overviews,
+        "tiles": len(index.tiles),
+        "stats": {
+            "min": float(vmin) if count else None,
+            "max": float(vmax) if count else None,
+            "mean": float(mean),
+            "std": std,
+            "valid_pixels": int(count),
+        },
+        "sha256": signature["tiles"],
+    }
+
+
+if __name__ == "__main__":
+    # Construction (ou mise à jour) de l'index des tuiles d'un dossier
+    import sys
+    from wps.metrics import configure_logging
+    configure_logging()
+    for source in sys.argv[1:] or [os.environ.get("DEM_PATH", "finale_optimized.tif")]:
+        log.info("mosaïque indexée", extra={"fields": {"path": source, **get_tile_index(source).stats()}})
@@ -0,0 +1,54 @@
+import os
+
+import rasterio
+from rasterio.enums import Resampling
+
+from wps.metrics import get_logger
+
+# Facteurs de réduction construits par défaut (pyramide interne du GeoTIFF)
+DEFAULT_FACTORS = [2, 4, 8, 16, 32, 64]
+# Niveau de détail automatique : False = toujours lire la pleine résolution
+LOD_ENABLED = os.environ.get("DEM_LOD", "1") == "1"
+
+log = get_logger("overviews")
+
+
+def build_overviews(path, factors=None, resampling=Resampling.average):
+    """Construit les overviews internes du MNT (équivalent de gdaladdo -r average)"""
+    factors = factors or DEFAULT_FACTORS
+    with rasterio.open(path, "r+") as dst:
+        existing = dst.overviews(1)
+        if existing:
+            log.info("overviews déjà présentes", extra={"fields": {"path": path, "factors": existing}})
+            return existing
+        # Inutile de descendre sous ~256 pixels de côté
+        size = min(dst.width, dst.height)
+        factors = [f for f in factors if size // f >= 256] or factors[:1]
+        log.info("construction des overviews", extra={"fields": {"path": path, "factors": factors}})
+        dst.build_overviews(factors, resampling)
+        dst.update_tags(ns="rio_overview", resampling=resampling.name)
+    log.info("overviews construites", extra={"fields": {"path": path, "factors": factors}})
+    return factors
+
+
+def select_overview(src, spacing):
+    """Facteur d'overview le plus grossier dont le pixel reste plus fin que l'espacement demandé
+
+    `spacing` est l'espacement entre échantillons, en unités du CRS du MNT.
+    Retourne 1 (pleine résolution) si aucune overview ne convient.
+    """
+    if not LOD_ENABLED or spacing is None or spacing <= 0:
+        return 1
+    pixel = min(abs(src.res[0]), abs(src.res[1]))
+    factor = 1
+    for f in src.overviews(1):
+        if f * pixel <= spacing:
+            factor = max(factor, f)
+    return factor
+
+
+if __name__ == "__main__":
+    import sys
+    from wps.metrics import configure_logging
+    configure_logging()
+    build_overviews(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("DEM_PATH", "finale_optimized.tif"))
@@ -0,0 +1,243 @@
+from pywps import ComplexInput, ComplexOutput, LiteralInput, Format
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+from array import array
+
+import numpy as np
+
+from wps.cache import get_result_cache
+from wps.dem import get_dem_manager
+from wps.encoding import POINT_FORMATS, encode_points, pack_points
+from wps.jobs import PooledProcess
+from wps.metrics import current_timer, get_logger, stage, timed
+from wps.profile_process import ELEVATION_RANGE, literal_value
+from wps.sampling import METHODS, sample_blocks
+
+log = get_logger("points")
+
+# Nombre maximal de points par requête
+MAX_POINTS = int(os.environ.get("POINTS_MAX", "1000000"))
+# Types MIME reconnus pour un fichier de points CSV
+CSV_MIMETYPES = ("text/csv", "application/csv")
+# Noms de colonnes reconnus dans l'en-tête d'un CSV (insensibles à la casse)
+X_COLUMNS = ("lon", "longitude", "lng", "x")
+Y_COLUMNS = ("lat", "latitude", "y")
+ID_COLUMNS = ("id", "nom", "name")
+
+
+# ===== LECTURE DES POINTS =====
+
+def _feature_points(geometry, fid, ids, coords):
+    kind = geometry.get("type")
+    if kind == "Point":
+        ids.append(fid)
+        coords.append(geometry["coordinates"][:2])
+    elif kind == "MultiPoint":
+        for k, c in enumerate(geometry["coordinates"]):
+            ids.append(f"{fid}-{k}")
+            coords.append(c[:2])
+    else:
+        raise Exception(f"Géométrie {fid} : Point ou MultiPoint attendu, {kind} reçu")
+
+
+def parse_points(geom_json):
+    """Points d'un Point/MultiPoint, d'une Feature ou d'une FeatureCollection
+
+    Retourne (identifiants, xs, ys) ; identifiants à None pour une géométrie seule (rang du point).
+    Les points d'une Feature MultiPoint sont identifiés par `<id>-<k>`.
+    """
+    kind = geom_json.get("type")
+    if kind in ("Feature", "FeatureCollection"):
+        features = geom_json.get("features", []) if kind == "FeatureCollection" else [geom_json]
+        ids, coords = [], []
+        for i, feature in enumerate(features):
+            props = feature.get("properties") or {}
+            _feature_points(feature.get("geometry") or {}, str(feature.get("id", props.get("id", i))), ids, coords)
+        coords = np.array(coords, dtype="float64").reshape(-1, 2)
+        return ids, coords[:, 0], coords[:, 1]
+    if kind == "Point":
+        return None, np.array([geom_json["coordinates"][0]], dtype="float64"), \
+            np.array([geom_json["coordinates"][1]], dtype="float64")
+    if kind == "MultiPoint":
+        coords = np.array([c[:2] for c in geom_json["coordinates"]], dtype="float64").reshape(-1, 2)
+        return None, coords[:, 0], coords[:, 1]
+    raise Exception(f"Point, MultiPoint, Feature ou FeatureCollection attendu, {kind} reçu")
+
+
+def _column_index(names, candidates, required=True):
+    for name in candidates:
+        if name in names:
+            return names.index(name)
+    if required:
+        raise Exception(f"Colonne {'/'.join(candidates)} absente de l'en-tête CSV")
+    return None
+
+
+def _is_number(value):
+    try:
+        float(value.replace(",", "."))
+        return True
+    except ValueError:
+        return False
+
+
+def read_csv_points(stream):
+    """Points d'un CSV texte, lu ligne à ligne
+
+    Avec en-tête : colonnes lon/lat (ou x/y) et id optionnel ; sans en-tête : x, y dans les deux
+    premières colonnes. Séparateur `,`, `;` ou tabulation ; virgule décimale acceptée avec `;`.
+    Retourne (identifiants ou None, xs, ys).
+    """
+    first = stream.readline()
+    if not first.strip():
+        raise Exception("CSV vide")
+    # `;` ou tabulation d'abord : une ligne en virgule décimale compte plus de `,` que de séparateurs
+    delimiter = next((d for d in ";\t" if d in first), ",")
+    header = next(csv.reader([first], delimiter=delimiter))
+    rows = csv.reader(stream, delimiter=delimiter)
+
+    ix, iy, iid = 0, 1, None
+    if len(header) >= 2 and _is_number(header[0]) and _is_number(header[1]):
+        rows = itertools.chain([header], rows)
+        number = 1
+    else:
+        names = [h.strip().lower() for h in header]
+        ix, iy = _column_index(names, X_COLUMNS), _column_index(names, Y_COLUMNS)
+        iid = _column_index(names, ID_COLUMNS, required=False)
+        number = 2
+
+    ids = [] if iid is not None else None
+    xs, ys = array("d"), array("d")
+    decimal_comma = delimiter == ";"
+    for number, row in enumerate(rows, number):
+        if not any(v.strip() for v in row):
+            continue
+        try:
+            x, y = row[ix], row[iy]
+            if decimal_comma:
+                x, y = x.replace(",", "."), y.replace(",", ".")
+            xs.append(float(x))
+            ys.append(float(y))
+        except (ValueError, IndexError):
+            raise Exception(f"Ligne {number} du CSV invalide : {delimiter.join(row)[:80]}")
+        if ids is not None:
+            ids.append(row[iid].strip())
+    return ids, np.frombuffer(xs), np.frombuffer(ys)
+
+
+def input_points(inp):
+    """Points d'une entrée WPS `points` : GeoJSON ou CSV selon le format déclaré"""
+    data_format = getattr(inp, "data_format", None)
+    if data_format is not None and data_format.mime_type in CSV_MIMETYPES:
+        return read_csv_points(io.StringIO(inp.data))
+    return parse_points(json.loads(inp.data))
+
+
+# ===== ALTITUDES =====
+
+def compute_points(ids, xs, ys, method="nearest", output_format="rows", dtype=None):
+    """Altitudes de points dispersés, sérialisées en JSON dans l'ordre d'entrée (avec cache de résultats)
+
+    Cœur de calcul partagé par le processus WPS `point_elevation` et la route REST /api/elevation.
+    Chaque bloc du MNT contenant des points est lu une seule fois. Avec `dtype` ("<f8" ou "<f4"),
+    les altitudes sont encodées directement au format binaire (bytes).
+    """
+    if method not in METHODS:
+        raise Exception(f"Méthode inconnue : {method} (attendu : {', '.join(METHODS)})")
+    if output_format not in POINT_FORMATS:
+        raise Exception(f"Format inconnu : {output_format} (attendu : {', '.join(POINT_FORMATS)})")
+    if len(xs) == 0:
+        raise Exception("Aucun point fourni")
+    if len(xs) > MAX_POINTS:
+        raise Exception(f"Trop de points : {len(xs)} (maximum {MAX_POINTS})")
+
+    cache = get_result_cache()
+    params = {"method": method, "format": output_format}
+    if dtype is not None:
+        params.update(format="binary", dtype=dtype)
+    # Coordonnées hachées sous forme binaire : coût négligeable devant l'échantillonnage, même à 100k+ points
+    cache_key = cache.points_key('point_elevation', xs, ys, ids, params)
+    cached = cache.get(cache_key, binary=dtype is not None)
+    if cached is not None:
+        timer = current_timer()
+        if timer is not None:
+            timer.outcome = "cached"
+        return cached
+
+    with get_dem_manager().dataset() as src, stage("sample"):
+        elevations, reads = sample_blocks(src, xs, ys, method)
+
+    with stage("stats"):
+        valid = np.isfinite(elevations) & (elevations > ELEVATION_RANGE[0]) & (elevations < ELEVATION_RANGE[1])
+        elevations[~valid] = np.nan
+        stats = {
+            "points": int(len(xs)),
+            "points_valides": int(valid.sum()),
+            "blocs_lus": reads
+        }
+        if valid.any():
+            stats.update(
+                alt_min=float(elevations[valid].min()),
+                alt_max=float(elevations[valid].max()),
+                alt_moy=float(elevations[valid].mean())
+            )
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("altitudes calculées", extra={"fields": {"method": method, **stats}})
+
+    with stage("serialize"):
+        if ids is None:
+            ids = [str(i) for i in range(len(xs))]
+        if dtype is not None:
+            data = pack_points(ids, xs, ys, elevations, stats, dtype)
+        else:
+            data = encode_points(ids, xs, ys, elevations, stats, output_format)
+    cache.put(cache_key, data)
+    return data
+
+
+class PointElevation(PooledProcess):
+    def __init__(self):
+        inputs = [
+            ComplexInput('points', 'Points : MultiPoint, Feature(Collection) de Point/MultiPoint, ou CSV',
+                         supported_formats=[Format('application/vnd.geo+json'), Format('text/csv')]),
+            LiteralInput('method', "Méthode d'interpolation", data_type='string',
+                         allowed_values=list(METHODS), default='nearest', min_occurs=0),
+            LiteralInput('format', 'Format du résultat : rows (liste de points) ou columns (tableaux)',
+                         data_type='string', allowed_values=POINT_FORMATS, default='rows', min_occurs=0)
+        ]
+        outputs = [ComplexOutput('elevations', 'Altitudes', supported_formats=[Format('application/json')])]
+
+        super(PointElevation, self).__init__(
+            self._handler,
+            identifier='point_elevation',
+            title='Altitude de points',
+            version='1.0',
+            inputs=inputs,
+            outputs=outputs
+        )
+
+    def _handler(self, request, response):
+        with timed(self.identifier) as timer:
+            return self._execute(request, response, timer)
+
+    def _execute(self, request, response, timer):
+        try:
+            with stage("parse"):
+                ids, xs, ys = input_points(request.inputs['points'][0])
+            response.outputs['elevations'].data = compute_points(
+                ids, xs, ys,
+                literal_value(request, 'method', 'nearest'),
+                literal_value(request, 'format', 'rows')
+            )
+            return response
+
+        except Exception as e:
+            timer.outcome = "error"
+            log.warning("échec du calcul des altitudes : %s", e, exc_info=log.isEnabledFor(logging.DEBUG))
+
+            response.outputs['elevations'].data = json.dumps({"error": str(e), "points": [], "stats": {}})
+            return response
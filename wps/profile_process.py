@@ -1,18 +1,213 @@
-import os
-from pywps import Process, ComplexInput, ComplexOutput, Format
+from pywps import ComplexInput, ComplexOutput, LiteralInput, Format
 import json
-import rasterio
-from shapely.geometry import shape, LineString
+import logging
+from shapely.geometry import shape
 import numpy as np
-from math import sqrt
 
-DEM_PATH = "finale_optimized.tif"
+from wps.cache import get_result_cache
+from wps.coverage import get_coverage_index
+from wps.dem import get_dem_manager
+from wps.encoding import PROFILE_FORMATS, encode_profile, pack_profile, profile_rows
+from wps.geodesy import DEFAULT_PRECISION, PRECISIONS, cumulative_distances, slope_series
+from wps.jobs import PooledProcess
+from wps.metrics import current_timer, get_logger, stage, timed
+from wps.overviews import select_overview
+from wps.sampling import (
+    METHODS, sample_positions, sample_spacing, points_per_pixel, sample_points
+)
+from wps.tracks import DEFAULT_SIMPLIFY_METHOD, SIMPLIFY_METHODS, input_geometry, simplify_line
 
-class ProfilTopo(Process):
+log = get_logger("profile")
+
+# Nombre de points par défaut (0 = un échantillon par pixel du MNT le long de la ligne)
+DEFAULT_NUM_POINTS = 100
+# Plage d'altitudes plausibles (au-delà : NoData ou valeur aberrante)
+ELEVATION_RANGE = (-1000, 9000)
+
+EMPTY_STATS = {
+    "distance_totale_m": 0,
+    "alt_max": 0,
+    "alt_min": 0,
+    "alt_moy": 0,
+    "denivele": 0,
+    "pente_moy_deg": 0,
+    "pente_moy_cumulee_deg": 0,
+    "pente_max_deg": 0,
+    "d_plus_m": 0,
+    "d_moins_m": 0,
+    "couverture_pct": 0
+}
+
+
+def literal_value(request, identifier, default):
+    """Valeur d'un LiteralInput optionnel"""
+    if identifier in request.inputs and request.inputs[identifier]:
+        return request.inputs[identifier][0].data
+    return default
+
+
+def resolve_num_points(src, line, num_points):
+    """Nombre d'échantillons effectif (0 = résolution native du MNT)"""
+    if num_points is None or int(num_points) <= 0:
+        return points_per_pixel(line, src.res)
+    return int(num_points)
+
+
+def profile_columns(xs, ys, elevations, crs=None, precision=DEFAULT_PRECISION, length_scale=1.0):
+    """Colonnes du profil (distance, x, y, elevation, slope) et statistiques à partir des échantillons
+
+    `length_scale` : rapport longueur d'origine / longueur simplifiée d'une trace simplifiée,
+    pour que les distances restent celles de la trace complète.
+    """
+    # Distances cumulées sur tous les échantillons (géodésiques, en mètres)
+    distances = cumulative_distances(xs, ys, crs, precision) * length_scale
+
+    valid = np.isfinite(elevations) & (elevations > ELEVATION_RANGE[0]) & (elevations < ELEVATION_RANGE[1])
+    ignored = int(len(elevations) - valid.sum())
+    if ignored:
+        log.debug("valeurs aberrantes ou NoData ignorées", extra={"fields": {"ignored": ignored}})
+
+    xs, ys, elevations, distances = xs[valid], ys[valid], elevations[valid], distances[valid]
+
+    if len(elevations) < 5:
+        raise Exception(f"Pas assez de points valides extraits ({len(elevations)}). La ligne est probablement en dehors de la zone couverte par le TIFF.")
+
+    # Pente de chaque segment, dénivelés cumulés
+    slopes, ascent, descent, max_slope = slope_series(distances, elevations)
+    # Pente moyenne : écart d'altitude entre les extrémités / distance totale (définition historique) ;
+    # pente moyenne cumulée : dénivelés positif et négatif cumulés / distance parcourue
+    pente_moy_deg = np.degrees(np.arctan(abs(elevations[-1] - elevations[0]) / max(distances[-1], 1)))
+    pente_moy_cumulee_deg = np.degrees(np.arctan((ascent + descent) / max(distances[-1] - distances[0], 1)))
+
+    stats = {
+        "distance_totale_m": float(distances[-1]),
+        "alt_max": float(elevations.max()),
+        "alt_min": float(elevations.min()),
+        "alt_moy": float(elevations.mean()),
+        "denivele": float(elevations.max() - elevations.min()),
+        "pente_moy_deg": float(pente_moy_deg),
+        "pente_moy_cumulee_deg": float(pente_moy_cumulee_deg),
+        "pente_max_deg": max_slope,
+        "d_plus_m": ascent,
+        "d_moins_m": descent
+    }
+    columns = {"distance": distances, "x": xs, "y": ys, "elevation": elevations, "slope": slopes}
+    return columns, stats
+
+
+def build_profile(xs, ys, elevations, crs=None, precision=DEFAULT_PRECISION):
+    """Construit le profil (liste de points) et ses statistiques à partir des échantillons"""
+    columns, stats = profile_columns(xs, ys, elevations, crs, precision)
+    return profile_rows(columns), stats
+
+
+def compute_profile(geom_json, num_points=DEFAULT_NUM_POINTS, method='nearest', lod=True, output_format='rows',
+                    precision=DEFAULT_PRECISION, clip=False, simplify_m=0.0, simplify_method=DEFAULT_SIMPLIFY_METHOD,
+                    dtype=None):
+    """Profil d'une ligne GeoJSON, sérialisé en JSON au format demandé (avec cache de résultats)
+
+    Cœur de calcul partagé par le processus WPS `profil_topo` et la route REST /api/profile.
+    Avec `dtype` ("<f8" ou "<f4"), les colonnes sont encodées directement au format binaire (bytes).
+    """
+    with stage("parse"):
+        line = shape(geom_json)
+        if line.geom_type != "LineString":
+            raise Exception(f"LineString attendue, {line.geom_type} reçue")
+        vertices = len(line.coords)
+    if simplify_method not in SIMPLIFY_METHODS:
+        raise Exception(f"Méthode de simplification inconnue : {simplify_method} "
+                        f"(attendu : {', '.join(SIMPLIFY_METHODS)})")
+
+    cache = get_result_cache()
+    params = {"num_points": num_points, "method": method, "lod": lod, "format": output_format,
+              "precision": precision, "clip": clip}
+    simplify_m = float(simplify_m or 0)
+    if simplify_m > 0:
+        # Clé de cache inchangée sans simplification
+        params.update(simplify_m=simplify_m, simplify_method=simplify_method)
+    if dtype is not None:
+        params.update(format="binary", dtype=dtype)
+    cache_key = cache.key('profil_topo', geom_json, params)
+    cached = cache.get(cache_key, binary=dtype is not None)
+    if cached is not None:
+        timer = current_timer()
+        if timer is not None:
+            timer.outcome = "cached"
+        return cached
+
+    # Index de couverture : rejet immédiat, sans lecture raster, d'une ligne hors du MNT
+    coverage = get_coverage_index()
+    covered = coverage.fraction(line)
+    if covered == 0:
+        raise Exception("La ligne est en dehors de la zone couverte par le MNT")
+    if covered < 1:
+        log.debug("ligne partiellement couverte par le MNT", extra={"fields": {"coverage_pct": round(covered * 100, 1)}})
+        if clip:
+            # Échantillons répartis entre le premier et le dernier point couverts
+            line = coverage.clip_line(line)
+
+    # Emprunter un handle au pool partagé (pas de réouverture par requête)
+    length_scale = 1.0
+    with get_dem_manager().dataset() as src:
+        if simplify_m > 0:
+            with stage("parse"):
+                geographic = src.crs is None or src.crs.is_geographic
+                simplified, _ = simplify_line(line, simplify_m, simplify_method, geographic)
+                if simplified.length > 0:
+                    length_scale = line.length / simplified.length
+                line = simplified
+        with stage("sample"):
+            # Positions calculées en une passe, une seule lecture de fenêtre
+            xs, ys = sample_positions(line, resolve_num_points(src, line, num_points))
+            # Profil long et peu dense : overview la plus grossière compatible avec l'espacement
+            factor = select_overview(src, sample_spacing(xs, ys)) if lod else 1
+            elevations = sample_points(src, xs, ys, method, factor)
+        crs = src.crs
+
+    with stage("stats"):
+        columns, stats = profile_columns(xs, ys, elevations, crs, precision, length_scale)
+        stats["couverture_pct"] = round(covered * 100, 1)
+        if simplify_m > 0:
+            stats["sommets"] = vertices
+            stats["sommets_simplifies"] = len(line.coords)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("profil calculé", extra={"fields": {"vertices": vertices, "points": len(xs),
+                                                       "method": method, "overview": factor, **stats}})
+
+    with stage("serialize"):
+        if dtype is not None:
+            data = pack_profile(columns, stats, dtype)
+        else:
+            data = encode_profile(columns, stats, output_format)
+    cache.put(cache_key, data)
+    return data
+
+
+class ProfilTopo(PooledProcess):
     def __init__(self):
-        inputs = [ComplexInput('line', 'Ligne', supported_formats=[Format('application/vnd.geo+json')])]
+        inputs = [
+            ComplexInput('line', 'Ligne', supported_formats=[Format('application/vnd.geo+json'),
+                                                             Format('application/gpx+xml')]),
+            LiteralInput('num_points', 'Nombre de points (0 = un par pixel du MNT)', data_type='integer',
+                         default=DEFAULT_NUM_POINTS, min_occurs=0),
+            LiteralInput('method', "Méthode d'interpolation", data_type='string',
+                         allowed_values=list(METHODS), default='nearest', min_occurs=0),
+            LiteralInput('lod', "Lire depuis l'overview adaptée à l'espacement des points", data_type='boolean',
+                         default=True, min_occurs=0),
+            LiteralInput('format', 'Format du profil : rows (liste de points), columns (tableaux), '
+                         'float32 (colonnes float32 en base64)', data_type='string',
+                         allowed_values=PROFILE_FORMATS, default='rows', min_occurs=0),
+            LiteralInput('precision', 'Calcul des distances : geodesic (ellipsoïde WGS84) ou haversine (sphère)',
+                         data_type='string', allowed_values=PRECISIONS, default=DEFAULT_PRECISION, min_occurs=0),
+            LiteralInput('clip', 'Restreindre la ligne à la partie couverte par le MNT', data_type='boolean',
+                         default=False, min_occurs=0),
+            LiteralInput('simplify_m', 'Tolérance de simplification de la trace (m, 0 = aucune)',
+                         data_type='float', default=0.0, min_occurs=0),
+            LiteralInput('simplify_method', 'Méthode de simplification de la trace', data_type='string',
+                         allowed_values=SIMPLIFY_METHODS, default=DEFAULT_SIMPLIFY_METHOD, min_occurs=0)
+        ]
         outputs = [ComplexOutput('profile', 'Profil', supported_formats=[Format('application/json')])]
-        
+
         super(ProfilTopo, self).__init__(
             self._handler,
             identifier='profil_topo',
@@ -23,130 +218,38 @@ class ProfilTopo(Process):
         )
 
     def _handler(self, request, response):
-        print("=== DEBUT CALCUL PROFIL ===")
-        
+        with timed(self.identifier) as timer:
+            return self._execute(request, response, timer)
+
+    def _execute(self, request, response, timer):
         try:
-            # Vérifier que le fichier existe
-            if not os.path.exists(DEM_PATH):
-                raise Exception(f"Fichier TIFF introuvable : {DEM_PATH}")
-            
-            file_size = os.path.getsize(DEM_PATH) / (1024*1024)
-            print(f"Fichier TIFF : {DEM_PATH} ({file_size:.2f} MB)")
-            
             # Lire la géométrie
-            geom_json = json.loads(request.inputs['line'][0].data)
-            print(f"GeoJSON reçu : {geom_json}")
-            
-            line = shape(geom_json)
-            coords = list(line.coords)
-            print(f"Ligne : {len(coords)} points")
-            print(f"Premier point : {coords[0]}")
-            print(f"Dernier point : {coords[-1]}")
-            
-            # Ouvrir le MNT
-            with rasterio.open(DEM_PATH) as src:
-                print(f"MNT ouvert : {src.width}x{src.height}")
-                print(f"CRS : {src.crs}")
-                print(f"Bounds : {src.bounds}")
-                
-                # Vérifier que la ligne est dans les limites du TIFF
-                bounds = src.bounds
-                for coord in coords:
-                    if not (bounds.left <= coord[0] <= bounds.right and 
-                           bounds.bottom <= coord[1] <= bounds.top):
-                        print(f"⚠️ ATTENTION : Point {coord} est en dehors des limites du TIFF")
-                        print(f"   Limites : X[{bounds.left}, {bounds.right}], Y[{bounds.bottom}, {bounds.top}]")
-                
-                # Échantillonner 100 points le long de la ligne
-                profile = []
-                num_points = 100
-                
-                for i in range(num_points):
-                    fraction = i / (num_points - 1)
-                    point = line.interpolate(fraction, normalized=True)
-                    
-                    try:
-                        # Lire l'altitude
-                        vals = list(src.sample([(point.x, point.y)]))
-                        elevation = float(vals[0][0])
-                        
-                        # Filtrer les valeurs NoData (souvent -9999 ou très négatives)
-                        if elevation > -1000 and elevation < 9000:
-                            # Calculer la distance réelle
-                            if i == 0:
-                                distance = 0.0
-                            else:
-                                prev_point = line.interpolate((i-1) / (num_points - 1), normalized=True)
-                                dx = point.x - prev_point.x
-                                dy = point.y - prev_point.y
-                                distance = profile[-1]["distance"] + sqrt(dx*dx + dy*dy) * 111320  # approximation m
-                            
-                            profile.append({
-                                "distance": float(distance),
-                                "x": float(point.x),
-                                "y": float(point.y),
-                                "elevation": float(elevation)
-                            })
-                        else:
-                            print(f"⚠️ Valeur aberrante ignorée : {elevation} au point {i}")
-                            
-                    except Exception as e:
-                        print(f"Erreur lecture point {i} : {e}")
-                        continue
-                
-                print(f"Points extraits : {len(profile)}")
-                
-                if len(profile) < 5:
-                    raise Exception(f"Pas assez de points valides extraits ({len(profile)}). La ligne est probablement en dehors de la zone couverte par le TIFF.")
-                
-                # Calculer les stats
-                elevations = [p["elevation"] for p in profile]
-                distances = [p["distance"] for p in profile]
-                
-                # Calculer la pente moyenne
-                if len(profile) > 1:
-                    total_elevation_change = abs(elevations[-1] - elevations[0])
-                    horizontal_distance = distances[-1]
-                    pente_moy_deg = np.degrees(np.arctan(total_elevation_change / max(horizontal_distance, 1)))
-                else:
-                    pente_moy_deg = 0.0
-                
-                stats = {
-                    "distance_totale_m": float(distances[-1]),
-                    "alt_max": float(max(elevations)),
-                    "alt_min": float(min(elevations)),
-                    "alt_moy": float(sum(elevations) / len(elevations)),
-                    "denivele": float(max(elevations) - min(elevations)),
-                    "pente_moy_deg": float(pente_moy_deg)
-                }
-                
-                result = {"profile": profile, "stats": stats}
-                
-                print("=== CALCUL REUSSI ===")
-                print(f"Stats : {stats}")
-                
-                response.outputs['profile'].data = json.dumps(result)
-                return response
-                
+            with stage("parse"):
+                geom_json = input_geometry(request.inputs['line'][0])
+            response.outputs['profile'].data = compute_profile(
+                geom_json,
+                literal_value(request, 'num_points', DEFAULT_NUM_POINTS),
+                literal_value(request, 'method', 'nearest'),
+                literal_value(request, 'lod', True),
+                literal_value(request, 'format', 'rows'),
+                literal_value(request, 'precision', DEFAULT_PRECISION),
+                literal_value(request, 'clip', False),
+                literal_value(request, 'simplify_m', 0.0),
+                literal_value(request, 'simplify_method', DEFAULT_SIMPLIFY_METHOD)
+            )
+            return response
+
         except Exception as e:
-            print(f"ERREUR CRITIQUE : {e}")
-            import traceback
-            traceback.print_exc()
-            
+            timer.outcome = "error"
+            log.warning("échec du calcul de profil : %s", e, exc_info=log.isEnabledFor(logging.DEBUG))
+
             # NE RETOURNEZ JAMAIS DE FAUSSES DONNÉES
             # Retournez une vraie erreur
             error_result = {
                 "error": str(e),
                 "profile": [],
-                "stats": {
-                    "distance_totale_m": 0,
-                    "alt_max": 0,
-                    "alt_min": 0,
-                    "alt_moy": 0,
-                    "denivele": 0,
-                    "pente_moy_deg": 0
-                }
+                "stats": dict(EMPTY_STATS)
             }
-            
+
             response.outputs['profile'].data = json.dumps(error_result)
-            return response
\ No newline at end of file
+            return response
@@ -0,0 +1,357 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlparse
+
+import rasterio
+import requests
+from rasterio.errors import RasterioError
+
+from wps.metadata import cached_checksum
+from wps.metrics import get_logger
+
+# ===== CONFIGURATION DU TÉLÉCHARGEMENT DU MNT =====
+GDRIVE_FILE_ID = "14O2amG5AhvbpmICM_GFiExO44TPVlKj8"
+# Sources essayées dans l'ordre (miroirs HTTP ou file://), séparées par des virgules
+DEFAULT_SOURCES = [s.strip() for s in os.environ.get(
+    "DEM_SOURCES",
+    f"https://drive.usercontent.google.com/download?id={GDRIVE_FILE_ID}&export=download&confirm=t"
+).split(",") if s.strip()]
+# SHA-256 publié du MNT ; à défaut, lu dans "<source>.sha256" s'il existe
+EXPECTED_SHA256 = os.environ.get("DEM_SHA256", "").strip().lower() or None
+# Nombre de requêtes Range simultanées et taille de chaque tranche
+DOWNLOAD_PARTS = int(os.environ.get("DOWNLOAD_PARTS", "8"))
+CHUNK_MB = int(os.environ.get("DOWNLOAD_CHUNK_MB", "8"))
+# Tentatives par tranche et délai de chaque requête (secondes)
+RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", "3"))
+TIMEOUT = float(os.environ.get("DOWNLOAD_TIMEOUT", "60"))
+
+USER_AGENT = "topoanalyse-provision/1.0"
+HASH_CHUNK = 4 * 1024 * 1024
+
+log = get_logger("provision")
+
+
+class ProvisionError(Exception):
+    """Téléchargement ou vérification du MNT impossible depuis une source"""
+
+
+def _local_path(url):
+    parsed = urlparse(url)
+    return unquote(parsed.path) if parsed.scheme == "file" else None
+
+
+def _session():
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+def probe(url, session):
+    """Taille, identifiant de version (ETag/Last-Modified) et support des requêtes Range d'une source"""
+    path = _local_path(url)
+    if path is not None:
+        if not os.path.exists(path):
+            raise ProvisionError(f"Fichier source introuvable : {path}")
+        st = os.stat(path)
+        return {"size": st.st_size, "version": f"{st.st_size}-{st.st_mtime_ns}", "ranges": True}
+
+    # GET d'un seul octet : suit les redirections et fonctionne là où HEAD est refusé
+    response = session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=TIMEOUT,
+                           allow_redirects=True)
+    try:
+        if response.status_code not in (200, 206):
+            raise ProvisionError(f"HTTP {response.status_code} sur {url}")
+        if "text/html" in response.headers.get("Content-Type", ""):
+            raise ProvisionError(f"La source a renvoyé une page HTML au lieu du fichier : {url}")
+        version = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if response.status_code == 206 and "/" in response.headers.get("Content-Range", ""):
+            total = response.headers["Content-Range"].rsplit("/", 1)[1]
+            if total.isdigit():
+                return {"size": int(total), "version": version, "ranges": True, "url": response.url}
+        size = response.headers.get("Content-Length")
+        return {"size": int(size) if size and size.isdigit() else None, "version": version, "ranges": False,
+                "url": response.url}
+    finally:
+        response.close()
+
+
+def published_checksum(url, session):
+    """SHA-256 publié à côté de la source ("<source>.sha256", format sha256sum), ou None"""
+    parsed = urlparse(url)
+    if parsed.query:
+        return None
+    try:
+        path = _local_path(url)
+        if path is not None:
+            with open(f"{path}.sha256", "r", encoding="utf-8") as f:
+                text = f.read()
+        else:
+            response = session.get(f"{url}.sha256", timeout=TIMEOUT)
+            if response.status_code != 200:
+                return None
+            text = response.text
+    except (OSError, requests.RequestException):
+        return None
+    token = text.split()[0].lower() if text.split() else ""
+    return token if len(token) == 64 and all(c in "0123456789abcdef" for c in token) else None
+
+
+class PartialDownload:
+    """Fichier partiel pré-alloué et tranches déjà reçues, persistées pour la reprise"""
+
+    def __init__(self, dest, info, chunk_size, sha256=None):
+        self.part = f"{dest}.part"
+        self.state_path = f"{dest}.part.json"
+        self.size = info["size"]
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+
+        # Avec un SHA-256 publié, le contenu est identifié par son empreinte : reprise possible depuis un
+        # autre miroir (vérifiée en fin de téléchargement). Sinon, par la version (ETag/Last-Modified)
+        # propre à la source : reprise depuis la même source seulement.
+        identity = {"size": self.size, "chunk_size": chunk_size}
+        if sha256:
+            identity["sha256"] = sha256
+        else:
+            identity["version"] = info.get("version")
+        state = self._load()
+        if state.get("identity") != identity or not os.path.exists(self.part):
+            # Fichier distant différent ou modifié : on repart de zéro
+            state = {"identity": identity, "done": []}
+            with open(self.part, "wb") as f:
+                f.truncate(self.size)
+        self.state = state
+        self.done = set(state["done"])
+
+    def _load(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def pending(self):
+        count = -(-self.size // self.chunk_size)
+        return [i for i in range(count) if i not in self.done]
+
+    def bounds(self, index):
+        start = index * self.chunk_size
+        return start, min(self.size, start + self.chunk_size) - 1
+
+    def write(self, index, data):
+        start, end = self.bounds(index)
+        if len(data) != end - start + 1:
+            raise ProvisionError(f"Tranche {index} incomplète : {len(data)} octets sur {end - start + 1}")
+        fd = os.open(self.part, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, start)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with self._lock:
+            self.done.add(index)
+            self.state["done"] = sorted(self.done)
+            tmp = f"{self.state_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.state_path)
+
+    def discard(self):
+        for path in (self.part, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _fetch_range(url, start, end, session):
+    path = _local_path(url)
+    if path is not None:
+        with open(path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+    response = session.get(url, headers={"Range": f"bytes={start}-{end}"}, timeout=TIMEOUT)
+    if response.status_code != 206:
+        raise ProvisionError(f"Requête Range refusée (HTTP {response.status_code})")
+    return response.content
+
+
+def _download_ranges(url, partial, parts):
+    """Télécharge les tranches manquantes en parallèle, chacune avec ses propres tentatives
+
+    Chaque thread a sa propre session HTTP : requests.Session n'est pas garantie sûre entre threads.
+    """
+    pending = partial.pending()
+    total = len(pending)
+    if len(partial.done):
+        log.info("reprise du téléchargement", extra={"fields": {"done": len(partial.done), "pending": total}})
+    progress = {"count": 0, "bytes": 0}
+    lock = threading.Lock()
+    started = time.monotonic()
+    local = threading.local()
+    sessions = []
+
+    def thread_session():
+        if not hasattr(local, "session"):
+            local.session = _session()
+            with lock:
+                sessions.append(local.session)
+        return local.session
+
+    def fetch(index):
+        start, end = partial.bounds(index)
+        for attempt in range(1, RETRIES + 1):
+            try:
+                partial.write(index, _fetch_range(url, start, end, thread_session()))
+                break
+            except (OSError, requests.RequestException, ProvisionError) as e:
+                if attempt == RETRIES:
+                    raise ProvisionError(f"Tranche {index} : {e}")
+                time.sleep(min(2 ** attempt, 10))
+        with lock:
+            progress["count"] += 1
+            progress["bytes"] += end - start + 1
+            if progress["count"] % max(1, total // 10) == 0 or progress["count"] == total:
+                rate = progress["bytes"] / max(time.monotonic() - started, 1e-6) / (1024 * 1024)
+                log.info("téléchargement en cours", extra={"fields": {
+                    "parts": progress["count"], "total": total, "rate_mb_s": round(rate, 1)}})
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, parts)) as executor:
+            # list() propage la première erreur ; les tranches reçues restent acquises pour la reprise
+            list(executor.map(fetch, pending))
+    finally:
+        for session in sessions:
+            session.close()
+
+
+def _download_stream(url, dest, session):
+    """Repli sans requêtes Range : un seul flux, sans reprise possible"""
+    part = f"{dest}.part"
+    log.warning("requêtes Range refusées par la source : téléchargement en un seul flux",
+                extra={"fields": {"url": url[:80]}})
+    with session.get(url, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code != 200:
+            raise ProvisionError(f"HTTP {response.status_code} sur {url}")
+        with open(part, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+    return part
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_structure(path):
+    """Le fichier s'ouvre avec GDAL ; premier, dernier et bloc médian lisibles, ainsi que l'overview la plus grossière"""
+    try:
+        with rasterio.open(path) as src:
+            if src.count < 1 or src.width == 0 or src.height == 0:
+                raise ProvisionError("Raster vide")
+            windows = [w for _, w in src.block_windows(1)]
+            for window in {0: windows[0], 1: windows[len(windows) // 2], 2: windows[-1]}.values():
+                src.read(1, window=window)
+            if src.overviews(1):
+                factor = src.overviews(1)[-1]
+                src.read(1, out_shape=(max(1, src.height // factor), max(1, src.width // factor)))
+            return {"width": src.width, "height": src.height, "overviews": src.overviews(1)}
+    except RasterioError as e:
+        raise ProvisionError(f"Structure GDAL invalide : {e}")
+
+
+def verify(path, sha256=None):
+    """Vérifie la structure GDAL et, si elle est publiée, l'empreinte SHA-256"""
+    info = check_structure(path)
+    if sha256:
+        actual = sha256_file(path)
+        if actual != sha256:
+            raise ProvisionError(f"SHA-256 inattendu : {actual} (publié : {sha256})")
+    return info
+
+
+def fetch(url, dest, sha256=None, parts=DOWNLOAD_PARTS, chunk_mb=CHUNK_MB):
+    """Télécharge une source vers `dest` : tranches parallèles, reprise, vérification, renommage atomique"""
+    session = _session()
+    info = probe(url, session)
+    sha256 = sha256 or published_checksum(url, session)
+    download_url = info.get("url") or url
+    size = info["size"]
+    log.info("téléchargement du MNT", extra={"fields": {
+        "url": url[:80], "size_mb": round(size / (1024 * 1024), 1) if size else None, "parts": parts}})
+
+    started = time.monotonic()
+    if info["ranges"] and size:
+        partial = PartialDownload(dest, info, chunk_mb * 1024 * 1024, sha256)
+        _download_ranges(download_url, partial, parts)
+        part = partial.part
+    else:
+        partial = None
+        part = _download_stream(download_url, dest, session)
+
+    try:
+        if size and os.path.getsize(part) != size:
+            raise ProvisionError(f"Taille inattendue : {os.path.getsize(part)} octets sur {size}")
+        log.info("vérification du MNT téléchargé", extra={"fields": {"sha256": bool(sha256)}})
+        details = verify(part, sha256)
+    except ProvisionError:
+        # Fichier complet mais corrompu : inutile de le reprendre
+        if partial is not None:
+            partial.discard()
+        elif os.path.exists(part):
+            os.remove(part)
+        raise
+
+    os.replace(part, dest)
+    if partial is not None and os.path.exists(partial.state_path):
+        os.remove(partial.state_path)
+    elapsed = time.monotonic() - started
+    log.info("MNT installé", extra={"fields": {
+        "path": dest, "width": details["width"], "height": details["height"], "duration_s": round(elapsed, 1)}})
+    return dest
+
+
+def provision(dest, sources=None, sha256=EXPECTED_SHA256, parts=DOWNLOAD_PARTS):
+    """Garantit un MNT valide à `dest`, en essayant les sources dans l'ordre ; True si c'est le cas"""
+    sources = sources or DEFAULT_SOURCES
+    if os.path.exists(dest):
+        try:
+            # Empreinte déjà calculée par wps.metadata : pas de relecture complète à chaque démarrage
+            if sha256 and cached_checksum(dest) == sha256:
+                check_structure(dest)
+            else:
+                verify(dest, sha256)
+            log.info("MNT déjà présent", extra={"fields": {
+                "path": dest, "size_mb": round(os.path.getsize(dest) / (1024 * 1024), 2)}})
+            return True
+        except ProvisionError as e:
+            log.warning("MNT présent invalide (%s) : nouveau téléchargement", e, extra={"fields": {"path": dest}})
+
+    for url in sources:
+        try:
+            fetch(url, dest, sha256, parts)
+            return True
+        except (ProvisionError, OSError, requests.RequestException) as e:
+            log.warning("échec du téléchargement : %s", e, extra={"fields": {"url": url[:80]}})
+    return False
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from wps.metrics import configure_logging
+
+    parser = argparse.ArgumentParser(description="Télécharge et vérifie le MNT")
+    parser.add_argument("dest", nargs="?", default=os.environ.get("DEM_PATH", "finale_optimized.tif"))
+    parser.add_argument("--source", action="append", help="URL http(s):// ou file:// (répétable)")
+    parser.add_argument("--sha256", default=EXPECTED_SHA256, type=str.lower)
+    parser.add_argument("--parts", type=int, default=DOWNLOAD_PARTS)
+    args = parser.parse_args()
+    configure_logging()
+    sys.exit(0 if provision(args.dest, args.source, args.sha256, args.parts) else 1)
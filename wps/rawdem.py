@@ -0,0 +1,156 @@
+import json
+import os
+
+import numpy as np
+import rasterio
+from affine import Affine
+from rasterio.coords import BoundingBox
+from rasterio.crs import CRS
+from rasterio.windows import Window
+
+from wps.metadata import file_signature
+from wps.metrics import get_logger
+
+# Mode de service du MNT : "gdal" (GeoTIFF via rasterio) ou "memmap" (tableau brut projeté en mémoire)
+SERVING_MODE = os.environ.get("DEM_SERVING", "gdal")
+# En-tête JSON de taille fixe : les données commencent sur une frontière de page
+HEADER_BYTES = 4096
+MAGIC = "TOPORAW1"
+# Hauteur (en lignes) des bandes lues pendant la conversion
+STRIP_ROWS = 512
+
+log = get_logger("rawdem")
+
+
+def raw_path(path):
+    return f"{path}.raw"
+
+
+def convert_to_raw(path, dest=None):
+    """Convertit un raster en tableau brut float32 little-endian (NoData -> NaN), lignes contiguës
+
+    L'en-tête contient le géoréférencement et la signature du fichier source.
+    """
+    dest = dest or raw_path(path)
+    with rasterio.open(path) as src:
+        header = {
+            "magic": MAGIC,
+            "width": src.width,
+            "height": src.height,
+            "dtype": "<f4",
+            "transform": list(src.transform)[:6],
+            "crs": src.crs.to_wkt() if src.crs else None,
+            "source": file_signature(path),
+        }
+        encoded = json.dumps(header).encode("utf-8")
+        if len(encoded) > HEADER_BYTES:
+            raise Exception("En-tête du MNT brut trop volumineux")
+
+        log.info("conversion en tableau brut", extra={"fields": {
+            "path": path, "dest": dest, "width": src.width, "height": src.height}})
+        tmp = f"{dest}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(encoded.ljust(HEADER_BYTES, b" "))
+            for row_off in range(0, src.height, STRIP_ROWS):
+                window = Window(0, row_off, src.width, min(STRIP_ROWS, src.height - row_off))
+                strip = src.read(1, window=window).astype("<f4")
+                if src.nodata is not None:
+                    strip[strip == src.nodata] = np.nan
+                f.write(strip.tobytes())
+    os.replace(tmp, dest)
+    log.info("MNT brut écrit", extra={"fields": {
+        "dest": dest, "size_mb": round(os.path.getsize(dest) / (1024 * 1024), 1)}})
+    return dest
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        header = json.loads(f.read(HEADER_BYTES))
+    if header.get("magic") != MAGIC:
+        raise Exception(f"{path} n'est pas un MNT brut")
+    return header
+
+
+class MemmapDEM:
+    """Raster brut projeté en mémoire, exposant le sous-ensemble de l'API rasterio utilisé par les calculs
+
+    Toutes les instances (threads, workers gunicorn) partagent les pages du cache système.
+    Les valeurs NoData sont déjà des NaN : `nodata` vaut None.
+    """
+
+    def __init__(self, path):
+        header = read_header(path)
+        self.name = path
+        self.width = header["width"]
+        self.height = header["height"]
+        self.transform = Affine(*header["transform"])
+        self.crs = CRS.from_wkt(header["crs"]) if header["crs"] else None
+        self.res = (abs(self.transform.a), abs(self.transform.e))
+        self.nodata = None
+        self.dtypes = ["float32"]
+        self.block_shapes = [(256, 256)]
+        self.source = header["source"]
+        self.array = np.memmap(path, dtype=header["dtype"], mode="r", offset=HEADER_BYTES,
+                               shape=(self.height, self.width))
+        self.closed = False
+
+        left, top = self.transform.c, self.transform.f
+        right = left + self.width * self.transform.a
+        bottom = top + self.height * self.transform.e
+        self.bounds = BoundingBox(min(left, right), min(bottom, top), max(left, right), max(bottom, top))
+
+    def window_transform(self, window):
+        return self.transform * Affine.translation(window.col_off, window.row_off)
+
+    def overviews(self, band):
+        return []
+
+    def read(self, indexes=1, window=None, out_shape=None, resampling=None, masked=False):
+        """Lecture fenêtrée ; avec `out_shape`, sous-échantillonnage au plus proche voisin"""
+        if window is None:
+            window = Window(0, 0, self.width, self.height)
+        r0, c0 = int(window.row_off), int(window.col_off)
+        h, w = int(window.height), int(window.width)
+
+        if out_shape is not None:
+            out_h, out_w = out_shape[-2:]
+            rows = r0 + ((np.arange(out_h) + 0.5) * h / out_h).astype("int64")
+            cols = c0 + ((np.arange(out_w) + 0.5) * w / out_w).astype("int64")
+            arr = self.array[np.ix_(rows, cols)]
+        else:
+            arr = np.array(self.array[r0:r0 + h, c0:c0 + w])
+        return np.ma.masked_invalid(arr) if masked else arr
+
+    def read_masks(self, indexes=1, window=None):
+        return np.where(np.isfinite(self.read(indexes, window)), 255, 0).astype("uint8")
+
+    def close(self):
+        self.array = None
+        self.closed = True
+
+
+def open_dataset(path, warn=True):
+    """Ouvre un raster : MNT brut projeté en mémoire si ce mode est actif et le fichier à jour, sinon GDAL
+
+    `warn=False` pour les rasters dérivés (pente, exposition) : sans copie brute, ils sont lus via GDAL
+    sans avertissement.
+    """
+    if SERVING_MODE == "memmap":
+        raw = raw_path(path)
+        if os.path.exists(raw):
+            dataset = MemmapDEM(raw)
+            if dataset.source == file_signature(path):
+                return dataset
+            dataset.close()
+            log.warning("MNT brut périmé (relancer python -m wps.rawdem) : lecture via GDAL", extra={"fields": {"path": raw}})
+        elif warn:
+            log.warning("MNT brut absent : lecture via GDAL", extra={"fields": {"path": raw}})
+    return rasterio.open(path)
+
+
+if __name__ == "__main__":
+    import sys
+    from wps.metrics import configure_logging
+    configure_logging()
+    for source in sys.argv[1:] or [os.environ.get("DEM_PATH", "finale_optimized.tif")]:
+        convert_to_raw(source)
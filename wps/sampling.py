@@ -0,0 +1,313 @@
+import math
+
+import numpy as np
+from affine import Affine
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from wps.metrics import record_read
+from wps.mosaic import MosaicDEM
+
+# Méthodes d'interpolation supportées et marge (en pixels) nécessaire autour des points
+METHODS = {"nearest": 0, "bilinear": 1, "cubic": 2}
+# Garde-fou : nombre maximal d'échantillons par profil
+MAX_POINTS = 200000
+# Taille maximale (en pixels) d'une fenêtre issue d'une fusion de lectures
+MAX_MERGED_PIXELS = 16 * 1024 * 1024
+# Taille minimale (pixels) d'un bloc lu : les blocs natifs plus petits (bandes) sont regroupés
+MIN_BLOCK_PIXELS = 256 * 256
+
+
+def line_vertices(line):
+    """Sommets de la ligne sous forme de tableaux NumPy (x, y)"""
+    coords = np.asarray(line.coords, dtype="float64")
+    return coords[:, 0], coords[:, 1]
+
+
+def points_per_pixel(line, res):
+    """Nombre d'échantillons pour avoir un point par pixel du MNT le long de la ligne"""
+    pixel = min(abs(res[0]), abs(res[1]))
+    return int(math.ceil(line.length / pixel)) + 1
+
+
+def sample_positions(line, num_points):
+    """Positions régulièrement espacées le long de la ligne, en une seule passe NumPy"""
+    num_points = max(2, min(int(num_points), MAX_POINTS))
+    vx, vy = line_vertices(line)
+
+    seg = np.hypot(np.diff(vx), np.diff(vy))
+    cum = np.concatenate(([0.0], np.cumsum(seg)))
+    targets = np.linspace(0.0, cum[-1], num_points)
+
+    # Segment contenant chaque position cible, puis interpolation linéaire dans ce segment
+    idx = np.clip(np.searchsorted(cum, targets, side="right") - 1, 0, len(seg) - 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.where(seg[idx] > 0, (targets - cum[idx]) / seg[idx], 0.0)
+
+    xs = vx[idx] + t * (vx[idx + 1] - vx[idx])
+    ys = vy[idx] + t * (vy[idx + 1] - vy[idx])
+    return xs, ys
+
+
+def bounds_window(src, bounds, pad=0):
+    """Fenêtre entière (bornée au raster) couvrant une emprise, avec une marge en pixels"""
+    left, bottom, right, top = bounds
+    inv = ~src.transform
+    cols, rows = inv * (np.array([left, right, left, right]), np.array([top, top, bottom, bottom]))
+
+    col_off = max(int(math.floor(cols.min())) - pad, 0)
+    row_off = max(int(math.floor(rows.min())) - pad, 0)
+    col_end = min(int(math.floor(cols.max())) + 1 + pad, src.width)
+    row_end = min(int(math.floor(rows.max())) + 1 + pad, src.height)
+
+    if col_end <= col_off or row_end <= row_off:
+        return None
+    return Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+
+def _source(src):
+    if isinstance(src, MosaicDEM):
+        return "mosaic"
+    return "memmap" if getattr(src, "array", None) is not None else "gdal"
+
+
+def _interpolate_mapped(src, xs, ys, method):
+    """Interpolation directe sur le MNT brut projeté en mémoire (pixels voisins de chaque point)"""
+    taps = (METHODS.get(method, 0) * 2) ** 2 or 1
+    record_read("memmap", len(xs) * taps * src.array.itemsize)
+    return interpolate(src.array, src.transform, xs, ys, method)
+
+
+def read_window(src, window, factor=1):
+    """Lit une fenêtre en un seul appel I/O ; NoData converti en NaN
+
+    Avec `factor` > 1 la fenêtre est lue sous-échantillonnée, ce qui permet à GDAL
+    de servir la lecture depuis l'overview correspondante.
+    """
+    transform = src.window_transform(window)
+    if factor > 1:
+        out_shape = (max(1, int(math.ceil(window.height / factor))),
+                     max(1, int(math.ceil(window.width / factor))))
+        arr = src.read(1, window=window, out_shape=out_shape, resampling=Resampling.nearest)
+        transform = transform * Affine.scale(window.width / out_shape[1], window.height / out_shape[0])
+    else:
+        arr = src.read(1, window=window)
+    record_read(_source(src), arr.nbytes)
+
+    arr = arr.astype("float64")
+    if src.nodata is not None:
+        arr[arr == src.nodata] = np.nan
+    return arr, transform
+
+
+def interpolate(arr, transform, xs, ys, method="nearest"):
+    """Valeurs du tableau aux coordonnées (xs, ys) ; NaN hors tableau ou sur NoData"""
+    if method not in METHODS:
+        raise Exception(f"Méthode d'interpolation inconnue : {method}")
+
+    cols, rows = ~transform * (np.asarray(xs, dtype="float64"), np.asarray(ys, dtype="float64"))
+    height, width = arr.shape
+    out = np.full(cols.shape, np.nan)
+
+    if method == "nearest":
+        c = np.floor(cols).astype("int64")
+        r = np.floor(rows).astype("int64")
+        inside = (c >= 0) & (c < width) & (r >= 0) & (r < height)
+        out[inside] = arr[r[inside], c[inside]]
+        return out
+
+    # Coordonnées relatives aux centres de pixels
+    cf = cols - 0.5
+    rf = rows - 0.5
+    c0 = np.floor(cf).astype("int64")
+    r0 = np.floor(rf).astype("int64")
+    tx = cf - c0
+    ty = rf - r0
+    inside = (cols >= 0) & (cols <= width) & (rows >= 0) & (rows <= height)
+
+    if method == "bilinear":
+        offsets = (0, 1)
+        wx = (1 - tx, tx)
+        wy = (1 - ty, ty)
+    else:
+        offsets = (-1, 0, 1, 2)
+        wx = _cubic_weights(tx)
+        wy = _cubic_weights(ty)
+
+    acc = np.zeros(cols.shape)
+    for j, dr in enumerate(offsets):
+        rr = np.clip(r0 + dr, 0, height - 1)
+        for i, dc in enumerate(offsets):
+            cc = np.clip(c0 + dc, 0, width - 1)
+            acc += wy[j] * wx[i] * arr[rr, cc]
+
+    out[inside] = acc[inside]
+    return out
+
+
+def _cubic_weights(t, a=-0.5):
+    """Poids de convolution cubique (Keys) pour les voisins -1, 0, 1, 2"""
+    d = (1 + t, t, 1 - t, 2 - t)
+    weights = []
+    for x in d:
+        near = ((a + 2) * x - (a + 3)) * x * x + 1
+        far = ((a * x - 5 * a) * x + 8 * a) * x - 4 * a
+        weights.append(np.where(x <= 1, near, far))
+    return weights
+
+
+def sample_spacing(xs, ys):
+    """Espacement moyen entre échantillons consécutifs (unités du CRS)"""
+    if len(xs) < 2:
+        return None
+    return float(np.hypot(np.diff(xs), np.diff(ys)).sum()) / (len(xs) - 1)
+
+
+def sample_points(src, xs, ys, method="nearest", factor=1):
+    """Échantillonne le MNT en lisant une seule fenêtre couvrant tous les points"""
+    xs = np.asarray(xs, dtype="float64")
+    ys = np.asarray(ys, dtype="float64")
+    bounds = (xs.min(), ys.min(), xs.max(), ys.max())
+
+    # MNT brut projeté en mémoire : interpolation directe, seules les pages touchées sont lues
+    if getattr(src, "array", None) is not None:
+        return _interpolate_mapped(src, xs, ys, method)
+
+    # Mosaïque : lecture par blocs, le coût suit les tuiles traversées et non l'emprise de la ligne
+    if isinstance(src, MosaicDEM):
+        return sample_blocks(src, xs, ys, method, factor)[0]
+
+    window = bounds_window(src, bounds, pad=METHODS.get(method, 0) * factor)
+    if window is None:
+        return np.full(xs.shape, np.nan)
+
+    arr, transform = read_window(src, window, factor)
+    return interpolate(arr, transform, xs, ys, method)
+
+
+def read_blocks(src):
+    """Hauteur et largeur des blocs lus : blocs natifs, bandes d'un GeoTIFF non tuilé regroupées"""
+    bh, bw = src.block_shapes[0]
+    return bh * max(1, MIN_BLOCK_PIXELS // (bh * bw)), bw
+
+
+def sample_blocks(src, xs, ys, method="nearest", factor=1):
+    """Échantillonne des points dispersés en lisant une fois chaque bloc du MNT qui en contient
+
+    Les points sont regroupés par bloc (tri sur l'indice du bloc), chaque bloc est lu avec la marge
+    nécessaire à l'interpolation, et les valeurs sont rangées dans l'ordre d'entrée. Avec `factor`
+    > 1, les blocs sont lus sous-échantillonnés (overviews) et couvrent `factor` fois plus de pixels.
+    Retourne (altitudes, nombre de blocs lus).
+    """
+    xs = np.asarray(xs, dtype="float64")
+    ys = np.asarray(ys, dtype="float64")
+
+    if getattr(src, "array", None) is not None:
+        return _interpolate_mapped(src, xs, ys, method), 0
+
+    pad = METHODS.get(method, 0) * factor
+    out = np.full(xs.shape, np.nan)
+    cols, rows = ~src.transform * (xs, ys)
+    inside = np.flatnonzero((cols >= 0) & (cols <= src.width) & (rows >= 0) & (rows <= src.height))
+    if inside.size == 0:
+        return out, 0
+
+    bh, bw = read_blocks(src)
+    bh, bw = bh * factor, bw * factor
+    per_row = -(-src.width // bw)
+    c = np.minimum(np.floor(cols[inside]).astype("int64"), src.width - 1)
+    r = np.minimum(np.floor(rows[inside]).astype("int64"), src.height - 1)
+    keys = (r // bh) * per_row + c // bw
+
+    order = np.argsort(keys, kind="stable")
+    inside, keys = inside[order], keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    ends = np.append(starts[1:], len(keys))
+
+    for start, end in zip(starts, ends):
+        block_row, block_col = divmod(int(keys[start]), per_row)
+        col_off = max(block_col * bw - pad, 0)
+        row_off = max(block_row * bh - pad, 0)
+        col_end = min((block_col + 1) * bw + pad, src.width)
+        row_end = min((block_row + 1) * bh + pad, src.height)
+        arr, transform = read_window(src, Window(col_off, row_off, col_end - col_off, row_end - row_off), factor)
+        members = inside[start:end]
+        out[members] = interpolate(arr, transform, xs[members], ys[members], method)
+
+    return out, len(starts)
+
+
+def _union(a, b):
+    col_off = min(a.col_off, b.col_off)
+    row_off = min(a.row_off, b.row_off)
+    col_end = max(a.col_off + a.width, b.col_off + b.width)
+    row_end = max(a.row_off + a.height, b.row_off + b.height)
+    return Window(col_off, row_off, col_end - col_off, row_end - row_off)
+
+
+def merge_windows(windows, slack=1.5):
+    """Regroupe des fenêtres tant que leur union ne lit pas beaucoup plus de pixels que leur somme
+
+    Retourne une liste de (fenêtre fusionnée, indices des fenêtres d'origine).
+    """
+    groups = [(w, [i]) for i, w in enumerate(windows) if w is not None]
+
+    merged = True
+    while merged and len(groups) > 1:
+        merged = False
+        for i in range(len(groups)):
+            for j in range(i + 1, len(groups)):
+                wi, ii = groups[i]
+                wj, ij = groups[j]
+                union = _union(wi, wj)
+                area = union.width * union.height
+                if area <= (wi.width * wi.height + wj.width * wj.height) * slack and area <= MAX_MERGED_PIXELS:
+                    groups[i] = (union, ii + ij)
+                    del groups[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return groups
+
+
+def sample_many(src, point_sets, method="nearest", slack=1.5, factors=None):
+    """Échantillonne plusieurs jeux de points avec le minimum de lectures raster
+
+    Les fenêtres ne sont fusionnées qu'entre jeux lus au même facteur d'overview.
+    Retourne (liste de tableaux d'altitudes, nombre de lectures effectuées).
+    """
+    pad = METHODS.get(method, 0)
+    factors = factors or [1] * len(point_sets)
+    results = [np.full(xs.shape, np.nan) for xs, _ in point_sets]
+    reads = 0
+
+    if getattr(src, "array", None) is not None:
+        return [_interpolate_mapped(src, xs, ys, method) for xs, ys in point_sets], 0
+
+    for factor in sorted(set(factors)):
+        members = [i for i, f in enumerate(factors) if f == factor]
+        if isinstance(src, MosaicDEM):
+            # Mosaïque : blocs partagés par tous les jeux de points, pas de fenêtre englobante
+            xs = np.concatenate([point_sets[i][0] for i in members])
+            ys = np.concatenate([point_sets[i][1] for i in members])
+            values, count = sample_blocks(src, xs, ys, method, factor)
+            bounds = np.cumsum([0] + [len(point_sets[i][0]) for i in members])
+            for k, i in enumerate(members):
+                results[i] = values[bounds[k]:bounds[k + 1]]
+            reads += count
+            continue
+        windows = [
+            bounds_window(src, (xs.min(), ys.min(), xs.max(), ys.max()), pad=pad * factor)
+            for xs, ys in (point_sets[i] for i in members)
+        ]
+        groups = merge_windows(windows, slack)
+        for window, indices in groups:
+            arr, transform = read_window(src, window, factor)
+            for k in indices:
+                xs, ys = point_sets[members[k]]
+                results[members[k]] = interpolate(arr, transform, xs, ys, method)
+        reads += len(groups)
+
+    return results, reads
@@ -1,15 +1,115 @@
-import os
-from pywps import Process, ComplexInput, ComplexOutput, Format
+from pywps import ComplexInput, ComplexOutput, LiteralInput, Format
 import json
-from shapely.geometry import shape
+import logging
+import math
+from shapely.geometry import LineString, shape
 import numpy as np
-from math import degrees, atan2
+from rasterio.features import geometry_mask
 
-DEM_PATH = "finale_optimized.tif"
+from wps.cache import get_result_cache
+from wps.coverage import get_coverage_index
+from wps.dem import get_dem_manager
+from wps.encoding import pack_solar
+from wps.jobs import PooledProcess
+from wps.irradiance import irradiance_along, parse_period
+from wps.metrics import current_timer, get_logger, stage, timed
+from wps.profile_process import literal_value
+from wps.sampling import bounds_window, read_window, sample_positions
+from wps.terrain import METERS_PER_DEGREE, terrain_available, terrain_paths
+from wps.tracks import (
+    DEFAULT_SIMPLIFY_METHOD, SIMPLIFY_METHODS, input_geometry, segment_vectors, simplify_indices, simplify_line
+)
 
-class SolarExposure(Process):
+# Nombre de classes d'exposition par défaut et largeur de la zone analysée autour de la ligne
+DEFAULT_BINS = 4
+DEFAULT_BUFFER_M = 50.0
+# En dessous de cette pente, le terrain est considéré comme plat (exposition non significative)
+FLAT_SLOPE_DEG = 2.0
+# Mode irradiation : nombre de points échantillonnés le long de la ligne
+DEFAULT_IRRADIANCE_POINTS = 50
+# Nombre maximal de pixels lus par requête (au-delà, lecture sous-échantillonnée)
+MAX_WINDOW_PIXELS = 4 * 1024 * 1024
+# Tolérance de la simplification préalable au masque de zone, en fraction du pixel lu
+PREPASS_PIXEL_FRACTION = 0.25
+
+# Modes de calcul : exposition du terrain seule, ou simulation d'ensoleillement en plus
+MODES = ['orientation', 'irradiance']
+
+log = get_logger("solar")
+
+BIN_LABELS = {
+    4: ["Nord", "Est", "Sud", "Ouest"],
+    8: ["Nord", "Nord-Est", "Est", "Sud-Est", "Sud", "Sud-Ouest", "Ouest", "Nord-Ouest"],
+}
+
+
+def bin_labels(bins):
+    """Libellés des classes d'exposition (centrées sur le nord)"""
+    if bins in BIN_LABELS:
+        return BIN_LABELS[bins]
+    width = 360.0 / bins
+    return [f"{(i * width - width / 2) % 360:.0f}°-{(i * width + width / 2) % 360:.0f}°" for i in range(bins)]
+
+
+def aspect_classes(aspect, bins):
+    """Indice de classe de chaque exposition (degrés depuis le nord), classes centrées sur le nord"""
+    width = 360.0 / bins
+    return (np.floor(((aspect + width / 2) % 360.0) / width).astype("int64")) % bins
+
+
+def solar_params(bins=DEFAULT_BINS, buffer_m=DEFAULT_BUFFER_M, mode='orientation', start_date=None,
+                 end_date=None, time_step_hours=1.0, day_step=1, num_points=DEFAULT_IRRADIANCE_POINTS,
+                 simplify_m=0.0, simplify_method=DEFAULT_SIMPLIFY_METHOD):
+    """Paramètres normalisés (bornés) du calcul d'exposition, qui forment aussi la clé de cache"""
+    if mode not in MODES:
+        raise Exception(f"Mode inconnu : {mode} (attendu : {', '.join(MODES)})")
+    if simplify_method not in SIMPLIFY_METHODS:
+        raise Exception(f"Méthode de simplification inconnue : {simplify_method} "
+                        f"(attendu : {', '.join(SIMPLIFY_METHODS)})")
+    params = {"bins": max(2, int(bins)), "buffer_m": max(0.0, float(buffer_m)), "mode": mode}
+    if simplify_m and float(simplify_m) > 0:
+        # Clé de cache inchangée sans simplification
+        params.update(simplify_m=float(simplify_m), simplify_method=simplify_method)
+    if mode == 'irradiance':
+        # Période résolue (année en cours par défaut) : la clé de cache change avec l'année
+        start, end = parse_period(start_date, end_date)
+        params.update(
+            start_date=start.isoformat(),
+            end_date=end.isoformat(),
+            time_step_hours=min(24.0, max(0.1, float(time_step_hours))),
+            day_step=max(1, int(day_step)),
+            num_points=max(2, int(num_points))
+        )
+    return params
+
+
+class SolarExposure(PooledProcess):
     def __init__(self):
-        inputs = [ComplexInput('line', 'Ligne', supported_formats=[Format('application/vnd.geo+json')])]
+        inputs = [
+            ComplexInput('line', 'Ligne', supported_formats=[Format('application/vnd.geo+json'),
+                                                             Format('application/gpx+xml')]),
+            LiteralInput('bins', "Nombre de classes d'exposition", data_type='integer',
+                         default=DEFAULT_BINS, min_occurs=0),
+            LiteralInput('buffer_m', 'Largeur de la zone analysée de part et d\'autre de la ligne (m)',
+                         data_type='float', default=DEFAULT_BUFFER_M, min_occurs=0),
+            LiteralInput('mode', "orientation (exposition) ou irradiance (simulation d'ensoleillement)",
+                         data_type='string', allowed_values=MODES,
+                         default='orientation', min_occurs=0),
+            LiteralInput('start_date', 'Début de la période (AAAA-MM-JJ, défaut : 1er janvier)',
+                         data_type='string', min_occurs=0),
+            LiteralInput('end_date', 'Fin de la période (AAAA-MM-JJ, défaut : 31 décembre)',
+                         data_type='string', min_occurs=0),
+            LiteralInput('time_step_hours', 'Pas de temps intra-journalier (heures)', data_type='float',
+                         default=1.0, min_occurs=0),
+            LiteralInput('day_step', 'Un jour simulé tous les N jours', data_type='integer',
+                         default=1, min_occurs=0),
+            LiteralInput('num_points', "Nombre de points le long de la ligne (mode irradiance)",
+                         data_type='integer', default=DEFAULT_IRRADIANCE_POINTS, min_occurs=0),
+            LiteralInput('simplify_m', 'Tolérance de simplification de la trace (m, 0 = aucune)',
+                         data_type='float', default=0.0, min_occurs=0),
+            LiteralInput('simplify_method', 'Méthode de simplification de la trace', data_type='string',
+                         allowed_values=SIMPLIFY_METHODS, default=DEFAULT_SIMPLIFY_METHOD, min_occurs=0)
+        ]
         outputs = [ComplexOutput('result', 'Result', supported_formats=[Format('application/json')])]
         
         super(SolarExposure, self).__init__(
@@ -21,54 +121,38 @@ class SolarExposure(Process):
             outputs=outputs
         )
 
-    def calculate_orientation(self, coords):
-        """Calcule l'orientation dominante de la ligne"""
+    def calculate_orientation(self, coords, weights=None):
+        """Calcule l'orientation dominante de la ligne (tous les segments en une passe NumPy)
+
+        `weights` : longueur d'origine représentée par chaque segment (trace simplifiée),
+        par défaut la longueur du segment lui-même.
+        """
         if len(coords) < 2:
             return "Sud", {"Sud": 100}
-        
-        # Calculer les segments et leurs orientations
+
+        coords = np.asarray(coords, dtype="float64")[:, :2]
+        dx, dy, lengths = segment_vectors(coords[:, 0], coords[:, 1])
+        if weights is None:
+            weights = lengths
+        # Éviter les segments de longueur nulle
+        valid = lengths >= 0.00001
+
+        # Angle en degrés (0° = Est, 90° = Nord) normalisé entre 0 et 360, puis classe par quadrant
+        angles = np.degrees(np.arctan2(dy[valid], dx[valid])) % 360
+        classes = np.floor(((angles - 45) % 360) / 90).astype("int64")
+        totals = np.bincount(classes, weights=np.asarray(weights)[valid], minlength=4)
+
         orientations = {"Nord": 0, "Sud": 0, "Est": 0, "Ouest": 0}
-        total_length = 0
-        
-        for i in range(len(coords) - 1):
-            x1, y1 = coords[i]
-            x2, y2 = coords[i + 1]
-            
-            # Calculer la longueur du segment
-            dx = x2 - x1
-            dy = y2 - y1
-            length = np.sqrt(dx**2 + dy**2)
-            
-            if length < 0.00001:  # Éviter division par zéro
-                continue
-            
-            # Calculer l'angle en degrés (0° = Est, 90° = Nord)
-            angle = degrees(atan2(dy, dx))
-            
-            # Normaliser l'angle entre 0 et 360
-            if angle < 0:
-                angle += 360
-            
-            # Classer par orientation
-            if 45 <= angle < 135:
-                orientations["Nord"] += length
-            elif 135 <= angle < 225:
-                orientations["Ouest"] += length
-            elif 225 <= angle < 315:
-                orientations["Sud"] += length
-            else:
-                orientations["Est"] += length
-            
-            total_length += length
-        
+        total_length = float(totals.sum())
+
         # Calculer les pourcentages
         if total_length > 0:
-            for key in orientations:
-                orientations[key] = round((orientations[key] / total_length) * 100, 1)
-        
+            for key, length in zip(["Nord", "Ouest", "Sud", "Est"], totals):
+                orientations[key] = round((float(length) / total_length) * 100, 1)
+
         # Trouver l'orientation dominante
         dominant = max(orientations.items(), key=lambda x: x[1])
-        
+
         return dominant[0], orientations
 
     def calculate_sun_exposure(self, dominant_orientation):
@@ -83,54 +167,190 @@ class SolarExposure(Process):
         
         return exposure_scores.get(dominant_orientation, 70)
 
-    def _handler(self, request, response):
-        print("=== DEBUT CALCUL SOLAR ===")
-        
-        try:
-            geom_json = json.loads(request.inputs['line'][0].data)
+    def calculate_terrain_exposure(self, line, bins, buffer_m):
+        """Exposition réelle du terrain (rasters de pente/exposition pré-calculés) autour de la ligne
+
+        Retourne (orientation dominante, pourcentages par classe, score, nombre de pixels).
+        """
+        slope_path, aspect_path = terrain_paths(get_dem_manager().path)
+
+        with get_dem_manager(aspect_path).dataset() as asrc, get_dem_manager(slope_path).dataset() as ssrc:
+            scale = METERS_PER_DEGREE if asrc.crs is not None and asrc.crs.is_geographic else 1.0
+            margin = buffer_m / scale
+            left, bottom, right, top = line.bounds
+
+            window = bounds_window(asrc, (left - margin, bottom - margin, right + margin, top + margin), pad=1)
+            if window is None:
+                raise Exception("La ligne est en dehors de la zone couverte par le MNT")
+            factor = max(1, int(math.ceil(math.sqrt(window.width * window.height / MAX_WINDOW_PIXELS))))
+
+            # Sommets plus serrés que le pixel lu : sans effet sur le masque, mais coûteux à tamponner
+            # et à rastériser (traces GPS denses) ; simplification au quart de pixel
+            with stage("parse"):
+                tolerance = PREPASS_PIXEL_FRACTION * min(abs(asrc.res[0]), abs(asrc.res[1])) * factor
+                coords = np.asarray(line.coords)[:, :2]
+                kept = simplify_indices(coords[:, 0], coords[:, 1], tolerance, geographic=False)
+                if len(kept) < len(coords):
+                    line = LineString(coords[kept])
+                zone = line.buffer(margin) if buffer_m > 0 else line
+
+            # Une lecture fenêtrée par raster, puis masque vectoriel de la zone
+            with stage("sample"):
+                aspect, transform = read_window(asrc, window, factor)
+                slope, _ = read_window(ssrc, window, factor)
+
+        with stage("stats"):
+            return self._terrain_classes(zone, aspect, slope, transform, bins)
+
+    def _terrain_classes(self, zone, aspect, slope, transform, bins):
+        inside = geometry_mask([zone], out_shape=aspect.shape, transform=transform,
+                               invert=True, all_touched=True)
+        valid = inside & np.isfinite(aspect) & np.isfinite(slope)
+        aspect = aspect[valid]
+        slope = slope[valid]
+        if aspect.size == 0:
+            raise Exception("Aucun pixel valide autour de la ligne")
+
+        flat = (slope < FLAT_SLOPE_DEG) | (aspect < 0)
+        labels = bin_labels(bins)
+        counts = np.bincount(aspect_classes(aspect[~flat], bins), minlength=bins)
+
+        orientations = {label: round(float(c) * 100 / aspect.size, 1) for label, c in zip(labels, counts)}
+        orientations["Plat"] = round(float(flat.sum()) * 100 / aspect.size, 1)
+
+        # Score moyen des pixels : classes cardinales (Sud=100 ... Nord=40), terrain plat=70
+        base = np.array([self.calculate_sun_exposure(label) for label in BIN_LABELS[4]], dtype="float64")
+        scores = np.where(flat, self.calculate_sun_exposure("Plat"), base[aspect_classes(aspect, 4)])
+        score = int(round(float(scores.mean())))
+
+        dominant = max(orientations.items(), key=lambda x: x[1])[0]
+        return dominant, orientations, score, int(aspect.size)
+
+    def compute(self, geom_json, params, binary=False):
+        """Exposition (et irradiation) d'une ligne GeoJSON, sérialisée en JSON (avec cache de résultats)
+
+        Cœur de calcul partagé par le processus WPS et la route REST /api/solar ;
+        `params` provient de solar_params(). Avec `binary`, le résultat est encodé par pack_solar (bytes).
+        """
+        with stage("parse"):
             line = shape(geom_json)
-            coords = list(line.coords)
-            
-            print(f"Ligne avec {len(coords)} points")
-            print(f"Coordonnées : {coords[:3]}...")  # Afficher les 3 premiers points
-            
-            # Calculer l'orientation réelle
-            dominant_orientation, orientations = self.calculate_orientation(coords)
+            vertices = len(line.coords)
+
+        bins, buffer_m, mode = params["bins"], params["buffer_m"], params["mode"]
+        terrain = terrain_available(get_dem_manager().path)
+        params = dict(params, terrain=terrain)
+        if binary:
+            params["format"] = "binary"
+
+        cache = get_result_cache()
+        cache_key = cache.key(self.identifier, geom_json, params)
+        cached = cache.get(cache_key, binary)
+        if cached is not None:
+            timer = current_timer()
+            if timer is not None:
+                timer.outcome = "cached"
+            return cached
+
+        # Index de couverture : rejet immédiat, sans lecture raster, d'une ligne hors du MNT
+        covered = get_coverage_index().fraction(line)
+        if covered == 0:
+            raise Exception("La ligne est en dehors de la zone couverte par le MNT")
+
+        # Trace simplifiée : chaque segment conserve la longueur d'origine qu'il remplace
+        weights = None
+        if "simplify_m" in params:
+            with get_dem_manager().dataset() as src:
+                geographic = src.crs is None or src.crs.is_geographic
+            with stage("parse"):
+                line, weights = simplify_line(line, params["simplify_m"], params["simplify_method"], geographic)
+        
+        if terrain:
+            # Exposition réelle du terrain autour de la ligne
+            dominant_orientation, orientations, final_score, pixels = \
+                self.calculate_terrain_exposure(line, bins, buffer_m)
+            sun_exposed_pct = orientations[dominant_orientation]
+            source = "terrain"
+        else:
+            # Repli : orientation 2D de la ligne (rasters dérivés absents)
+            log.debug("rasters pente/exposition absents : orientation de la ligne utilisée")
+            with stage("stats"):
+                dominant_orientation, orientations = self.calculate_orientation(line.coords, weights)
             sun_exposed_pct = round(orientations.get(dominant_orientation, 0), 1)
-            
+
             # Calculer le score d'ensoleillement
             base_score = self.calculate_sun_exposure(dominant_orientation)
-            
+
             # Ajuster le score selon le pourcentage de l'orientation dominante
             final_score = round((base_score * sun_exposed_pct / 100) * 0.7 + base_score * 0.3)
-            
-            # Créer l'histogramme (ne garder que les orientations > 0)
-            histogram = [
-                {"orientation": k, "pct": v}
-                for k, v in sorted(orientations.items(), key=lambda x: -x[1])
-                if v > 0
-            ]
-            
-            result = {
-                "dominant_orientation": dominant_orientation,
-                "sun_exposed_pct": sun_exposed_pct,
-                "score": final_score,
-                "histogram": histogram
-            }
-            
-            print(f"=== CALCUL SOLAR REUSSI ===")
-            print(f"Orientation dominante : {dominant_orientation}")
-            print(f"Répartition : {orientations}")
-            print(f"Score final : {final_score}")
-            
-            response.outputs['result'].data = json.dumps(result)
+            pixels = 0
+            source = "ligne"
+        
+        # Créer l'histogramme (ne garder que les orientations > 0)
+        histogram = [
+            {"orientation": k, "pct": v}
+            for k, v in sorted(orientations.items(), key=lambda x: -x[1])
+            if v > 0
+        ]
+        
+        result = {
+            "dominant_orientation": dominant_orientation,
+            "sun_exposed_pct": sun_exposed_pct,
+            "score": final_score,
+            "histogram": histogram,
+            "source": source,
+            "pixels": pixels,
+            "coverage_pct": round(covered * 100, 1)
+        }
+        if weights is not None:
+            result["sommets"] = vertices
+            result["sommets_simplifies"] = len(line.coords)
+
+        if mode == 'irradiance':
+            # Irradiation par ciel clair avec ombrage du relief, tables solaires en cache
+            with get_dem_manager().dataset() as src, stage("sample"):
+                xs, ys = sample_positions(line, params["num_points"])
+                result["irradiance"] = irradiance_along(
+                    src, xs, ys, params["start_date"], params["end_date"],
+                    params["time_step_hours"], params["day_step"]
+                )
+
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("exposition calculée", extra={"fields": {
+                "vertices": vertices, "source": source, "dominant": dominant_orientation,
+                "score": final_score, "mode": mode}})
+
+        with stage("serialize"):
+            data = pack_solar(result) if binary else json.dumps(result)
+        cache.put(cache_key, data)
+        return data
+
+    def _handler(self, request, response):
+        with timed(self.identifier) as timer:
+            return self._execute(request, response, timer)
+
+    def _execute(self, request, response, timer):
+        try:
+            with stage("parse"):
+                geom_json = input_geometry(request.inputs['line'][0])
+            params = solar_params(
+                literal_value(request, 'bins', DEFAULT_BINS),
+                literal_value(request, 'buffer_m', DEFAULT_BUFFER_M),
+                literal_value(request, 'mode', 'orientation'),
+                literal_value(request, 'start_date', None),
+                literal_value(request, 'end_date', None),
+                literal_value(request, 'time_step_hours', 1.0),
+                literal_value(request, 'day_step', 1),
+                literal_value(request, 'num_points', DEFAULT_IRRADIANCE_POINTS),
+                literal_value(request, 'simplify_m', 0.0),
+                literal_value(request, 'simplify_method', DEFAULT_SIMPLIFY_METHOD)
+            )
+            response.outputs['result'].data = self.compute(geom_json, params)
             return response
             
         except Exception as e:
-            print(f"ERREUR SOLAR: {e}")
-            import traceback
-            traceback.print_exc()
-            
+            timer.outcome = "error"
+            log.warning("échec du calcul d'exposition : %s", e, exc_info=log.isEnabledFor(logging.DEBUG))
+
             # Valeurs par défaut en cas d'erreur
             result = {
                 "dominant_orientation": "Erreur",
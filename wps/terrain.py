@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from wps.metrics import get_logger
+
+# Mètres par degré de latitude (approximation sphérique, cohérente avec les profils)
+METERS_PER_DEGREE = 111320
+# Valeur NoData des rasters dérivés
+TERRAIN_NODATA = -9999.0
+# Hauteur (en lignes) des bandes traitées pendant le pré-calcul
+STRIP_ROWS = 256
+
+log = get_logger("terrain")
+
+
+def terrain_paths(dem_path):
+    """Chemins des rasters de pente et d'exposition dérivés d'un MNT"""
+    stem, _ = os.path.splitext(dem_path)
+    return f"{stem}_slope.tif", f"{stem}_aspect.tif"
+
+
+def terrain_available(dem_path):
+    return all(os.path.exists(p) for p in terrain_paths(dem_path))
+
+
+def pixel_size_m(transform, crs, rows):
+    """Taille des pixels en mètres (dx par ligne, dy) ; dx dépend de la latitude en géographique"""
+    xres, yres = abs(transform.a), abs(transform.e)
+    if crs is not None and crs.is_geographic:
+        lats = transform.f + (np.asarray(rows, dtype="float64") + 0.5) * transform.e
+        dx = xres * METERS_PER_DEGREE * np.cos(np.radians(lats))
+        return dx, yres * METERS_PER_DEGREE
+    return np.full(len(rows), xres), yres
+
+
+def slope_aspect(arr, dx, dy):
+    """Pente (degrés) et exposition (degrés depuis le nord, sens horaire) par la méthode de Horn
+
+    `arr` comporte une marge d'un pixel tout autour ; `dx` donne la taille des pixels
+    (en mètres) pour chaque ligne intérieure. Les pixels plats ont une exposition de -1.
+    """
+    z = arr
+    a, b, c = z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:]
+    d, f = z[1:-1, :-2], z[1:-1, 2:]
+    g, h, i = z[2:, :-2], z[2:, 1:-1], z[2:, 2:]
+
+    dx = np.asarray(dx, dtype="float64").reshape(-1, 1)
+    dzdx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * dx)
+    dzdy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * dy)
+
+    slope = np.degrees(np.arctan(np.hypot(dzdx, dzdy)))
+    # Exposition : direction de la plus grande descente (0 = nord, 90 = est)
+    aspect = (np.degrees(np.arctan2(-dzdx, dzdy)) + 360.0) % 360.0
+    aspect = np.where((dzdx == 0) & (dzdy == 0), -1.0, aspect)
+    return slope, aspect
+
+
+def read_with_halo(src, window):
+    """Lit une fenêtre avec une marge d'un pixel (bords répliqués hors du raster)"""
+    col0 = max(window.col_off - 1, 0)
+    row0 = max(window.row_off - 1, 0)
+    col1 = min(window.col_off + window.width + 1, src.width)
+    row1 = min(window.row_off + window.height + 1, src.height)
+
+    arr = src.read(1, window=Window(col0, row0, col1 - col0, row1 - row0)).astype("float64")
+    if src.nodata is not None:
+        arr[arr == src.nodata] = np.nan
+
+    pad = (
+        (1 - (window.row_off - row0), 1 - (row1 - window.row_off - window.height)),
+        (1 - (window.col_off - col0), 1 - (col1 - window.col_off - window.width)),
+    )
+    return np.pad(arr, pad, mode="edge")
+
+
+def build_terrain_rasters(dem_path):
+    """Pré-calcule les rasters de pente et d'exposition (GeoTIFF tuilés), bande par bande"""
+    slope_path, aspect_path = terrain_paths(dem_path)
+
+    with rasterio.open(dem_path) as src:
+        profile = src.profile.copy()
+        profile.update(driver="GTiff", dtype="float32", count=1, nodata=TERRAIN_NODATA,
+                       tiled=True, blockxsize=256, blockysize=256, compress="deflate",
+                       predictor=3)
+
+        log.info("calcul pente/exposition", extra={"fields": {
+            "path": dem_path, "width": src.width, "height": src.height}})
+        with rasterio.open(slope_path + ".tmp", "w", **profile) as slope_dst, \
+                rasterio.open(aspect_path + ".tmp", "w", **profile) as aspect_dst:
+            for row_off in range(0, src.height, STRIP_ROWS):
+                window = Window(0, row_off, src.width, min(STRIP_ROWS, src.height - row_off))
+                arr = read_with_halo(src, window)
+                rows = np.arange(row_off, row_off + window.height)
+                dx, dy = pixel_size_m(src.transform, src.crs, rows)
+
+                slope, aspect = slope_aspect(arr, dx, dy)
+                invalid = ~np.isfinite(slope)
+                slope[invalid] = TERRAIN_NODATA
+                aspect[invalid] = TERRAIN_NODATA
+
+                slope_dst.write(slope.astype("float32"), 1, window=window)
+                aspect_dst.write(aspect.astype("float32"), 1, window=window)
+
+    os.replace(slope_path + ".tmp", slope_path)
+    os.replace(aspect_path + ".tmp", aspect_path)
+    log.info("rasters dérivés construits", extra={"fields": {"slope": slope_path, "aspect": aspect_path}})
+    return slope_path, aspect_path
+
+
+if __name__ == "__main__":
+    import sys
+    from wps.metrics import configure_logging
+    configure_logging()
+    build_terrain_rasters(sys.argv[1] if len(sys.argv) > 1 else os.environ.get("DEM_PATH", "finale_optimized.tif"))
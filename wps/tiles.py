@@ -0,0 +1,419 @@
+import math
+import os
+import shutil
+import struct
+import threading
+import zlib
+
+import numpy as np
+from rasterio.warp import transform as transform_coords
+from rasterio.warp import transform_bounds
+from shapely.geometry import box
+
+from wps.coverage import get_coverage_index
+from wps.dem import get_dem_manager
+from wps.metadata import signature_key
+from wps.metrics import get_logger, stage
+from wps.overviews import select_overview
+from wps.sampling import bounds_window, interpolate, read_window
+from wps.terrain import pixel_size_m, slope_aspect
+
+# ===== CONFIGURATION DES TUILES =====
+# Couches rendues par /tiles/<couche>/<z>/<x>/<y>.png
+LAYERS = ("hillshade", "slope", "elevation")
+TILE_SIZE = 256
+MIN_ZOOM = int(os.environ.get("TILE_MIN_ZOOM", "5"))
+MAX_ZOOM = int(os.environ.get("TILE_MAX_ZOOM", "14"))
+# Cache disque des tuiles rendues (par défaut sous le workdir PyWPS), taille maximale en MB
+CACHE_DIR = os.environ.get("TILE_CACHE_DIR", "")
+CACHE_MB = float(os.environ.get("TILE_CACHE_MB", "512"))
+# Après dépassement, les tuiles les moins récemment servies sont supprimées jusqu'à cette fraction
+LOW_WATERMARK = 0.9
+# Durée (s) de mise en cache côté navigateur
+MAX_AGE = int(os.environ.get("TILE_MAX_AGE", "86400"))
+# Garde-fou : pixels lus au plus pour une tuile (sous-échantillonnage supplémentaire au-delà)
+MAX_READ_PIXELS = 4 * 1024 * 1024
+# Version du rendu : à incrémenter si les rampes ou l'ombrage changent (invalide le cache)
+STYLE_VERSION = 1
+
+# Ombrage : soleil à l'ouest-nord-ouest, 45° au-dessus de l'horizon
+HILLSHADE_AZIMUTH = 315.0
+HILLSHADE_ALTITUDE = 45.0
+# Rampes de couleur : (valeur, (r, g, b))
+ELEVATION_RAMP = [
+    (0, (47, 120, 64)),
+    (600, (160, 190, 90)),
+    (1200, (232, 214, 125)),
+    (1800, (200, 140, 70)),
+    (2600, (140, 90, 60)),
+    (3400, (230, 225, 220)),
+    (4200, (255, 255, 255)),
+]
+SLOPE_RAMP = [
+    (0, (255, 255, 255)),
+    (10, (255, 237, 160)),
+    (20, (254, 178, 76)),
+    (30, (240, 59, 32)),
+    (45, (150, 0, 40)),
+    (60, (60, 0, 30)),
+]
+
+log = get_logger("tiles")
+
+
+# ===== RENDU =====
+
+def tile_lonlat(z, x, y, size=TILE_SIZE):
+    """Longitudes et latitudes des centres des pixels d'une tuile XYZ (Web Mercator)"""
+    n = 2 ** z
+    lons = (x + (np.arange(size) + 0.5) / size) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (y + (np.arange(size) + 0.5) / size) / n))))
+    return lons, lats
+
+
+def tile_bounds(z, x, y):
+    """Emprise (lon/lat) d'une tuile XYZ"""
+    n = 2 ** z
+    west, east = x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def colorize(values, ramp):
+    """RGBA (uint8) d'un tableau selon une rampe ; NaN transparent"""
+    stops = np.array([v for v, _ in ramp], dtype="float64")
+    colors = np.array([c for _, c in ramp], dtype="float64")
+    filled = np.nan_to_num(values, nan=stops[0])
+    rgba = np.empty(values.shape + (4,), dtype="uint8")
+    for channel in range(3):
+        rgba[..., channel] = np.interp(filled, stops, colors[:, channel])
+    rgba[..., 3] = np.where(np.isnan(values), 0, 255)
+    return rgba
+
+
+def hillshade(slope, aspect, azimuth=HILLSHADE_AZIMUTH, altitude=HILLSHADE_ALTITUDE):
+    """Ombrage (0-1) à partir de la pente et de l'exposition en degrés"""
+    zenith = math.radians(90.0 - altitude)
+    slope = np.radians(slope)
+    shade = (math.cos(zenith) * np.cos(slope)
+             + math.sin(zenith) * np.sin(slope) * np.cos(np.radians(azimuth - aspect)))
+    return np.clip(shade, 0.0, 1.0)
+
+
+def encode_png(rgba, level=6):
+    """PNG RGBA 8 bits (sans filtre de ligne)"""
+    height, width, _ = rgba.shape
+    raw = np.hstack([np.zeros((height, 1), dtype="uint8"), rgba.reshape(height, width * 4)]).tobytes()
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, level))
+            + chunk(b"IEND", b""))
+
+
+EMPTY_PNG = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype="uint8"))
+
+
+def _layer_values(layer, arr, transform, crs):
+    """Grille à échantillonner pour une couche (altitude, pente ou ombrage) sur la fenêtre lue"""
+    if layer == "elevation":
+        return arr
+    dx, dy = pixel_size_m(transform, crs, np.arange(arr.shape[0]))
+    slope, aspect = slope_aspect(np.pad(arr, 1, mode="edge"), dx, dy)
+    if layer == "slope":
+        return slope
+    return hillshade(slope, aspect)
+
+
+def render_tile(layer, z, x, y):
+    """PNG d'une tuile ; une seule lecture, dans l'overview adaptée au zoom
+
+    Les tuiles hors de la zone couverte sont transparentes, sans lecture du raster.
+    """
+    west, south, east, north = tile_bounds(z, x, y)
+    coverage = get_coverage_index()
+    with get_dem_manager().dataset() as src:
+        lons, lats = tile_lonlat(z, x, y)
+        lon_grid, lat_grid = np.meshgrid(lons, lats)
+        if src.crs is not None and not src.crs.is_geographic:
+            xs, ys = transform_coords("EPSG:4326", src.crs, lon_grid.ravel(), lat_grid.ravel())
+            xs, ys = np.reshape(xs, lon_grid.shape), np.reshape(ys, lat_grid.shape)
+            bounds = transform_bounds("EPSG:4326", src.crs, west, south, east, north)
+        else:
+            xs, ys = lon_grid, lat_grid
+            bounds = (west, south, east, north)
+
+        if not coverage.geometry.intersects(box(*bounds)):
+            return EMPTY_PNG
+        window = bounds_window(src, bounds, pad=2)
+        if window is None:
+            return EMPTY_PNG
+
+        # Pixel de tuile plus grossier que le MNT : lecture dans l'overview correspondante
+        spacing = min(bounds[2] - bounds[0], bounds[3] - bounds[1]) / TILE_SIZE
+        factor = select_overview(src, spacing)
+        factor = max(factor, math.ceil(math.sqrt(window.width * window.height / MAX_READ_PIXELS)))
+        with stage("sample"):
+            arr, transform = read_window(src, window, factor)
+        crs = src.crs
+
+    with stage("stats"):
+        values = _layer_values(layer, arr, transform, crs)
+        sampled = interpolate(values, transform, xs.ravel(), ys.ravel(), "bilinear").reshape(xs.shape)
+        if layer == "hillshade":
+            shade = np.nan_to_num(sampled, nan=0.0)
+            grey = (shade * 255).astype("uint8")
+            rgba = np.dstack([grey, grey, grey, np.where(np.isnan(sampled), 0, 255).astype("uint8")])
+        else:
+            rgba = colorize(sampled, ELEVATION_RAMP if layer == "elevation" else SLOPE_RAMP)
+
+    with stage("serialize"):
+        return encode_png(rgba)
+
+
+# ===== CACHE DISQUE =====
+
+class TileCache:
+    """Cache disque LRU des tuiles rendues, borné en taille, partagé par les workers
+
+    Les tuiles sont rangées par empreinte du MNT ; la date de modification d'un fichier sert de date
+    d'accès (mise à jour à chaque lecture) pour l'éviction.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=int(CACHE_MB * 1024 * 1024)):
+        self._root = root or None
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = None
+        self._signature = None
+        self._fingerprint = None
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "renders": 0,
+            "evictions": 0,
+        }
+
+    def root(self):
+        if self._root is None:
+            try:
+                from pywps import configuration
+                workdir = configuration.get_config_value("server", "workdir")
+            except Exception:
+                workdir = None
+            self._root = os.path.join(workdir or "/tmp/pywps", "tile_cache")
+        return self._root
+
+    def fingerprint(self):
+        """Empreinte du MNT servi et du style ; purge les tuiles d'un autre MNT si elle a changé"""
+        signature = get_dem_manager().signature()
+        with self._lock:
+            if signature == self._signature:
+                return self._fingerprint
+        fingerprint = f"{signature_key(signature)}-v{STYLE_VERSION}"
+
+        with self._lock:
+            changed = self._fingerprint is not None and fingerprint != self._fingerprint
+            self._signature = signature
+            self._fingerprint = fingerprint
+        if changed:
+            log.info("MNT modifié : cache de tuiles purgé")
+            self._purge(fingerprint)
+        return fingerprint
+
+    def _purge(self, current):
+        root = self.root()
+        if not os.path.isdir(root):
+            return
+        for name in os.listdir(root):
+            if name != current:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        with self._lock:
+            self._bytes = None
+
+    def path(self, fingerprint, layer, z, x, y):
+        return os.path.join(self.root(), fingerprint, layer, str(z), str(x), f"{y}.png")
+
+    def get(self, path):
+        """Contenu d'une tuile en cache (None si absente), sans lire le raster"""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        with self._lock:
+            self.counters["hits"] += 1
+        return data
+
+    def put(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.counters["renders"] += 1
+            if self._bytes is not None:
+                self._bytes += len(data)
+        if self._bytes is None or self._bytes > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Recense le cache (commun à tous les workers) et supprime les tuiles les plus anciennes"""
+        files = []
+        for dirpath, _, names in os.walk(self.root()):
+            for name in names:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime_ns, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+
+        evicted = 0
+        if total > self.max_bytes:
+            files.sort()
+            target = self.max_bytes * LOW_WATERMARK
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                evicted += 1
+            log.info("cache de tuiles réduit", extra={"fields": {"evicted": evicted, "bytes": total}})
+
+        with self._lock:
+            self._bytes = total
+            self.counters["evictions"] += evicted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                "bytes": self._bytes or 0,
+                "max_bytes": self.max_bytes,
+                "fingerprint": self._fingerprint,
+                "hit_ratio": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+                **self.counters,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _after_fork_in_child():
+    global _cache_lock
+    _cache_lock = threading.Lock()
+    if _cache is not None:
+        _cache._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_tile_cache():
+    """Retourne le cache de tuiles partagé par le processus"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TileCache()
+    return _cache
+
+
+def etag(fingerprint, layer, z, x, y):
+    """ETag d'une tuile : son contenu ne dépend que du MNT, du style et de sa position"""
+    return f"{fingerprint}-{layer}-{z}-{x}-{y}"
+
+
+# ===== PRÉ-GÉNÉRATION =====
+
+def tiles_covering(bounds, zooms):
+    """Tuiles XYZ intersectant une emprise lon/lat, pour chaque niveau de zoom"""
+    west, south, east, north = bounds
+    for z in zooms:
+        n = 2 ** z
+        x0 = max(0, int((west + 180.0) / 360.0 * n))
+        x1 = min(n - 1, int((east + 180.0) / 360.0 * n))
+        y0 = max(0, int((1 - math.asinh(math.tan(math.radians(north))) / math.pi) / 2 * n))
+        y1 = min(n - 1, int((1 - math.asinh(math.tan(math.radians(south))) / math.pi) / 2 * n))
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+def _seed_batch(batch):
+    """Rend un lot de tuiles absentes du cache (exécuté dans un processus du pool)"""
+    rendered = 0
+    for layer, z, x, y in batch:
+        cache = get_tile_cache()
+        path = cache.path(cache.fingerprint(), layer, z, x, y)
+        if os.path.exists(path):
+            continue
+        cache.put(path, render_tile(layer, z, x, y))
+        rendered += 1
+    return rendered
+
+
+def seed(layers, zooms, processes=None, batch_size=64):
+    """Pré-génère le cache pour des couches et niveaux de zoom, sur un pool de processus
+
+    Les tuiles voisines sont regroupées par lots (lectures proches dans le MNT pour un même processus).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    geometry = get_coverage_index().geometry
+    with get_dem_manager().dataset() as src:
+        bounds = geometry.bounds
+        if src.crs is not None and not src.crs.is_geographic:
+            bounds = transform_bounds(src.crs, "EPSG:4326", *bounds)
+
+    jobs = [(layer, z, x, y) for z, x, y in tiles_covering(bounds, zooms) for layer in layers]
+    processes = processes or os.cpu_count() or 1
+    # Au moins quelques lots par processus pour équilibrer la charge
+    batch_size = max(1, min(batch_size, -(-len(jobs) // (processes * 4))))
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    log.info("pré-génération du cache de tuiles", extra={"fields": {
+        "tiles": len(jobs), "zooms": f"{zooms[0]}-{zooms[-1]}", "layers": ",".join(layers), "batches": len(batches)}})
+
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        for i, count in enumerate(pool.map(_seed_batch, batches), 1):
+            rendered += count
+            if i % 10 == 0 or i == len(batches):
+                log.info("pré-génération en cours", extra={"fields": {
+                    "batches": i, "total": len(batches), "rendered": rendered}})
+    log.info("cache de tuiles pré-généré", extra={"fields": {"rendered": rendered, "present": len(jobs) - rendered}})
+    return rendered
+
+
+if __name__ == "__main__":
+    import argparse
+    from wps.metrics import configure_logging
+
+    parser = argparse.ArgumentParser(description="Pré-génération du cache de tuiles")
+    parser.add_argument("--layers", default=",".join(LAYERS))
+    parser.add_argument("--zoom", default=f"{MIN_ZOOM}-{min(MAX_ZOOM, 10)}", help="niveau ou plage (ex. 6-10)")
+    parser.add_argument("--processes", type=int, default=None, help="processus de rendu (défaut : nb. de CPU)")
+    args = parser.parse_args()
+
+    configure_logging()
+    lo, _, hi = args.zoom.partition("-")
+    layers = [layer for layer in args.layers.split(",") if layer]
+    unknown = [layer for layer in layers if layer not in LAYERS]
+    if unknown:
+        parser.error(f"couche(s) inconnue(s) : {', '.join(unknown)}")
+    seed(layers, list(range(int(lo), int(hi or lo) + 1)), args.processes)
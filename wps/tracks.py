@@ -0,0 +1,242 @@
+import io
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from array import array
+
+import numpy as np
+from shapely.geometry import LineString
+
+from wps.terrain import METERS_PER_DEGREE
+
+# Méthodes de simplification des traces (tolérance en mètres)
+SIMPLIFY_METHODS = ["douglas-peucker", "visvalingam"]
+DEFAULT_SIMPLIFY_METHOD = "douglas-peucker"
+# Types MIME reconnus pour une trace GPX
+GPX_MIMETYPES = ("application/gpx+xml", "application/gpx")
+# Taille des blocs lus sur le flux d'une trace téléversée
+CHUNK_BYTES = 1024 * 1024
+# Au-delà de cette taille (en KB), un corps GeoJSON REST est lu en flux plutôt que par json.loads
+STREAM_MIN_BYTES = int(os.environ.get("TRACK_STREAM_MIN_KB", "1024")) * 1024
+
+NUMBER = re.compile(rb"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+COORDINATES_KEY = re.compile(rb'"coordinates"\s*:\s*\[')
+# Octets gardés en fin de tampon pour ne pas couper la clé "coordinates" entre deux blocs
+KEY_MARGIN = 256
+
+
+# ===== LECTURE EN FLUX =====
+
+def read_gpx(stream):
+    """Points (lon, lat) des traces et routes d'un GPX, analysé en flux (éléments libérés au fil de l'eau)
+
+    Les segments successifs sont mis bout à bout.
+    """
+    xs, ys = array("d"), array("d")
+    for _, elem in ET.iterparse(stream, events=("end",)):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if tag in ("trkpt", "rtept"):
+            xs.append(float(elem.get("lon")))
+            ys.append(float(elem.get("lat")))
+            elem.clear()
+        elif tag in ("trkseg", "trk", "rte"):
+            elem.clear()
+    return np.column_stack([np.frombuffer(xs), np.frombuffer(ys)])
+
+
+def read_geojson(stream, chunk_bytes=CHUNK_BYTES):
+    """LineString GeoJSON (géométrie nue ou Feature) lue par blocs sur le flux : (squelette, coordonnées)
+
+    Le squelette est le document décodé avec son tableau `coordinates` vidé (type, Feature,
+    propriétés) ; ce tableau est décodé de façon vectorisée, sans construire les listes Python du
+    document. La clé étant repérée dans le flux d'octets, le squelette est validé : un seul tableau
+    `coordinates`, celui de la LineString. Tout autre document (FeatureCollection, plusieurs
+    géométries, clé `coordinates` dans les propriétés) est refusé explicitement.
+    """
+    skeleton = []
+    parts = []
+    arity = None
+    arrays = 0
+    buf = b""
+    inside = False
+    depth = 0
+    eof = False
+    while True:
+        if not inside:
+            match = COORDINATES_KEY.search(buf)
+            if match is None:
+                if eof:
+                    skeleton.append(buf)
+                    break
+                # La clé peut être coupée en fin de bloc : la fin du tampon est gardée
+                skeleton.append(buf[:-KEY_MARGIN])
+                buf = buf[-KEY_MARGIN:]
+            else:
+                skeleton.append(buf[:match.end() - 1] + b"[]")
+                buf = buf[match.end() - 1:]
+                inside = True
+                depth = 0
+                arrays += 1
+                if arrays > 1:
+                    raise Exception("Un seul tableau « coordinates » attendu : FeatureCollection, "
+                                    "géométries multiples ou propriété « coordinates » non prises en charge")
+                continue
+        else:
+            data = np.frombuffer(buf, dtype="uint8")
+            level = depth + np.cumsum((data == ord("[")).astype("int64") - (data == ord("]")))
+            closed = np.flatnonzero(level == 0)
+            ends = closed[:1] if closed.size else np.flatnonzero(data == ord("]"))[-1:]
+            if ends.size:
+                # Une coupure sur « ] » ne coupe jamais un nombre
+                cut = int(ends[0])
+                segment = buf[:cut + 1]
+                if arity is None:
+                    end = segment.find(b"]")
+                    arity = len(NUMBER.findall(segment[segment.rfind(b"[", 0, end):end]))
+                parts.append(np.array(NUMBER.findall(segment), dtype="float64"))
+                depth = int(level[cut])
+                buf = buf[cut + 1:]
+                if closed.size:
+                    inside = False
+                    continue
+            elif eof:
+                raise Exception("GeoJSON tronqué")
+        if eof:
+            raise Exception("GeoJSON tronqué")
+        chunk = stream.read(chunk_bytes)
+        eof = not chunk
+        buf += chunk
+
+    try:
+        document = json.loads(b"".join(skeleton))
+    except ValueError:
+        raise Exception("GeoJSON invalide")
+    geometry = document.get("geometry") if isinstance(document, dict) and document.get("type") == "Feature" \
+        else document
+    if not isinstance(geometry, dict) or geometry.get("type") != "LineString":
+        raise Exception("LineString attendue (géométrie ou Feature)")
+    # Le tableau vidé doit être celui de la géométrie, pas une clé homonyme ailleurs dans le document
+    if not arrays or geometry.get("coordinates") != []:
+        raise Exception("Coordonnées de la LineString introuvables")
+    values = np.concatenate(parts)
+    if not arity or values.size % arity:
+        raise Exception("Coordonnées GeoJSON invalides")
+    return document, values.reshape(-1, arity)[:, :2]
+
+
+def read_track(stream, mimetype=None):
+    """Géométrie GeoJSON LineString d'une trace GPX ou d'un document GeoJSON lu en flux
+
+    Pour un GeoJSON, le document est rendu tel quel (géométrie nue ou Feature), coordonnées replacées.
+    """
+    if mimetype in GPX_MIMETYPES:
+        return {"type": "LineString", "coordinates": read_gpx(stream)}
+    document, coords = read_geojson(stream)
+    geometry = document["geometry"] if document.get("type") == "Feature" else document
+    geometry["coordinates"] = coords
+    return document
+
+
+def input_geometry(inp):
+    """Géométrie d'une entrée WPS `line` : GeoJSON ou GPX selon le format déclaré"""
+    # Entrées construites hors PyWPS (bench, appels directs) : sans format déclaré
+    data_format = getattr(inp, "data_format", None)
+    if data_format is not None and data_format.mime_type in GPX_MIMETYPES:
+        return read_track(io.BytesIO(inp.data.encode("utf-8") if isinstance(inp.data, str) else inp.data),
+                          data_format.mime_type)
+    return json.loads(inp.data)
+
+
+# ===== SEGMENTS ET SIMPLIFICATION =====
+
+def segment_vectors(xs, ys):
+    """Composantes et longueurs de tous les segments (unités du CRS)"""
+    dx = np.diff(xs)
+    dy = np.diff(ys)
+    return dx, dy, np.hypot(dx, dy)
+
+
+def metric_coords(xs, ys, geographic):
+    """Coordonnées planes approchées en mètres (équirectangulaire locale si géographique)"""
+    if not geographic:
+        return xs, ys
+    scale = np.cos(np.radians(np.mean(ys)))
+    return xs * scale * METERS_PER_DEGREE, ys * METERS_PER_DEGREE
+
+
+def douglas_peucker(xs, ys, tolerance):
+    """Indices des sommets conservés (écart perpendiculaire maximal ≤ tolérance), sans récursion"""
+    n = len(xs)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, n - 1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        dx, dy = xs[j] - xs[i], ys[j] - ys[i]
+        px, py = xs[i + 1:j] - xs[i], ys[i + 1:j] - ys[i]
+        norm = np.hypot(dx, dy)
+        dist = np.abs(px * dy - py * dx) / norm if norm > 0 else np.hypot(px, py)
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            m = i + 1 + k
+            keep[m] = True
+            stack.append((i, m))
+            stack.append((m, j))
+    return np.flatnonzero(keep)
+
+
+def _alternate(mask):
+    """Dans chaque suite de True consécutifs, ne garde qu'un élément sur deux"""
+    idx = np.arange(len(mask))
+    starts = np.where(mask & ~np.concatenate(([False], mask[:-1])), idx, 0)
+    return mask & ((idx - np.maximum.accumulate(starts)) % 2 == 0)
+
+
+def visvalingam(xs, ys, tolerance):
+    """Indices des sommets conservés (aire effective ≥ tolérance²), par passes vectorisées
+
+    À chaque passe, les sommets d'aire minimale locale sous le seuil sont retirés (jamais deux
+    voisins à la fois), puis les aires sont recalculées.
+    """
+    threshold = tolerance * tolerance
+    idx = np.arange(len(xs))
+    while len(idx) > 2:
+        x0, x1, x2 = xs[idx[:-2]], xs[idx[1:-1]], xs[idx[2:]]
+        y0, y1, y2 = ys[idx[:-2]], ys[idx[1:-1]], ys[idx[2:]]
+        area = 0.5 * np.abs((x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0))
+        left = np.concatenate(([np.inf], area[:-1]))
+        right = np.concatenate((area[1:], [np.inf]))
+        remove = _alternate((area < threshold) & (area <= left) & (area <= right))
+        if not remove.any():
+            break
+        idx = np.concatenate(([idx[0]], idx[1:-1][~remove], [idx[-1]]))
+    return idx
+
+
+def simplify_indices(xs, ys, tolerance_m, method=DEFAULT_SIMPLIFY_METHOD, geographic=True):
+    """Indices des sommets conservés par la simplification (tolérance en mètres)"""
+    if method not in SIMPLIFY_METHODS:
+        raise Exception(f"Méthode de simplification inconnue : {method} (attendu : {', '.join(SIMPLIFY_METHODS)})")
+    if len(xs) < 3 or tolerance_m <= 0:
+        return np.arange(len(xs))
+    mx, my = metric_coords(xs, ys, geographic)
+    if method == "visvalingam":
+        return visvalingam(mx, my, tolerance_m)
+    return douglas_peucker(mx, my, tolerance_m)
+
+
+def simplify_line(line, tolerance_m, method=DEFAULT_SIMPLIFY_METHOD, geographic=True):
+    """Ligne simplifiée et longueur d'origine représentée par chacun de ses segments
+
+    Les poids (longueurs cumulées de la trace entre deux sommets conservés) préservent la longueur
+    totale et sa répartition dans les statistiques calculées sur la ligne simplifiée.
+    """
+    coords = np.asarray(line.coords)[:, :2]
+    xs, ys = coords[:, 0], coords[:, 1]
+    kept = simplify_indices(xs, ys, tolerance_m, method, geographic)
+    cum = np.concatenate(([0.0], np.cumsum(segment_vectors(xs, ys)[2])))
+    weights = np.diff(cum[kept])
+    return LineString(coords[kept]), weights
@@ -0,0 +1,282 @@
+from pywps import ComplexInput, ComplexOutput, LiteralInput, Format
+import json
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from rasterio.features import geometry_mask
+from rasterio.windows import Window
+from shapely import clip_by_rect, prepare
+from shapely.geometry import box, mapping
+
+from wps.batch_profile import parse_features
+from wps.cache import get_result_cache
+from wps.coverage import get_coverage_index
+from wps.dem import get_dem_manager
+from wps.jobs import PooledProcess
+from wps.metrics import get_logger, stage, timed
+from wps.profile_process import ELEVATION_RANGE, literal_value
+from wps.sampling import bounds_window, read_blocks, read_window
+from wps.terrain import pixel_size_m, terrain_available, terrain_paths
+
+# Pas de l'histogramme des altitudes (m) et des pentes (degrés)
+DEFAULT_STEP_M = 50.0
+SLOPE_STEP_DEG = 5.0
+# Nombre maximal de threads de lecture par requête
+MAX_WORKERS = int(os.environ.get("ZONAL_MAX_WORKERS", str(os.cpu_count() or 1)))
+
+log = get_logger("zonal_stats")
+
+
+class RunningStats:
+    """Statistiques cumulées bloc par bloc (min, max, moyenne, écart-type, histogramme), fusionnables"""
+
+    def __init__(self, origin, step, bins):
+        self.origin = origin
+        self.step = step
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.area_m2 = 0.0
+        self.hist = np.zeros(bins, dtype="int64")
+
+    def _combine(self, count, mean, m2, vmin, vmax):
+        # Fusion de deux moments (Chan et al.) : stable même sur des milliards de pixels
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+
+    def update(self, values, area_m2=0.0):
+        if values.size == 0:
+            return
+        mean = float(values.mean())
+        self._combine(values.size, mean, float(np.square(values - mean).sum()),
+                      float(values.min()), float(values.max()))
+        idx = np.clip(((values - self.origin) / self.step).astype("int64"), 0, len(self.hist) - 1)
+        self.hist += np.bincount(idx, minlength=len(self.hist))
+        self.area_m2 += area_m2
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+            self.hist += other.hist
+            self.area_m2 += other.area_m2
+
+    def histogram(self):
+        """Classes occupées : bornes inférieures et effectifs"""
+        occupied = np.nonzero(self.hist)[0]
+        if occupied.size == 0:
+            return [], []
+        lo, hi = occupied[0], occupied[-1] + 1
+        edges = self.origin + np.arange(lo, hi + 1) * self.step
+        return edges.tolist(), self.hist[lo:hi].tolist()
+
+    def summary(self):
+        if not self.count:
+            return None
+        edges, counts = self.histogram()
+        return {
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "std": math.sqrt(self.m2 / self.count),
+            "histogram": {"edges": edges, "counts": counts},
+        }
+
+
+def hypsometry(stats):
+    """Courbe hypsométrique (part de la surface au-dessus de chaque altitude) et intégrale"""
+    edges, counts = stats.histogram()
+    counts = np.asarray(counts, dtype="float64")
+    above = 1.0 - np.concatenate(([0.0], np.cumsum(counts))) / counts.sum()
+    relief = stats.max - stats.min
+    return {
+        "integral": (stats.mean - stats.min) / relief if relief > 0 else 0.0,
+        "curve": [{"elevation": e, "area_pct": round(float(a) * 100, 2)} for e, a in zip(edges, above)],
+    }
+
+
+def zone_blocks(src, geom):
+    """Fenêtres des blocs natifs du raster intersectant l'emprise de la géométrie"""
+    window = bounds_window(src, geom.bounds, pad=0)
+    if window is None:
+        return []
+    # Bandes de quelques lignes (GeoTIFF non tuilé) : regroupées pour limiter le nombre de lectures
+    bh, bw = read_blocks(src)
+
+    blocks = []
+    for row in range(window.row_off // bh * bh, window.row_off + window.height, bh):
+        for col in range(window.col_off // bw * bw, window.col_off + window.width, bw):
+            blocks.append(Window(col, row, min(bw, src.width - col), min(bh, src.height - row)))
+    return blocks
+
+
+def _accumulate(geom, blocks, step, slope_path):
+    """Traite une partie des blocs (un thread) ; un seul bloc en mémoire à la fois"""
+    elevation = RunningStats(ELEVATION_RANGE[0], step, int(math.ceil((ELEVATION_RANGE[1] - ELEVATION_RANGE[0]) / step)))
+    slope = RunningStats(0.0, SLOPE_STEP_DEG, int(math.ceil(90.0 / SLOPE_STEP_DEG)))
+    reads = 0
+
+    with get_dem_manager().dataset() as src:
+        slope_manager = get_dem_manager(slope_path) if slope_path else None
+        for window in blocks:
+            transform = src.window_transform(window)
+            left, top = transform.c, transform.f
+            cell = box(left, top + window.height * transform.e, left + window.width * transform.a, top)
+            if not geom.intersects(cell):
+                continue
+
+            arr, _ = read_window(src, window)
+            reads += 1
+            if geom.contains(cell):
+                inside = np.ones(arr.shape, dtype=bool)
+            else:
+                inside = geometry_mask([clip_by_rect(geom, *cell.bounds)], out_shape=arr.shape, transform=transform,
+                                       invert=True)
+            valid = inside & np.isfinite(arr) & (arr > ELEVATION_RANGE[0]) & (arr < ELEVATION_RANGE[1])
+
+            rows = np.arange(window.row_off, window.row_off + window.height)
+            dx, dy = pixel_size_m(src.transform, src.crs, rows)
+            area = float((valid.sum(axis=1) * dx * dy).sum())
+            elevation.update(arr[valid], area)
+
+            if slope_manager is not None:
+                with slope_manager.dataset() as ssrc:
+                    values, _ = read_window(ssrc, window)
+                ok = valid & np.isfinite(values)
+                slope.update(values[ok])
+
+    return elevation, slope, reads
+
+
+def zonal_statistics(geom, step=DEFAULT_STEP_M, slope=True, workers=1):
+    """Statistiques d'altitude (et de pente) sous un polygone, en flux bloc par bloc
+
+    La mémoire reste bornée à quelques blocs par thread quelle que soit la taille du polygone.
+    """
+    # Index de couverture : zone hors du MNT rejetée sans parcourir les blocs
+    covered = get_coverage_index().fraction(geom)
+    if covered == 0:
+        raise Exception("La zone est en dehors de la zone couverte par le MNT")
+
+    slope_path = None
+    if slope and terrain_available(get_dem_manager().path):
+        slope_path = terrain_paths(get_dem_manager().path)[0]
+
+    with get_dem_manager().dataset() as src:
+        blocks = zone_blocks(src, geom)
+    prepare(geom)
+
+    workers = max(1, min(int(workers), MAX_WORKERS, len(blocks) or 1))
+    # Lecture et cumul entremêlés bloc par bloc : une seule étape "sample"
+    with stage("sample"):
+        if workers == 1:
+            parts = [_accumulate(geom, blocks, step, slope_path)]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                parts = list(executor.map(lambda i: _accumulate(geom, blocks[i::workers], step, slope_path),
+                                          range(workers)))
+
+    with stage("stats"):
+        elevation, slope_stats, reads = parts[0]
+        for e, s, r in parts[1:]:
+            elevation.merge(e)
+            slope_stats.merge(s)
+            reads += r
+
+        if not elevation.count:
+            raise Exception("Aucun pixel valide dans la zone : elle est probablement en dehors du MNT")
+
+        result = {
+            "pixels": elevation.count,
+            "area_km2": round(elevation.area_m2 / 1e6, 3),
+            "elevation": elevation.summary(),
+            "hypsometry": hypsometry(elevation),
+            "blocks_read": reads,
+            "coverage_pct": round(covered * 100, 1),
+        }
+        if slope_path:
+            result["slope"] = slope_stats.summary()
+    return result
+
+
+class ZonalStats(PooledProcess):
+    def __init__(self):
+        inputs = [
+            ComplexInput('zone', 'Polygone(s) : Polygon, MultiPolygon, Feature ou FeatureCollection',
+                         supported_formats=[Format('application/vnd.geo+json')]),
+            LiteralInput('step_m', "Pas de l'histogramme des altitudes (m)", data_type='float',
+                         default=DEFAULT_STEP_M, min_occurs=0),
+            LiteralInput('slope', 'Statistiques de pente (rasters dérivés pré-calculés)', data_type='boolean',
+                         default=True, min_occurs=0),
+            LiteralInput('workers', 'Nombre de threads de lecture des blocs', data_type='integer',
+                         default=1, min_occurs=0)
+        ]
+        outputs = [ComplexOutput('stats', 'Statistiques zonales', supported_formats=[Format('application/json')])]
+
+        super(ZonalStats, self).__init__(
+            self._handler,
+            identifier='zonal_stats',
+            title='Statistiques zonales',
+            version='1.0',
+            inputs=inputs,
+            outputs=outputs
+        )
+
+    def _handler(self, request, response):
+        with timed(self.identifier) as timer:
+            return self._execute(request, response, timer)
+
+    def _execute(self, request, response, timer):
+        try:
+            with stage("parse"):
+                geom_json = json.loads(request.inputs['zone'][0].data)
+                zones = parse_features(geom_json)
+            for fid, geom in zones:
+                if geom.geom_type not in ("Polygon", "MultiPolygon"):
+                    raise Exception(f"Géométrie {fid} : Polygon ou MultiPolygon attendu, {geom.geom_type} reçu")
+
+            step = max(1.0, float(literal_value(request, 'step_m', DEFAULT_STEP_M)))
+            slope = literal_value(request, 'slope', True)
+            workers = max(1, int(literal_value(request, 'workers', 1)))
+
+            cache = get_result_cache()
+            collection = {"type": "GeometryCollection", "geometries": [mapping(g) for _, g in zones]}
+            cache_key = cache.key(self.identifier, collection,
+                                  {"ids": [fid for fid, _ in zones], "step_m": step, "slope": slope})
+            cached = cache.get(cache_key)
+            if cached is not None:
+                timer.outcome = "cached"
+                response.outputs['stats'].data = cached
+                return response
+
+            results = {}
+            for fid, geom in zones:
+                try:
+                    results[fid] = zonal_statistics(geom, step, slope, workers)
+                except Exception as e:
+                    results[fid] = {"error": str(e)}
+
+            log.debug("statistiques zonales calculées",
+                      extra={"fields": {"zones": len(zones), "step_m": step, "workers": workers}})
+
+            with stage("serialize"):
+                data = json.dumps({"zones": results})
+            cache.put(cache_key, data)
+            response.outputs['stats'].data = data
+            return response
+
+        except Exception as e:
+            timer.outcome = "error"
+            log.warning("échec des statistiques zonales : %s", e, exc_info=log.isEnabledFor(logging.DEBUG))
+
+            response.outputs['stats'].data = json.dumps({"error": str(e), "zones": {}})
+            return response